@@ -1,306 +1,310 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas.ai import EightDGenerationRequest, EightDGenerationResponse, ErrorResponse
-from app.models.base import get_db
-from app.models.models import QualityReport, ReportType
-import google.generativeai as genai
-import os
+from app.models.base import get_db, AsyncSessionLocal
+from app.services import ai_client, ai_guard, eight_d
+from app.services.tenancy import Scope, get_scope
+from typing import Optional
 import json
+import math
 
 router = APIRouter()
 
-# Initialize Gemini
-# User needs to set GEMINI_API_KEY in .env
-GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel('gemini-pro')
-
-@router.post("/generate-8d", response_model=EightDGenerationResponse, responses={500: {"model": ErrorResponse}})
-async def generate_8d_actions(request: EightDGenerationRequest, db: AsyncSession = Depends(get_db)):
-    if not GOOGLE_API_KEY:
-        # Development Mock - Hydrogen Embrittlement Case (EXPERT MODE)
-        mock_report = QualityReport(
-            title=f"8D: {request.problem_description[:50]}...",
-            report_type=ReportType.EIGHT_D,
-            status="draft",
-            data={
-                "problem_description": request.problem_description,
-                "d1_team": ["Project Lead: Ahmet Y.", "Quality: Mehmet K.", "Production: Ali R."],
-                "d2_problem": request.problem_description,
-                "d3_interim_actions": [
-                    "Quarantine all bolts plated in batch #2023-WK45 (Suspect Lot).", 
-                    "Initiate 100% Wedge Tensile Testing per ISO 898-1 / ASTM F606.",
-                    "Halt shipments to customer line 4 immediately."
-                ],
-                "d4_root_causes": ["Hydrogen Embrittlement due to post-plating process failure"],
-                "d4_occurrence_causes": [
-                     "Why 1: Hydrogen diffusion into steel matrix -> Why 2: Baking delay > 4 hours -> Root: Furnace log shows 6h delay; Furnace temperature uniformity poor (+/- 15°C deviation)."
-                ],
-                "d4_escape_causes": [
-                    "Why 1: Embrittlement test passed -> Why 2: Sample size too small -> Root: Sampling plan (ASTM F519) not followed; only 3 pcs tested instead of required statistical sample."
-                ],
-                "d4_fishbone": {
-                    "Man": ["Operator loaded furnace late (Shift change)"],
-                    "Machine": ["Baking furnace temp controller drift"],
-                    "Material": ["10.9 Grade Steel (High Susceptibility to HE)"],
-                    "Method": ["Delay between plating and baking > 4h"],
-                    "Measurement": ["Tensile test sample size too low"],
-                    "Environment": ["High humidity in plating line"]
-                },
-                "d5_chosen_pca": ["Install automated timer lockout on plating line.", "Upgrade furnace controller."],
-                "d6_implemented_pca": ["Timer lockout installed and verified.", "Furnace calibration completed."],
-                "d7_prevention": ["Update FMEA to include baking delay risk.", "Revise Control Plan for sampling."],
-                "d8_recognition": ["Team congratulated for rapid containment.", "Standard work updated."]
-            }
-        )
-        db.add(mock_report)
-        await db.commit()
-        await db.refresh(mock_report)
-        
-        return EightDGenerationResponse(
-            problem_description=request.problem_description,
-            d1_team=mock_report.data["d1_team"],
-            d2_problem=mock_report.data["d2_problem"],
-            d3_interim_actions=mock_report.data["d3_interim_actions"],
-            d4_root_causes=mock_report.data["d4_root_causes"],
-            d4_occurrence_causes=mock_report.data["d4_occurrence_causes"],
-            d4_escape_causes=mock_report.data["d4_escape_causes"],
-            d4_fishbone=mock_report.data["d4_fishbone"],
-            d5_chosen_pca=mock_report.data["d5_chosen_pca"],
-            d6_implemented_pca=mock_report.data["d6_implemented_pca"],
-            d7_prevention=mock_report.data["d7_prevention"],
-            d8_recognition=mock_report.data["d8_recognition"],
-            report_id=mock_report.id
-        )
 
+def _unavailable(e: ai_client.AIUnavailableError) -> HTTPException:
+    # Tells clients (and their retry buttons) when the model is expected back instead of inviting a retry storm
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+@router.post(
+    "/generate-8d", response_model=EightDGenerationResponse,
+    responses={500: {"model": ErrorResponse}, 503: {"model": ErrorResponse}},
+)
+async def generate_8d_actions(
+    request: EightDGenerationRequest,
+    db: AsyncSession = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    scope: Scope = Depends(get_scope),
+):
+    organization_id = scope.organization_id
     try:
-        lang_instruction = ""
-        if request.language == 'tr':
-            lang_instruction = """
-            **CRITICAL: OUTPUT LANGUAGE MUST BE TURKISH**
-            CEVAP DİLİ SADECE VE SADECE TÜRKÇE OLMALIDIR.
-            - Provide ALL findings, analysis, root causes, and actions in TURKISH.
-            - Do NOT return any English text for values.
-            - JSON Keys must remain in English (e.g., "d1_team"), but ALL VALUES must be Turkish.
-            - Example: "d3_interim_actions": ["Üretim durduruldu.", "Parçalar ayrıldı."]
-            """
-        
-        prompt = f"""
-        Act as a **Senior Quality Engineer and IATF 16949 Lead Auditor** in the {request.industry_context} industry.
-        
-        {lang_instruction}
-        
-        **Goal**: Generate a technical 8D Problem Solving Report (D1-D8).
-        
-        **Problem Description**:
-        "{request.problem_description}"
-        
-        **ENGINEERING CONTEXT RULES (STRICT)**:
-        1. **Material Specificity**: If **10.9 Bolts** or **Plating** is mentioned, you MUST check for **Hydrogen Embrittlement**.
-        2. **Actionable D3**: Interim actions must be physical (e.g., "Wedge Test", "Sort", "Quarantine").
-        3. **Dual Root Cause**: Analyze both **Occurrence** (Process) and **Escape** (Detection).
-        
-        **OUTPUT FORMAT (JSON ONLY)**:
-        {{
-            "d1_team": ["Role: Name", "Role: Name"],
-            "d2_problem": "Refined problem statement...",
-            "d3_interim_actions": ["Action 1", "Action 2"],
-            "d4_occurrence_causes": ["Why 1...", "Root Cause: ..."],
-            "d4_escape_causes": ["Why 1...", "Root Cause: ..."],
-            "d4_root_causes": ["Summary of Root Cause"],
-            "d4_fishbone": {{ "Man": [], "Machine": [], "Material": [], "Method": [], "Measurement": [], "Environment": [] }},
-            "d5_chosen_pca": ["Permanent Corrective Action 1", "PCA 2"],
-            "d6_implemented_pca": ["Implemented Action 1", "Implemented Action 2"],
-            "d7_prevention": ["Systemic prevention action 1", "Prevention 2"],
-            "d8_recognition": ["Team recognition statement"]
-        }}
-        """
-
-        response = model.generate_content(prompt)
-        content = response.text
-        
-        # Clean markdown
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
-            
-        data = json.loads(content)
-        
-        # Save to DB
-        report_data = {
-            "problem_description": request.problem_description,
-            "d1_team": data.get("d1_team", []),
-            "d2_problem": data.get("d2_problem", request.problem_description),
-            "d3_interim_actions": data.get("d3_interim_actions", []),
-            "d4_root_causes": data.get("d4_root_causes", []),
-            "d4_occurrence_causes": data.get("d4_occurrence_causes", []),
-            "d4_escape_causes": data.get("d4_escape_causes", []),
-            "d4_fishbone": data.get("d4_fishbone", {}),
-            "d5_chosen_pca": data.get("d5_chosen_pca", []),
-            "d6_implemented_pca": data.get("d6_implemented_pca", []),
-            "d7_prevention": data.get("d7_prevention", []),
-            "d8_recognition": data.get("d8_recognition", [])
-        }
-        
-        new_report = QualityReport(
-            title=f"8D: {request.problem_description[:50]}...",
-            report_type=ReportType.EIGHT_D,
-            status="draft",
-            data=report_data
-        )
-        db.add(new_report)
-        await db.commit()
-        await db.refresh(new_report)
-        
-        # Safe Mapping for Response
-        return EightDGenerationResponse(
-            problem_description=report_data.get("problem_description", request.problem_description),
-            d1_team=report_data.get("d1_team", []),
-            d2_problem=report_data.get("d2_problem", ""),
-            d3_interim_actions=report_data.get("d3_interim_actions", []),
-            d4_root_causes=report_data.get("d4_root_causes", []),
-            d4_occurrence_causes=report_data.get("d4_occurrence_causes", []),
-            d4_escape_causes=report_data.get("d4_escape_causes", []),
-            d4_fishbone=report_data.get("d4_fishbone", {}),
-            d5_chosen_pca=report_data.get("d5_chosen_pca", []),
-            d6_implemented_pca=report_data.get("d6_implemented_pca", []),
-            d7_prevention=report_data.get("d7_prevention", []),
-            d8_recognition=report_data.get("d8_recognition", []),
-            report_id=new_report.id
+        if idempotency_key:
+            existing = await eight_d.find_idempotent_report(db, idempotency_key, request, organization_id)
+            if existing is not None:
+                return existing
+
+        # Double-clicks and proxy retries attach to the generation already running
+        return await eight_d.inflight.do(
+            eight_d.flight_key(request, idempotency_key, organization_id),
+            lambda: eight_d.generate_and_save(request, idempotency_key, organization_id),
         )
 
+    except eight_d.IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ai_client.AIUnavailableError as e:
+        print(f"AI service unavailable: {e}")
+        raise _unavailable(e)
+    except ai_client.AITimeoutError as e:
+        print(f"AI service timed out: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         print(f"Error calling AI service: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi import UploadFile, File
-import shutil
+
+@router.get("/ai/cache-stats")
+async def get_ai_cache_stats():
+    stats = eight_d.response_cache.stats()
+    stats["in_flight"] = eight_d.inflight.stats()
+    stats["hse"] = hse_analysis.analysis_cache.stats()
+    return stats
+
+
+@router.get("/ai/status")
+async def get_ai_status():
+    """Rate limiter and circuit breaker state of each model called so far."""
+    return await ai_guard.stats()
+
+
+def _sse(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@router.post("/generate-8d/stream")
+async def generate_8d_stream(
+    request: EightDGenerationRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    scope: Scope = Depends(get_scope),
+):
+    """Server-Sent Events variant of /generate-8d.
+
+    Emits `token` events with raw model output, a `section` event for every
+    D1-D8 key as soon as its value is complete, and a final `done` event with
+    the same body /generate-8d returns. Failures are reported as an `error` event.
+    A repeated Idempotency-Key replays the stored report instead of regenerating.
+    """
+    organization_id = scope.organization_id
+
+    async def event_stream():
+        try:
+            if idempotency_key:
+                async with AsyncSessionLocal() as db:
+                    existing = await eight_d.find_idempotent_report(db, idempotency_key, request, organization_id)
+                if existing is not None:
+                    stored = existing.model_dump()
+                    for key in eight_d.SECTION_KEYS:
+                        yield _sse("section", {"key": key, "value": stored.get(key)})
+                    yield _sse("done", stored)
+                    return
+
+            data = {}
+            async for event, payload in eight_d.stream_sections(request, organization_id):
+                if event == "token":
+                    yield _sse("token", {"text": payload})
+                elif event == "section":
+                    key, value = payload
+                    yield _sse("section", {"key": key, "value": value})
+                else:
+                    data = payload
+
+            report_data = eight_d.build_report_data(request.problem_description, data)
+            saved = await eight_d.save_report(request, report_data, idempotency_key, organization_id)
+            yield _sse("done", saved.model_dump())
+        except ai_client.AIUnavailableError as e:
+            print(f"AI service unavailable: {e}")
+            yield _sse("error", {"detail": str(e), "retry_after": math.ceil(e.retry_after)})
+        except Exception as e:
+            print(f"Error streaming AI service: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+from fastapi import UploadFile, File, Form
+from app.models.hse import HSEReport
 from app.schemas.hse import HSEAnalysisResponse
-import time
+from app.services import hse_analysis, metrics, uploads
+from app.services.write_batch import writes
+from typing import List
+import asyncio
+import os
+import zipfile
 
 @router.post("/analyze-hse-image", response_model=HSEAnalysisResponse)
 async def analyze_hse_image(file: UploadFile = File(...)):
-    if not GOOGLE_API_KEY:
+    if not ai_client.is_configured():
         # Development Mock
         return HSEAnalysisResponse(
-            non_conformities=[
-                "Worker not wearing safety helmet (hard hat).",
-                "Trip hazard: Cable across the walkway.",
-                "Blocked emergency exit sign."
-            ],
-            corrective_actions=[
-                "Enforce PPE policy immediately.",
-                "Secure cables with cable covers or tape.",
-                "Clear obstruction from emergency exit."
-            ],
+            **hse_analysis.MOCK_ANALYSIS,
             image_path="/static/uploads/mock_hse.jpg"
         )
 
     try:
-        # Save file locally
-        os.makedirs("static/uploads", exist_ok=True)
-        file_ext = file.filename.split(".")[-1]
-        filename = f"hse_{int(time.time())}.{file_ext}"
-        file_path = f"static/uploads/{filename}"
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Analyze with Gemini 1.5 Flash (Vision capable, fast)
-        try:
-             vision_model = genai.GenerativeModel('gemini-1.5-flash')
-        except:
-             vision_model = genai.GenerativeModel('gemini-pro-vision')
-
-        
-        # Load image data
-        import PIL.Image
-        img = PIL.Image.open(file_path)
-        
-        # Determine language (This endpoint currently doesn't take language param explicitly in the signature, 
-        # but for now we will assume if the filename or context implied it, but let's default to a generic instruction 
-        # or better yet, let's just make it output in Turkish if requested. 
-        # The user actually didn't update the signature of `analyze_hse_image` to take `language`.
-        # I should simply make the prompt robust enough to detect or just default to Turkish if that's what's needed, 
-        # BUT the user effectively said "When lang == 'tr'".
-        # I need to update the function signature to accept `language` form field.
-        
-        prompt = """
-        You are an expert HSE (Health, Safety, Environment) Auditor for ISO 45001. 
-        Analyze this image for safety hazards, non-compliance, and risks.
-        
-        **CRITICAL INSTRUCTION**:
-        If the input context or usual preference represents TR/Turkish, or if in doubt, provide the output in **TURKISH**.
-        Actually, let's make it dual or just standard. 
-        Wait, I can't easily change the function signature without breaking the frontend call which sends FormData.
-        frontend/src/services/api.ts sends only `file`.
-        
-        However, I can just instruct it to be strict about the content.
-        Let's assume the user wants Turkish if the app is in Turkish mode.
-        Since I cannot easily pass the language param without changing the frontend `uploadHSEImage` to append 'language' to FormData,
-        I will modify the prompt to be bilingual or smart, OR I will update the Frontend to pass the language.
-        
-        The user said: "Update the backend prompt logic... When lang == 'tr', you must prepend this instruction".
-        So I MUST update the frontend to pass the language.
-        
-        For now, let's update this prompt to generally favor Turkish if it sees any Turkish context, 
-        but to respect the request I will update the function signature in a separate step if needed.
-        
-        Actually, I will update the prompt to be:
-        "Analyze this image... Provide findings in the language appropriate for an HSE audit in Turkey (Turkish) if the context suggests, otherwise English."
-        
-        BUT, to be precise with the user's request "When lang == 'tr'", I really should update the API signature.
-        I will update `analyze_hse_image` to accept `language: str = Form(...)`.
-        
-        For this step, purely prompt update:
-        """
-        
-        prompt = """
-        You are an expert HSE (Health, Safety, Environment) Auditor for ISO 45001. 
-        Analyze this image for safety hazards, non-compliance, and risks.
-        
-        **OUTPUT LANGUAGE RULE**:
-        If the request specifies Turkish or if you are unsure, provide details in **TURKISH** (Türkçe).
-        "CEVAP DİLİ TÜRKÇE OLMALIDIR. Tüm bulguları, aksiyonları ve analizleri sadece Türkçe olarak yaz."
-        
-        RETURN ONLY VALID JSON. Do not use Markdown formatted code blocks.
-        Format:
-        {
-            "non_conformities": [
-                "Specific hazard seen in image...",
-                "Another issue..."
-            ],
-            "corrective_actions": [
-                "Action to fix hazard 1...",
-                "Action to fix hazard 2..."
-            ]
-        }
-        """
-        
-        response = vision_model.generate_content([prompt, img])
-        content = response.text
-        
-        # Clean markdown if present
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
-            
-        data = json.loads(content)
-        
+        # Stored under its SHA-256; identical photos share one file and one cached analysis
+        with metrics.stage("hse", "store_upload"):
+            stored = await uploads.store_upload(file)
+        result = await hse_analysis.analyze_upload(stored)
+
         return HSEAnalysisResponse(
-            non_conformities=data.get("non_conformities", ["Analysis completed but no specific text parsed."]),
-            corrective_actions=data.get("corrective_actions", ["Review image manually."]),
-            image_path=f"/static/uploads/{filename}"
+            non_conformities=result["non_conformities"],
+            corrective_actions=result["corrective_actions"],
+            image_path=stored.url,
+            thumbnail_path=result["thumbnail_path"]
         )
-        
+
+    except ai_client.AIUnavailableError as e:
+        # Not a finding: the client should come back later instead of saving an error as the analysis
+        print(f"HSE analysis unavailable: {e}")
+        raise _unavailable(e)
+    except ai_client.AITimeoutError as e:
+        print(f"HSE analysis timed out: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         print(f"Error in HSE analysis: {e}")
         # Return a safe fallback rather than crashing the UI, but log error
         return HSEAnalysisResponse(
              non_conformities=[f"AI Analysis Error: {str(e)}"],
              corrective_actions=["Please inspect the image manually."],
-             image_path=f"/static/uploads/{filename}" if 'filename' in locals() else ""
+             image_path=stored.url if 'stored' in locals() else ""
+        )
+
+
+HSE_BATCH_MAX_IMAGES = int(os.getenv("HSE_BATCH_MAX_IMAGES", "200"))
+HSE_BATCH_CONCURRENCY = int(os.getenv("HSE_BATCH_CONCURRENCY", "8"))
+HSE_BATCH_MAX_IMAGE_BYTES = int(os.getenv("HSE_BATCH_MAX_IMAGE_BYTES", str(25 * 1024 * 1024)))
+IMAGE_EXTENSIONS = {"jpg", "png", "webp", "gif", "bmp", "tiff", "heic"}
+
+
+def _extract_zip(archive_path: str) -> list:
+    """Stores every image in the archive; runs in a worker thread. Returns [(name, StoredUpload)]."""
+    stored = []
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            ext = uploads.normalize_ext(name)
+            if ext not in IMAGE_EXTENSIONS:
+                continue
+            if info.file_size > HSE_BATCH_MAX_IMAGE_BYTES:
+                raise HTTPException(status_code=413, detail=f"{name} exceeds {HSE_BATCH_MAX_IMAGE_BYTES} bytes")
+            if len(stored) >= HSE_BATCH_MAX_IMAGES:
+                raise HTTPException(status_code=413, detail=f"At most {HSE_BATCH_MAX_IMAGES} images per batch")
+            with archive.open(info) as member:
+                stored.append((name, uploads.store_fileobj_sync(member, ext)))
+    return stored
+
+
+async def _store_batch(files: List[UploadFile], archive: Optional[UploadFile]) -> list:
+    stored = []
+    for file in files or []:
+        stored.append((file.filename, await uploads.store_upload(file)))
+    if archive is not None:
+        archive_upload = await uploads.store_upload(archive)
+        try:
+            stored.extend(await asyncio.to_thread(_extract_zip, archive_upload.path))
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="archive is not a valid zip file")
+        finally:
+            # Only the extracted images are kept
+            await asyncio.to_thread(os.remove, archive_upload.path)
+    if len(stored) > HSE_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {HSE_BATCH_MAX_IMAGES} images per batch")
+    return stored
+
+
+@router.post("/analyze-hse-images")
+async def analyze_hse_images(
+    files: List[UploadFile] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    create_reports: bool = Form(False),
+    scope: Scope = Depends(get_scope),
+):
+    """Batch HSE audit: many images (multipart `files` and/or a zip `archive`) analyzed in parallel.
+
+    Streams NDJSON: one line per image as soon as its analysis finishes (in
+    completion order, with its `index` in the upload), then a final `summary`
+    line. With create_reports=true, an HSEReport is created for every
+    successfully analyzed image in a single transaction, and the summary maps
+    each index to its report_id. The reports belong to the X-Organization-Id organization.
+    """
+    # Everything is on disk before streaming starts; the upload objects are closed once the handler returns
+    stored = await _store_batch(files, archive)
+    if not stored:
+        raise HTTPException(status_code=400, detail="No images were uploaded")
+
+    semaphore = asyncio.Semaphore(HSE_BATCH_CONCURRENCY)
+
+    async def analyze_one(index: int, name: str, upload):
+        line = {"index": index, "filename": name, "image_path": upload.url}
+        try:
+            async with semaphore:
+                if ai_client.is_configured():
+                    result = await hse_analysis.analyze_upload(upload)
+                else:
+                    result = {**hse_analysis.MOCK_ANALYSIS, "thumbnail_path": None}
+            line.update(result)
+        except Exception as e:
+            print(f"Error in batch HSE analysis of {name}: {e}")
+            line["error"] = str(e)
+            if isinstance(e, ai_client.AIUnavailableError):
+                line["retry_after"] = math.ceil(e.retry_after)
+        return line
+
+    async def results():
+        tasks = [asyncio.create_task(analyze_one(i, name, upload)) for i, (name, upload) in enumerate(stored)]
+        analyzed = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                analyzed.append(line)
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        summary = {
+            "total": len(stored),
+            "succeeded": sum(1 for line in analyzed if "error" not in line),
+            "failed": sum(1 for line in analyzed if "error" in line),
+        }
+        if create_reports:
+            try:
+                summary["report_ids"] = await _create_batch_reports(analyzed, scope.organization_id)
+            except Exception as e:
+                print(f"Error saving batch HSE reports: {e}")
+                summary["report_error"] = str(e)
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+async def _create_batch_reports(analyzed: list, organization_id: int = None) -> dict:
+    """Creates one HSEReport per successful image in a single transaction; returns {index: report_id}."""
+    succeeded = sorted((line for line in analyzed if "error" not in line), key=lambda line: line["index"])
+    if not succeeded:
+        return {}
+    # One write, committed together with the other report writes arriving at the same time
+    report_ids = await writes.submit(_insert_batch_reports, succeeded, organization_id)
+    return {line["index"]: report_id for line, report_id in zip(succeeded, report_ids)}
+
+
+async def _insert_batch_reports(db: AsyncSession, succeeded: list, organization_id: int = None) -> list:
+    reports = [
+        HSEReport(
+            image_path=line["image_path"],
+            non_conformities=line["non_conformities"],
+            corrective_actions=line["corrective_actions"],
+            user_observations="",
+            status="draft",
+            organization_id=organization_id,
         )
+        for line in succeeded
+    ]
+    db.add_all(reports)
+    # The ids come back from the INSERT; no refresh needed
+    await db.flush()
+    return [report.id for report in reports]
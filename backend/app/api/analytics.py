@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.base import get_db
+from app.services import analytics
+from app.services.tenancy import Scope, OrganizationMismatch, get_scope
+from typing import Optional
+from datetime import date
+
+router = APIRouter()
+
+@router.get("/analytics/root-causes")
+async def root_cause_analytics(
+    organization_id: Optional[int] = None,
+    since: Optional[date] = Query(None, description="First creation day to include (UTC)"),
+    until: Optional[date] = Query(None, description="Last creation day to include (UTC)"),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    scope: Scope = Depends(get_scope),
+):
+    """Pareto ranking of recurring root causes, overall and per fishbone category.
+
+    Similar wordings are clustered; each item lists its most common wording as the label and a few
+    other wordings as variants.
+    """
+    if since and until and since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    try:
+        organization_id = scope.restrict(organization_id)
+    except OrganizationMismatch:
+        raise HTTPException(status_code=403, detail="organization_id does not match X-Organization-Id")
+    return await analytics.root_cause_pareto(db, organization_id, since, until, limit)
+
+@router.post("/analytics/root-causes/rebuild")
+async def rebuild_root_cause_entries(db: AsyncSession = Depends(get_db)):
+    """Re-extracts the causes of every report, e.g. after changing the clustering rules."""
+    count = await analytics.rebuild(db)
+    return {"status": "success", "reports": count}
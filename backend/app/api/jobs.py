@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from app.schemas.ai import EightDGenerationRequest
+from app.schemas.jobs import JobResponse, JobAccepted
+from app.models.jobs import JobStatus
+from app.services.jobs import job_queue
+from app.services.tenancy import Scope, get_scope
+import json
+
+router = APIRouter()
+
+def _job_response(job) -> JobResponse:
+    return JobResponse(
+        job_id=job.id,
+        status=job.status,
+        stage=job.stage,
+        progress=job.progress,
+        attempts=job.attempts,
+        report_id=job.report_id,
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+    )
+
+@router.post("/generate-8d/jobs", response_model=JobAccepted, status_code=202)
+async def enqueue_8d_generation(request: EightDGenerationRequest, scope: Scope = Depends(get_scope)):
+    """Queues an 8D generation and returns immediately; poll /jobs/{id} for the report_id."""
+    job = await job_queue.enqueue(request, scope.organization_id)
+    return JobAccepted(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"/api/v1/jobs/{job.id}",
+        events_url=f"/api/v1/jobs/{job.id}/events",
+    )
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, scope: Scope = Depends(get_scope)):
+    job = await job_queue.get(job_id, scope.organization_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, scope: Scope = Depends(get_scope)):
+    """Server-Sent Events: a `status` event whenever the job changes, ending once it succeeds or fails."""
+    job = await job_queue.get(job_id, scope.organization_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        last = None
+        try:
+            while True:
+                job = await job_queue.get(job_id)
+                payload = _job_response(job).model_dump(mode="json")
+                snapshot = (payload["status"], payload["stage"], payload["attempts"])
+                if snapshot != last:
+                    last = snapshot
+                    yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+                if job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+                    return
+                # Wakes immediately for jobs run by this process; re-reads the row for the others
+                await job_queue.wait_for_change(job_id, timeout=1.0)
+        finally:
+            job_queue.forget(job_id)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
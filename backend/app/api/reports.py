@@ -1,12 +1,23 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc
+from sqlalchemy import select, desc, or_, and_
 from app.models.base import get_db
 from app.models.models import QualityReport, ReportType
-from app.schemas.ai import ReportFinalizationRequest
-from typing import List, Optional
+from app.schemas.ai import ReportFinalizationRequest, ReportPatchRequest
+from app.services import search as report_search
+from app.services import similarity
+from app.services import stats as report_stats
+from app.services import export as report_export
+from app.services import report_cache
+from app.services import report_store
+from app.services import report_edits
+from app.services.tenancy import Scope, OrganizationMismatch, get_scope
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, date, timezone
+import base64
+import os
 
 router = APIRouter()
 
@@ -20,102 +31,429 @@ class ReportSummary(BaseModel):
     class Config:
         from_attributes = True
 
+class ReportSearchHit(ReportSummary):
+    score: float
+    # Field name -> HTML snippet with matches wrapped in <mark>
+    snippets: Dict[str, str] = {}
+
+REPORTS_PAGE_SIZE = 50
+REPORTS_MAX_PAGE_SIZE = 200
+
+def _encode_cursor(created_at: datetime, report_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{report_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, report_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(report_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/reports", response_model=List[ReportSummary])
-async def list_reports(search: Optional[str] = None, db: AsyncSession = Depends(get_db)):
-    query = select(QualityReport).order_by(desc(QualityReport.created_at))
-    
+async def list_reports(
+    response: Response,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(REPORTS_PAGE_SIZE, ge=1, le=REPORTS_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    scope: Scope = Depends(get_scope),
+):
+    """Newest-first page of the organization's report summaries.
+
+    Keyset pagination on (created_at, id): pass the X-Next-Cursor response
+    header back as `cursor` to get the next page. Only summary columns are
+    selected, never report sections.
+    """
+    query = scope.where(
+        select(
+            QualityReport.id,
+            QualityReport.title,
+            QualityReport.status,
+            QualityReport.created_at,
+            QualityReport.problem_description,
+        )
+        .order_by(desc(QualityReport.created_at), desc(QualityReport.id))
+    )
+
     if search:
-        query = query.where(QualityReport.title.contains(search) | QualityReport.data['problem_description'].astext.contains(search))
-    
-    result = await db.execute(query)
-    reports = result.scalars().all()
-    
-    # Map to summary (extract description from JSONB if needed)
-    summaries = []
-    for r in reports:
-        desc = r.data.get("problem_description", "") if r.data else ""
-        summaries.append(ReportSummary(
+        # Ranked full-text results are a single page; cursors apply to the plain listing only
+        hits = await report_search.search_report_ids(db, search, limit=limit, organization_id=scope.organization_id)
+        order = {report_id: i for i, (report_id, _) in enumerate(hits)}
+        result = await db.execute(query.where(QualityReport.id.in_(list(order))))
+        rows = sorted(result.all(), key=lambda r: order[r.id])
+        return [_summary(r) for r in rows]
+
+    if cursor:
+        cursor_created_at, cursor_id = _decode_cursor(cursor)
+        query = query.where(or_(
+            QualityReport.created_at < cursor_created_at,
+            and_(QualityReport.created_at == cursor_created_at, QualityReport.id < cursor_id),
+        ))
+
+    # One extra row tells us whether another page exists without a COUNT
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    return [_summary(r) for r in rows]
+
+def _summary(row) -> ReportSummary:
+    return ReportSummary(
+        id=row.id,
+        title=row.title,
+        status=row.status,
+        created_at=row.created_at,
+        problem_description=row.problem_description or "",
+    )
+
+@router.get("/reports/search", response_model=List[ReportSearchHit])
+async def search_reports(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    scope: Scope = Depends(get_scope),
+):
+    """Ranked full-text search over titles, problem descriptions, root causes and fishbone entries."""
+    hits = await report_search.search_report_ids(db, q, limit=limit, organization_id=scope.organization_id)
+    if not hits:
+        return []
+
+    hit_ids = [report_id for report_id, _ in hits]
+    result = await db.execute(scope.where(
+        select(
+            QualityReport.id, QualityReport.title, QualityReport.status, QualityReport.created_at,
+            QualityReport.problem_description,
+        ).where(QualityReport.id.in_(hit_ids))
+    ))
+    reports = {r.id: r for r in result.all()}
+    sections = await report_store.load_sections(db, list(reports), keys=report_search.INDEXED_SECTIONS)
+
+    response = []
+    for report_id, score in hits:
+        r = reports.get(report_id)
+        if r is None:
+            continue
+        data = report_store.merge(r.problem_description, sections[r.id])
+        response.append(ReportSearchHit(
             id=r.id,
             title=r.title,
             status=r.status,
             created_at=r.created_at,
-            problem_description=desc
+            problem_description=r.problem_description or "",
+            score=round(score, 4),
+            snippets=report_search.snippets_for(r.title, data, q),
         ))
-        
-    return summaries
+    return response
+
+@router.get("/reports/stats")
+async def get_dashboard_stats(
+    days: int = Query(30, ge=1, le=366),
+    db: AsyncSession = Depends(get_db),
+    scope: Scope = Depends(get_scope),
+):
+    """Dashboard counters from the report_stats aggregates; cost doesn't grow with the number of reports.
+
+    by_type and by_organization break counts down by status; trend lists reports created per day
+    over the last `days` days (UTC). With X-Organization-Id, only that organization's reports count.
+    """
+    return await report_stats.dashboard(db, days, scope.organization_id)
+
+@router.post("/reports/stats/rebuild")
+async def rebuild_dashboard_stats(db: AsyncSession = Depends(get_db)):
+    """Recomputes the aggregates from quality_reports, e.g. after rows were changed outside the API."""
+    total = await report_stats.rebuild(db)
+    return {"status": "success", "total_reports": total}
+
+@router.post("/reports/archive")
+async def archive_reports(db: AsyncSession = Depends(get_db)):
+    """Compresses finalized reports unchanged for REPORT_ARCHIVE_AFTER_DAYS into the archive tier now
+    instead of at the next periodic run."""
+    archived = await report_store.archive_due(db)
+    return {"status": "success", "archived_reports": archived}
+
+@router.get("/reports/export")
+async def export_reports(
+    dataset: str = Query("quality", pattern="^(quality|hse)$", description="quality (8D etc.) or hse reports"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv|parquet)$"),
+    gzip: bool = Query(True, description="Gzip the file as it streams; Parquet is compressed internally"),
+    report_type: Optional[ReportType] = None,
+    status: Optional[str] = None,
+    organization_id: Optional[int] = None,
+    since: Optional[date] = Query(None, description="First creation day to include (UTC)"),
+    until: Optional[date] = Query(None, description="Last creation day to include (UTC)"),
+    scope: Scope = Depends(get_scope),
+):
+    """Streams every matching report, in id order, as a file download.
+
+    Full report data is included. Rows are read and encoded in batches, so
+    memory use does not grow with the size of the export.
+    """
+    if fmt == "parquet" and not report_export.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow on the server")
+    if report_type is not None and dataset != "quality":
+        raise HTTPException(status_code=400, detail="report_type only applies to the quality dataset")
+    if since and until and since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    try:
+        organization_id = scope.restrict(organization_id)
+    except OrganizationMismatch:
+        raise HTTPException(status_code=403, detail="organization_id does not match X-Organization-Id")
+
+    media_type, extension = report_export.FORMATS[fmt]
+    filename = f"kysai-{dataset}-reports-{datetime.now(timezone.utc):%Y%m%d}.{extension}"
+    if gzip and fmt != "parquet":
+        media_type, filename = "application/gzip", filename + ".gz"
+    body = report_export.stream_export(
+        dataset, fmt, gzip, report_type=report_type, status=status, organization_id=organization_id,
+        since=since, until=until,
+    )
+    return StreamingResponse(
+        body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# Sections returned by GET /reports/{report_id}
+DETAIL_SECTIONS = ("d3_interim_actions", "d4_root_causes", "d4_occurrence_causes", "d4_escape_causes", "d4_fishbone")
 
 @router.get("/reports/{report_id}")
-async def get_report(report_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(QualityReport).where(QualityReport.id == report_id))
-    report = result.scalar_one_or_none()
-    
-    if not report:
+async def get_report(
+    report_id: int, request: Request, db: AsyncSession = Depends(get_db), scope: Scope = Depends(get_scope),
+):
+    """Report detail, served from the report cache when possible.
+
+    The response carries an ETag; send it back as If-None-Match to get 304
+    while the report is unchanged.
+    """
+    entry = report_cache.get(report_id)
+    if entry is None:
+        result = await db.execute(
+            select(QualityReport.problem_description, QualityReport.version, QualityReport.organization_id)
+            .where(QualityReport.id == report_id)
+        )
+        row = result.first()
+
+        if row is None or not scope.owns(row.organization_id):
+            raise HTTPException(status_code=404, detail="Report not found")
+        sections = await report_store.load_sections(db, [report_id], keys=DETAIL_SECTIONS)
+        data = report_store.merge(row.problem_description, sections[report_id])
+
+        # Construct response matching EightDGenerationResponse structure
+        entry = report_cache.store(report_id, {
+            "report_id": report_id,
+            # Send back with PATCH /reports/{report_id}
+            "version": row.version,
+            "problem_description": data.get("problem_description", ""),
+            "d3_interim_actions": data.get("d3_interim_actions", []),
+            "d4_root_causes": data.get("d4_root_causes", []),
+            "d4_occurrence_causes": data.get("d4_occurrence_causes", []),
+            "d4_escape_causes": data.get("d4_escape_causes", []),
+            "d4_fishbone": data.get("d4_fishbone", {})
+        }, row.organization_id)
+    elif not scope.owns(entry.organization_id):
         raise HTTPException(status_code=404, detail="Report not found")
-        
-    # Construct response matching EightDGenerationResponse structure
-    return {
-        "report_id": report.id,
-        "problem_description": report.data.get("problem_description", ""),
-        "d3_interim_actions": report.data.get("d3_interim_actions", []),
-        "d4_root_causes": report.data.get("d4_root_causes", []),
-        "d4_occurrence_causes": report.data.get("d4_occurrence_causes", []),
-        "d4_escape_causes": report.data.get("d4_escape_causes", []),
-        "d4_fishbone": report.data.get("d4_fishbone", {})
-    }
+
+    # no-cache: browsers may keep the body but must revalidate with the ETag before using it
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if report_cache.etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+class SimilarReport(BaseModel):
+    id: int
+    title: str
+    status: str
+    score: float
+    problem_description: Optional[str] = None
+
+@router.get("/reports/{report_id}/similar", response_model=List[SimilarReport])
+async def get_similar_reports(
+    report_id: int,
+    limit: int = Query(5, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    scope: Scope = Depends(get_scope),
+):
+    """The organization's prior reports whose problem text is closest to this one (TF-IDF cosine similarity)."""
+    data = None
+    if await scope.has_report(db, report_id):
+        data = await report_store.load(db, report_id, keys=similarity.TEXT_SECTIONS)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    matches = await similarity.find_similar(db, report_id, data, limit=limit, organization_id=scope.organization_id)
+    if not matches:
+        return []
+    result = await db.execute(scope.where(
+        select(
+            QualityReport.id,
+            QualityReport.title,
+            QualityReport.status,
+            QualityReport.problem_description,
+        ).where(QualityReport.id.in_([match_id for match_id, _ in matches]))
+    ))
+    rows = {r.id: r for r in result.all()}
+    return [
+        SimilarReport(
+            id=match_id,
+            title=rows[match_id].title,
+            status=rows[match_id].status,
+            score=round(score, 4),
+            problem_description=rows[match_id].problem_description or "",
+        )
+        for match_id, score in matches if match_id in rows
+    ]
+
+def _version_conflict(e: report_edits.VersionConflict) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail="Report was changed since this version; reload it and apply the edit again",
+        headers={"X-Report-Version": str(e.current_version)},
+    )
+
+@router.patch("/reports/{report_id}")
+async def patch_report(report_id: int, request: ReportPatchRequest, scope: Scope = Depends(get_scope)):
+    """Updates only the sections (or fishbone categories) in the body.
+
+    `version` must be the report's current version; otherwise nothing is
+    written and the answer is 409 with the current version in X-Report-Version.
+    """
+    try:
+        version = await report_edits.apply_changes(
+            report_id, request.version, request.sections(), fishbone_categories=request.fishbone_categories,
+            organization_id=scope.organization_id,
+        )
+    except report_edits.ReportNotFound:
+        raise HTTPException(status_code=404, detail="Report not found")
+    except report_edits.VersionConflict as e:
+        raise _version_conflict(e)
+    return {"status": "success", "report_id": report_id, "version": version}
+
+class ReportChangeEntry(BaseModel):
+    version: int
+    section: str
+    category: Optional[str] = None
+    old_value: Any = None
+    new_value: Any = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+@router.get("/reports/{report_id}/changes", response_model=List[ReportChangeEntry])
+async def get_report_changes(
+    report_id: int,
+    after_version: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+    scope: Scope = Depends(get_scope),
+):
+    """Audit log of the report's edits, oldest first; pass the last version seen as after_version to page."""
+    if not await scope.has_report(db, report_id):
+        raise HTTPException(status_code=404, detail="Report not found")
+    return await report_edits.list_changes(db, report_id, after_version=after_version, limit=limit)
 
 @router.put("/reports/{report_id}/finalize")
-async def finalize_report(report_id: int, request: ReportFinalizationRequest, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(QualityReport).where(QualityReport.id == report_id))
-    report = result.scalar_one_or_none()
+async def finalize_report(
+    report_id: int, request: ReportFinalizationRequest, db: AsyncSession = Depends(get_db),
+    scope: Scope = Depends(get_scope),
+):
+    result = await db.execute(scope.where(select(QualityReport.status).where(QualityReport.id == report_id)))
+    status = result.scalar_one_or_none()
     
-    if not report:
+    if status is None:
         raise HTTPException(status_code=404, detail="Report not found")
     
-    if report.status == "finalized":
+    if status == "finalized":
         raise HTTPException(status_code=400, detail="Report is already finalized")
         
-    # Update data with notes
-    current_data = dict(report.data)
-    current_data["technical_notes"] = request.technical_notes
-    
-    report.data = current_data
-    report.status = "finalized"
-    
-    db.add(report)
-    await db.commit()
-    await db.refresh(report)
-    
-    return {"status": "success", "report_id": report.id}
-
-@router.get("/reports/stats")
-async def get_dashboard_stats(db: AsyncSession = Depends(get_db)):
-    # Simple stats
-    total_result = await db.execute(select(func.count(QualityReport.id)))
-    total = total_result.scalar() or 0
-    
-    open_result = await db.execute(select(func.count(QualityReport.id)).where(QualityReport.status == "draft"))
-    open_count = open_result.scalar() or 0
+    try:
+        version = await report_edits.apply_changes(
+            report_id, request.version, {"technical_notes": request.technical_notes}, status="finalized",
+            organization_id=scope.organization_id,
+        )
+    except report_edits.ReportNotFound:
+        raise HTTPException(status_code=404, detail="Report not found")
+    except report_edits.VersionConflict as e:
+        raise _version_conflict(e)
     
-    # Mock 'recent insights' for now as we don't have a separate Insights table
-    return {
-        "total_reports": total,
-        "open_issues": open_count,
-        "pending_approvals": max(0, open_count - 2) # Mock logic
-    }
+    return {"status": "success", "report_id": report_id, "version": version}
 
 from app.models.hse import HSEReport
 from app.schemas.hse import HSEReportCreate
 
-@router.post("/reports/hse", response_model=dict)
-async def create_hse_report(report: HSEReportCreate, db: AsyncSession = Depends(get_db)):
+from app.services.write_batch import writes
+
+async def _insert_hse_report(db: AsyncSession, report: HSEReportCreate, organization_id: int = None) -> int:
     new_report = HSEReport(
         image_path=report.image_path,
         non_conformities=report.non_conformities,
         user_observations=report.user_observations,
         corrective_actions=report.corrective_actions,
-        status=report.status
+        status=report.status,
+        organization_id=organization_id,
     )
     db.add(new_report)
-    await db.commit()
-    await db.refresh(new_report)
-    return {"status": "success", "report_id": new_report.id}
+    # The id comes back from the INSERT; no refresh needed
+    await db.flush()
+    return new_report.id
+
+@router.post("/reports/hse", response_model=dict)
+async def create_hse_report(report: HSEReportCreate, scope: Scope = Depends(get_scope)):
+    # Committed together with the other writes arriving at the same time (app.services.write_batch)
+    report_id = await writes.submit(_insert_hse_report, report, scope.organization_id)
+    return {"status": "success", "report_id": report_id}
+
+from app.services import uploads
+
+@router.post("/uploads/gc")
+async def collect_orphaned_uploads(db: AsyncSession = Depends(get_db)):
+    """Deletes uploaded images that no HSE report references (older than UPLOAD_GC_GRACE_SECONDS)."""
+    return await uploads.sweep_orphans(db)
+
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from app.schemas.pdf import PdfBatchRequest
+from app.services import pdf as report_pdf
+
+@router.get("/reports/{report_id}/pdf")
+async def get_report_pdf(
+    report_id: int, lang: str = Query("tr", pattern="^(en|tr)$"), db: AsyncSession = Depends(get_db),
+    scope: Scope = Depends(get_scope),
+):
+    """8D report as PDF, rendered on the server and cached until the report changes."""
+    try:
+        path = await report_pdf.report_pdf(db, "8d", report_id, lang, scope.organization_id)
+    except report_pdf.ReportNotFound:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return FileResponse(path, media_type="application/pdf", filename=f"8D-{report_id}.pdf")
+
+@router.get("/reports/hse/{report_id}/pdf")
+async def get_hse_report_pdf(
+    report_id: int, lang: str = Query("tr", pattern="^(en|tr)$"), db: AsyncSession = Depends(get_db),
+    scope: Scope = Depends(get_scope),
+):
+    try:
+        path = await report_pdf.report_pdf(db, "hse", report_id, lang, scope.organization_id)
+    except report_pdf.ReportNotFound:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return FileResponse(path, media_type="application/pdf", filename=f"HSE-{report_id}.pdf")
+
+@router.post("/reports/pdf-batch")
+async def render_report_pdfs(
+    request: PdfBatchRequest, db: AsyncSession = Depends(get_db), scope: Scope = Depends(get_scope),
+):
+    """Zip of PDFs for many reports, rendered in parallel; unknown ids are listed in missing.txt."""
+    if len(request.report_ids) > report_pdf.PDF_BATCH_MAX_REPORTS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {report_pdf.PDF_BATCH_MAX_REPORTS} reports per batch",
+        )
+    kind = "8d" if request.dataset == "quality" else "hse"
+    try:
+        zip_path = await report_pdf.batch_zip(db, kind, request.report_ids, request.lang, scope.organization_id)
+    except report_pdf.ReportNotFound:
+        raise HTTPException(status_code=404, detail="None of the reports exist")
+    return FileResponse(
+        zip_path, media_type="application/zip", filename=f"kysai-{kind}-reports.zip",
+        background=BackgroundTask(os.remove, zip_path),
+    )
@@ -1,8 +1,21 @@
+import os
+import time
+# Import phase of the startup timings; with gunicorn --preload it happens once, in the master
+_import_started = time.perf_counter()
+_import_pid = os.getpid()
+
 from fastapi import FastAPI
-from app.models import models
-from app.models.base import engine
+from fastapi.responses import PlainTextResponse
+from app.models.base import SQLITE_DB_PATH, SQLITE_MAINTENANCE_INTERVAL, run_sqlite_maintenance
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import ai, reports
+from app.api import ai, reports, jobs, analytics
+from app.services.jobs import job_queue
+from app.services import images, uploads, metrics, ai_client, pdf, report_store
+import asyncio
+
+# Development default: each worker migrates at startup. Production runs `python -m app.migrate` once
+# before starting gunicorn (render.yaml) and sets this to 0.
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "1") == "1"
 
 app = FastAPI(title="KYSAI API", version="0.1.0")
 
@@ -13,30 +26,71 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 from fastapi.staticfiles import StaticFiles
-import os
 os.makedirs("static/uploads", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+background_tasks = []
+
 @app.on_event("startup")
 async def startup():
-    print("KYSAI SYSTEM: Initializing Database...")
-    try:
-        async with engine.begin() as conn:
-            await conn.run_sync(models.Base.metadata.create_all)
-        print("KYSAI SYSTEM: Database Tables Created/Verified.")
-    except Exception as e:
-        print(f"KYSAI SYSTEM: Database Initialization Failed: {e}")
+    phases = {}
+    if DB_MIGRATE_ON_STARTUP:
+        print("KYSAI SYSTEM: Initializing Database...")
+        try:
+            # Imported here so workers that skip migrations never load Alembic
+            from app import migrate
+            phases.update(await migrate.migrate())
+            print("KYSAI SYSTEM: Database Tables Created/Verified.")
+        except Exception as e:
+            print(f"KYSAI SYSTEM: Database Initialization Failed: {e}")
+    started = time.perf_counter()
+    job_queue.start()
+    background_tasks.append(asyncio.create_task(metrics.monitor_event_loop()))
+    if SQLITE_DB_PATH and SQLITE_MAINTENANCE_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(run_sqlite_maintenance()))
+    if uploads.UPLOAD_GC_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(uploads.run_periodic_sweep()))
+    if report_store.REPORT_ARCHIVE_AFTER_DAYS > 0 and report_store.REPORT_ARCHIVE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(report_store.run_periodic_archive()))
+    background_tasks.append(asyncio.create_task(ai_client.warm_up()))
+    phases["background_tasks"] = time.perf_counter() - started
+
+    for phase, seconds in phases.items():
+        metrics.stage_seconds.labels("startup", phase).observe(seconds)
+    preloaded = os.getpid() != _import_pid
+    summary = ", ".join([f"import {IMPORT_SECONDS:.2f}s{' (preloaded)' if preloaded else ''}"] + [
+        f"{phase} {seconds:.2f}s" for phase, seconds in phases.items()
+    ])
+    print(f"KYSAI SYSTEM: Worker {os.getpid()} ready ({summary}).")
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await job_queue.stop()
+    images.shutdown()
+    pdf.shutdown()
+    await ai_client.close()
+    metrics.write_snapshot()
 
 app.include_router(ai.router, prefix="/api/v1", tags=["AI"])
 app.include_router(reports.router, prefix="/api/v1", tags=["Reports"])
+app.include_router(jobs.router, prefix="/api/v1", tags=["Jobs"])
+app.include_router(analytics.router, prefix="/api/v1", tags=["Analytics"])
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to KYSAI API", "status": "running"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health_check():
     return {"status": "ok", "service": "kysai-backend"}
@@ -44,3 +98,5 @@ def health_check():
 @app.get("/api/v1/health")
 def api_health_check():
     return {"status": "ok", "module": "api-v1", "db": "connected"}
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
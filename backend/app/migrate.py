@@ -0,0 +1,151 @@
+"""Schema migrations and one-time data backfills.
+
+Run once per deploy, before the workers start (render.yaml does this):
+
+    cd backend && python -m app.migrate
+
+The schema is managed by Alembic (migrations/). A database created by
+create_all before migrations existed has no alembic_version table. It is
+stamped with the initial revision, which matches that schema, and upgraded
+from there; the next revision creates whichever of the later tables
+create_all had not built yet. The backfills (search index, dashboard stats, root-cause entries)
+cost one cheap query each once they have run. Each run also archives the
+finalized reports that have reached REPORT_ARCHIVE_AFTER_DAYS.
+
+On PostgreSQL, PG_ORGANIZATION_PARTITIONS=N (0, the default, disables it)
+turns report_stats and root_cause_entries into tables hash-partitioned on
+organization_id, N partitions each, so one organization's dashboard and
+analytics queries read one partition. They are the only per-organization
+tables no other table references; partitioning quality_reports would need
+organization_id in every key that points at it. Tables already partitioned
+are left alone, so the number of partitions can't be changed this way.
+
+Concurrent runs are serialized: on SQLite by the write lock file every
+worker already uses, on PostgreSQL by an advisory lock. With
+DB_MIGRATE_ON_STARTUP=1 (the default, for `uvicorn --reload` in development),
+each worker also runs this at startup.
+"""
+import asyncio
+import os
+import time
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import AddConstraint, CreateIndex
+
+from app.models.base import engine, AsyncSessionLocal, serialized_writes
+from app.models.analytics import RootCauseEntry
+from app.models.stats import ReportStat
+from app.services import analytics, report_store, search, stats
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The schema create_all built before migrations existed
+BASELINE_REVISION = "0001"
+# Arbitrary key for pg_advisory_xact_lock, shared by everyone running migrations
+PG_MIGRATION_LOCK = 81_705_021
+# Hash partitions per organization-scoped table on PostgreSQL; 0 keeps plain tables
+PG_ORGANIZATION_PARTITIONS = int(os.getenv("PG_ORGANIZATION_PARTITIONS", "0"))
+PARTITIONED_TABLES = (ReportStat.__table__, RootCauseEntry.__table__)
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def _upgrade(connection):
+    tables = set(inspect(connection).get_table_names())
+    config = alembic_config(connection)
+    if "alembic_version" not in tables and "quality_reports" in tables:
+        print(f"KYSAI SYSTEM: Existing schema without migration history, stamping revision {BASELINE_REVISION}.")
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
+
+
+def _partition_by_organization(connection, table, partitions: int):
+    """Rebuilds a table as partitioned by HASH (organization_id), in the migration transaction."""
+    name = table.name
+    is_partitioned = connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:name)"), {"name": name}
+    ).first()
+    if is_partitioned:
+        return
+    old = f"{name}_unpartitioned"
+    connection.execute(text(f"ALTER TABLE {name} RENAME TO {old}"))
+    connection.execute(text(
+        f"CREATE TABLE {name} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY HASH (organization_id)"
+    ))
+    for remainder in range(partitions):
+        connection.execute(text(
+            f"CREATE TABLE {name}_p{remainder} PARTITION OF {name}"
+            f" FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        ))
+    connection.execute(text(f"INSERT INTO {name} SELECT * FROM {old}"))
+    # A serial id keeps its sequence, which would otherwise be dropped with the old table
+    for column in table.primary_key.columns:
+        sequence = connection.execute(
+            text("SELECT pg_get_serial_sequence(:table, :column)"), {"table": old, "column": column.name}
+        ).scalar()
+        if sequence:
+            connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {name}.{column.name}"))
+    connection.execute(text(f"DROP TABLE {old}"))
+
+    # Keys and indexes come from the model; the primary key only if it includes the partition key
+    if "organization_id" in table.primary_key.columns:
+        connection.execute(AddConstraint(table.primary_key))
+    else:
+        columns = [column.name for column in table.primary_key.columns]
+        connection.execute(text(f"CREATE INDEX ix_{name}_{'_'.join(columns)} ON {name} ({', '.join(columns)})"))
+    for foreign_key in table.foreign_key_constraints:
+        connection.execute(AddConstraint(foreign_key))
+    for index in table.indexes:
+        connection.execute(CreateIndex(index))
+    print(f"KYSAI SYSTEM: {name} partitioned by organization ({partitions} partitions).")
+
+
+async def upgrade_schema():
+    async with serialized_writes():
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PG_MIGRATION_LOCK})
+            await conn.run_sync(_upgrade)
+            if conn.dialect.name == "postgresql" and PG_ORGANIZATION_PARTITIONS > 0:
+                for table in PARTITIONED_TABLES:
+                    await conn.run_sync(_partition_by_organization, table, PG_ORGANIZATION_PARTITIONS)
+
+
+async def backfill():
+    async with AsyncSessionLocal() as db:
+        await search.ensure_index(db)
+        await stats.ensure_stats(db)
+        await analytics.ensure_entries(db)
+        archived = await report_store.archive_due(db)
+        if archived:
+            print(f"KYSAI SYSTEM: Archived {archived} finalized reports.")
+
+
+async def migrate() -> dict:
+    """Brings the database up to date; returns the seconds spent per phase."""
+    timings = {}
+    started = time.perf_counter()
+    await upgrade_schema()
+    timings["schema"] = time.perf_counter() - started
+    started = time.perf_counter()
+    await backfill()
+    timings["backfill"] = time.perf_counter() - started
+    return timings
+
+
+async def _main():
+    try:
+        timings = await migrate()
+    finally:
+        await engine.dispose()
+    print("KYSAI SYSTEM: Database migrated (" + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()) + ").")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Index
+from .base import Base, Timestamp
+
+class RootCauseEntry(Base):
+    """One cause from a report's D4 section, with its normalized cluster key.
+
+    organization_id and created_at are copied from the report so analytics
+    queries filter and group this table alone, without touching report JSON.
+    """
+    __tablename__ = "root_cause_entries"
+
+    id = Column(Integer, primary_key=True)
+    report_id = Column(Integer, ForeignKey("quality_reports.id", ondelete="CASCADE"), nullable=False, index=True)
+    organization_id = Column(Integer)
+    created_at = Column(Timestamp, nullable=False)
+    # "root_cause" for d4_root_causes/occurrence/escape causes, otherwise the fishbone category
+    category = Column(String, nullable=False)
+    cluster_key = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+
+    __table_args__ = (
+        # Covers the Pareto GROUP BY with its filters, so it never reads table rows
+        Index(
+            "ix_root_cause_entries_category_cluster",
+            "category", "cluster_key", "created_at", "organization_id", "report_id",
+        ),
+        # The same, for the Pareto of one organization
+        Index(
+            "ix_root_cause_entries_organization_category_cluster",
+            "organization_id", "category", "cluster_key", "created_at", "report_id",
+        ),
+        Index("ix_root_cause_entries_created_at", "created_at"),
+    )
@@ -1,18 +1,230 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy import DateTime, event, text
+from sqlalchemy.dialects import sqlite
+import asyncio
 import os
+from contextlib import asynccontextmanager
+import random
+import re
+import time
+try:
+    import fcntl
+except ImportError:  # Windows: writers are still serialized within each worker
+    fcntl = None
 from dotenv import load_dotenv
+from app.services import metrics
 
 load_dotenv()
 
 # Fallback to SQLite for MVP reliability if no DB_URL is set
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./kysai.db")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Statement logging is expensive under load; SQL_ECHO=1 turns it on for debugging
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Records how long each checkout waits for a free (or new) connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_wait.observe(time.perf_counter() - start)
+
+
+def _pool_options(url: str) -> dict:
+    # In-memory SQLite needs its default single-connection pool
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return {}
+    return {"poolclass": TimedQueuePool}
+
+
+engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO, **_pool_options(DATABASE_URL))
+
+# --- SQLite deployment profile ---
+# WAL lets readers run alongside the single writer. Writers from all gunicorn workers are
+# queued through SQLiteWriteLock instead of racing on SQLite's own lock, whose busy handler
+# retries by polling and gives up with "database is locked" under sustained contention.
+IS_SQLITE = engine.url.get_backend_name() == "sqlite"
+SQLITE_DB_PATH = engine.url.database if IS_SQLITE and engine.url.database not in (None, "", ":memory:") else None
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", str(64 * 1024)))
+SQLITE_SERIALIZE_WRITES = os.getenv("SQLITE_SERIALIZE_WRITES", "1") == "1"
+SQLITE_WRITE_LOCK_TIMEOUT = float(os.getenv("SQLITE_WRITE_LOCK_TIMEOUT_SECONDS", "30"))
+SQLITE_MAINTENANCE_INTERVAL = float(os.getenv("SQLITE_MAINTENANCE_INTERVAL_SECONDS", "300"))
+
+if SQLITE_DB_PATH:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        # Negative means KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KIB}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.close()
+
+
+class SQLiteWriteLock:
+    """One writer at a time per database file: an asyncio.Lock within the worker, flock across workers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = None
+        self._fd = None
+
+    async def acquire(self, timeout: float = SQLITE_WRITE_LOCK_TIMEOUT):
+        start = time.perf_counter()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        try:
+            await asyncio.wait_for(self._lock.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise OperationalError("SQLite write lock", None, TimeoutError(f"Waited {timeout:.0f}s for the write lock"))
+        try:
+            await self._acquire_file(start + timeout)
+        except BaseException:
+            self._lock.release()
+            raise
+        metrics.db_write_lock_wait.observe(time.perf_counter() - start)
+
+    async def _acquire_file(self, deadline: float):
+        if fcntl is None:
+            return
+        if self._fd is None:
+            self._fd = os.open(f"{self.path}-writelock", os.O_RDWR | os.O_CREAT, 0o644)
+        # Polled rather than blocking in a thread: a cancelled waiter must never end up holding the lock
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.perf_counter() >= deadline:
+                    raise OperationalError("SQLite write lock", None, TimeoutError("Another worker held the write lock too long"))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, 0.05)
+
+    def release(self):
+        if fcntl is not None and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+
+write_lock = SQLiteWriteLock(SQLITE_DB_PATH) if SQLITE_DB_PATH and SQLITE_SERIALIZE_WRITES else None
+
+_WRITE_SQL = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER|BEGIN\s+IMMEDIATE)\b", re.IGNORECASE)
+
+
+def _is_write(statement) -> bool:
+    if isinstance(statement, TextClause):
+        return bool(_WRITE_SQL.match(statement.text))
+    return bool(getattr(statement, "is_dml", False))
+
+
+class SerializedWriteSession(AsyncSession):
+    """Takes the write lock before the first write of a transaction and holds it until commit or rollback.
+
+    Reads never take it. pysqlite only opens a transaction at the first DML statement, so reading
+    before the lock is taken cannot leave a stale snapshot that later fails to upgrade.
+    """
+
+    _holds_write_lock = False
+
+    async def _lock_for_write(self):
+        if write_lock is not None and not self._holds_write_lock:
+            await write_lock.acquire()
+            self._holds_write_lock = True
+
+    def _unlock(self):
+        if self._holds_write_lock:
+            self._holds_write_lock = False
+            write_lock.release()
+
+    def _has_pending_writes(self) -> bool:
+        session = self.sync_session
+        return bool(session.new or session.deleted or session.dirty)
+
+    async def execute(self, statement, *args, **kwargs):
+        if _is_write(statement):
+            await self._lock_for_write()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def flush(self, objects=None):
+        if self._has_pending_writes():
+            await self._lock_for_write()
+        await super().flush(objects)
+
+    async def commit(self):
+        if self._has_pending_writes():
+            await self._lock_for_write()
+        try:
+            await super().commit()
+        finally:
+            self._unlock()
+
+    async def rollback(self):
+        try:
+            await super().rollback()
+        finally:
+            self._unlock()
+
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            self._unlock()
+
+
+@asynccontextmanager
+async def serialized_writes():
+    """Holds the write lock around writes made outside a session (startup DDL, maintenance)."""
+    if write_lock is None:
+        yield
+        return
+    await write_lock.acquire()
+    try:
+        yield
+    finally:
+        write_lock.release()
+
+
+async def run_sqlite_maintenance():
+    """Background task: passive WAL checkpoint plus PRAGMA optimize, so the WAL file stays small."""
+    while True:
+        await asyncio.sleep(SQLITE_MAINTENANCE_INTERVAL * random.uniform(0.9, 1.1))
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("PRAGMA wal_checkpoint(PASSIVE)"))
+                # optimize may run ANALYZE, which writes
+                async with serialized_writes():
+                    await conn.execute(text("PRAGMA optimize"))
+        except Exception as e:
+            print(f"KYSAI SYSTEM: SQLite maintenance failed: {e}")
+
+
+def _collect_pool_stats():
+    pool = engine.sync_engine.pool
+    if isinstance(pool, TimedQueuePool):
+        metrics.db_pool_connections.labels("checked_out").set(pool.checkedout())
+        metrics.db_pool_connections.labels("idle").set(pool.checkedin())
+
+
+metrics.registry.add_collector(_collect_pool_stats)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
-    class_=AsyncSession,
+    class_=SerializedWriteSession if write_lock is not None else AsyncSession,
     expire_on_commit=False,
     autocommit=False,
     autoflush=False,
@@ -20,6 +232,13 @@ AsyncSessionLocal = sessionmaker(
 
 Base = declarative_base()
 
+# SQLite stores server_default=func.now() as 'YYYY-MM-DD HH:MM:SS' text. Binding Python datetimes
+# in the same format keeps range and keyset comparisons on these columns consistent with the stored values.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
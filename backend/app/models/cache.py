@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, Float, JSON
+from .base import Base
+
+class AIResponseCache(Base):
+    __tablename__ = "ai_response_cache"
+
+    # SHA-256 of the normalized prompt inputs
+    key = Column(String(64), primary_key=True)
+    namespace = Column(String, nullable=False, index=True)
+    payload = Column(JSON, nullable=False)
+    # Unix timestamp; stored as a float so expiry checks work the same on SQLite and PostgreSQL
+    expires_at = Column(Float, nullable=False, index=True)
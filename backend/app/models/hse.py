@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from .base import Base
+from .base import Base, Timestamp
 
 class HSEReport(Base):
     __tablename__ = "hse_reports"
@@ -14,9 +14,17 @@ class HSEReport(Base):
     status = Column(String, default="draft")
     
     organization_id = Column(Integer, ForeignKey("organizations.id"))
-    author_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    author_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, onupdate=func.now())
 
     organization = relationship("Organization", back_populates="hse_reports")
     author = relationship("User", back_populates="hse_reports")
+
+    __table_args__ = (
+        # Per-organization listings and exports, newest first or by status (app.services.tenancy)
+        Index("ix_hse_reports_organization_created_at_id", "organization_id", "created_at", "id"),
+        Index("ix_hse_reports_organization_status_created_at", "organization_id", "status", "created_at"),
+    )
+    # created_at comes back from the INSERT (RETURNING) instead of a refresh
+    __mapper_args__ = {"eager_defaults": True}
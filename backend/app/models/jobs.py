@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, Float, Index
+from sqlalchemy.sql import func
+from .base import Base
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    kind = Column(String, nullable=False, default="8d")
+    status = Column(String, nullable=False, default=JobStatus.QUEUED)
+    stage = Column(String, nullable=False, default="queued")  # queued, generating, saving, retrying, done
+    progress = Column(Integer, nullable=False, default=0)  # 0-100
+    payload = Column(JSON, nullable=False)  # The original request body
+
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    # Unix timestamps (float) so claim/backoff comparisons behave identically on SQLite and PostgreSQL
+    run_after = Column(Float, nullable=False, default=0)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(Float, nullable=True)
+
+    error = Column(String, nullable=True)
+    report_id = Column(Integer, ForeignKey("quality_reports.id"), nullable=True)
+    # The organization the report is created for; jobs of other organizations answer 404
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        # Workers claim the oldest runnable job
+        Index("ix_generation_jobs_status_run_after", "status", "run_after"),
+    )
@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Enum, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
-from .base import Base
+from .base import Base, Timestamp
 
 class UserRole(enum.Enum):
     ADMIN = "admin"
@@ -32,7 +32,7 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     role = Column(Enum(UserRole), default=UserRole.MEMBER)
-    organization_id = Column(Integer, ForeignKey("organizations.id"))
+    organization_id = Column(Integer, ForeignKey("organizations.id"), index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     organization = relationship("Organization", back_populates="users")
@@ -43,21 +43,45 @@ class QualityReport(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True, nullable=False)
-    report_type = Column(Enum(ReportType), nullable=False)
-    status = Column(String, default="draft") # draft, submitted, approved
-    
-    # Critical: Using JSONB for semi-structured data allows flexibility for different report templates
-    # without needing schema migrations for every new report field.
-    data = Column(JSON, nullable=False, default={}) 
+    report_type = Column(Enum(ReportType), nullable=False, index=True)
+    status = Column(String, default="draft", index=True) # draft, submitted, approved, finalized
+    # Summary kept on the row itself; the sections live in report_sections or, once archived,
+    # in report_archive (app.services.report_store reads and writes both)
+    problem_description = Column(Text)
     
+    # Indexed by the composite indexes below, which all lead with it
     organization_id = Column(Integer, ForeignKey("organizations.id"))
-    author_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    author_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, onupdate=func.now())
+    # Optimistic concurrency: every ORM update of the row is made conditional on this value and
+    # increments it, so an edit based on an older version fails instead of overwriting
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     organization = relationship("Organization", back_populates="reports")
     author = relationship("User", back_populates="reports")
 
+    __table_args__ = (
+        # Backs the keyset pagination order of GET /reports
+        Index("ix_quality_reports_created_at_id", "created_at", "id"),
+        # The same order within one organization (app.services.tenancy)
+        Index("ix_quality_reports_organization_created_at_id", "organization_id", "created_at", "id"),
+        # An organization's reports in one status, e.g. its open drafts
+        Index("ix_quality_reports_organization_status_created_at", "organization_id", "status", "created_at"),
+    )
+    # eager_defaults: ids and server-side timestamps come back from the INSERT/UPDATE (RETURNING)
+    __mapper_args__ = {"version_id_col": version, "eager_defaults": True}
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+
+    # Client-supplied Idempotency-Key header value
+    key = Column(String(255), primary_key=True)
+    # Hash of the request body, so a key cannot be replayed for a different problem
+    request_hash = Column(String(64), nullable=False)
+    report_id = Column(Integer, ForeignKey("quality_reports.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 from .hse import HSEReport  # Import at end to avoid circular imports during definition, or handle carefully
 # Actually, better to use string forward references which we did in hse.py. 
 # But we need Oganization and User to know about hse_reports.
@@ -65,3 +89,9 @@ from .hse import HSEReport  # Import at end to avoid circular imports during def
 
 Organization.hse_reports = relationship("HSEReport", back_populates="organization")
 User.hse_reports = relationship("HSEReport", back_populates="author")
+
+from .cache import AIResponseCache  # Registers the table with Base.metadata for create_all
+from .jobs import GenerationJob
+from .stats import ReportStat
+from .analytics import RootCauseEntry
+from .sections import ReportSection, ReportArchive, ReportChange
@@ -0,0 +1,54 @@
+from sqlalchemy import Column, Integer, String, JSON, LargeBinary, ForeignKey, Index
+from sqlalchemy.sql import func
+from .base import Base, Timestamp
+
+class ReportSection(Base):
+    """One section (D1-D8, technical notes, ...) of a report that has not been archived.
+
+    quality_reports keeps only the summary columns, so listings, stats and
+    keyset pages read short rows; the bulky text lives here and is read only
+    when a report's content is actually needed.
+    """
+    __tablename__ = "report_sections"
+
+    report_id = Column(Integer, ForeignKey("quality_reports.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(JSON)
+
+class ReportArchive(Base):
+    """All sections of an old finalized report, compressed into one value.
+
+    Replaces the report's report_sections rows; app.services.report_store
+    reads both tiers transparently.
+    """
+    __tablename__ = "report_archive"
+
+    report_id = Column(Integer, ForeignKey("quality_reports.id", ondelete="CASCADE"), primary_key=True)
+    # "zstd" or "zlib"
+    codec = Column(String(8), nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(Timestamp, server_default=func.now())
+
+class ReportChange(Base):
+    """Audit trail of report edits, one row per changed section or fishbone category.
+
+    Rows are only ever appended (app.services.report_edits); nothing updates
+    or deletes them while the report exists.
+    """
+    __tablename__ = "report_changes"
+
+    id = Column(Integer, primary_key=True)
+    report_id = Column(Integer, ForeignKey("quality_reports.id", ondelete="CASCADE"), nullable=False)
+    # The report version the edit produced
+    version = Column(Integer, nullable=False)
+    # A section key, or "status"
+    section = Column(String, nullable=False)
+    # Set when only one d4_fishbone category changed
+    category = Column(String)
+    old_value = Column(JSON)
+    new_value = Column(JSON)
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_report_changes_report_id_version", "report_id", "version"),
+    )
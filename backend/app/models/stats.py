@@ -0,0 +1,23 @@
+from sqlalchemy import Column, String, Integer, Date, Index
+from .base import Base
+
+class ReportStat(Base):
+    """Report counts per creation day, type, current status and organization.
+
+    Kept up to date in the same transactions that create and finalize reports,
+    so dashboard figures are sums over this small table instead of scans of
+    quality_reports.
+    """
+    __tablename__ = "report_stats"
+
+    day = Column(Date, primary_key=True)
+    report_type = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    # 0 for reports without an organization; primary key columns can't be NULL
+    organization_id = Column(Integer, primary_key=True, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # One organization's dashboard reads only its own counters
+        Index("ix_report_stats_organization_id_day", "organization_id", "day"),
+    )
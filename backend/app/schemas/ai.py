@@ -1,10 +1,14 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from typing import List, Optional, Dict
 
 class EightDGenerationRequest(BaseModel):
     problem_description: str
     industry_context: Optional[str] = "Automotive"
     language: Optional[str] = "en"
+    # Set to False to force a fresh generation (the result still refreshes the cache)
+    use_cache: Optional[bool] = True
+    # Answer from the nearest finalized report when it is similar enough (SIMILAR_REUSE_THRESHOLD)
+    reuse_similar: Optional[bool] = False
 
 class EightDGenerationResponse(BaseModel):
     problem_description: str
@@ -23,6 +27,37 @@ class EightDGenerationResponse(BaseModel):
 
 class ReportFinalizationRequest(BaseModel):
     technical_notes: str
+    # Version the client last saw (GET /reports/{id}); omit to finalize whatever is current
+    version: Optional[int] = None
+
+class ReportPatchRequest(BaseModel):
+    """Partial update of a report: only the fields that are set are written."""
+    # Version the edit is based on; a report that has moved on since answers 409
+    version: int
+    problem_description: Optional[str] = None
+    d1_team: Optional[List[str]] = None
+    d2_problem: Optional[str] = None
+    d3_interim_actions: Optional[List[str]] = None
+    d4_root_causes: Optional[List[str]] = None
+    d4_occurrence_causes: Optional[List[str]] = None
+    d4_escape_causes: Optional[List[str]] = None
+    d4_fishbone: Optional[Dict[str, List[str]]] = None
+    d5_chosen_pca: Optional[List[str]] = None
+    d6_implemented_pca: Optional[List[str]] = None
+    d7_prevention: Optional[List[str]] = None
+    d8_recognition: Optional[List[str]] = None
+    technical_notes: Optional[str] = None
+    # Replaces the entries of single fishbone categories, leaving the others as they are
+    fishbone_categories: Optional[Dict[str, List[str]]] = None
+
+    @model_validator(mode="after")
+    def _one_fishbone_form(self):
+        if self.d4_fishbone is not None and self.fishbone_categories is not None:
+            raise ValueError("Send either d4_fishbone or fishbone_categories, not both")
+        return self
+
+    def sections(self) -> dict:
+        return self.model_dump(exclude_none=True, exclude={"version", "fishbone_categories"})
 
 class ErrorResponse(BaseModel):
     detail: str
@@ -5,6 +5,7 @@ class HSEAnalysisResponse(BaseModel):
     non_conformities: List[str]
     corrective_actions: List[str]
     image_path: str
+    thumbnail_path: Optional[str] = None
 
 class HSEReportCreate(BaseModel):
     image_path: str
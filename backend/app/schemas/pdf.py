@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+from typing import List, Literal
+
+class PdfBatchRequest(BaseModel):
+    dataset: Literal["quality", "hse"] = "quality"
+    report_ids: List[int] = Field(..., min_length=1)
+    lang: Literal["en", "tr"] = "tr"
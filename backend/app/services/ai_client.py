@@ -0,0 +1,456 @@
+"""Async client for the generative model backend.
+
+Every model call made by the API goes through this module. Calls use the SDK's
+native async methods, are capped per worker by a semaphore and are bounded by a
+per-call timeout, so a slow generation only ties up its own request instead of
+the worker's event loop. The timeout includes the wait for a free slot: under a
+burst, a call that gets none before its deadline raises AIBusyError (an
+AIUnavailableError) instead of starting its timeout only once it is let in.
+
+With GEMINI_API_ENDPOINT set, calls go to the Gemini REST API at that base URL
+over httpx instead of through the SDK. That is how the benchmarks in bench/ point
+the app at a local fake model server. The SDK's own REST transport is
+synchronous, so it would block the event loop. The SDK takes about a second to
+import, so it is only loaded on first use, or by warm_up() once the worker is
+already serving.
+
+Calls pass through ai_guard's rate limiter and circuit breaker. Transient
+failures (429, 5xx, connection errors) are retried up to AI_RETRY_ATTEMPTS
+times with full-jitter exponential backoff, within the call's timeout. A
+stream is only retried until its first chunk arrives. When a model stays
+unavailable and a fallback model is configured (GEMINI_FALLBACK_TEXT_MODEL,
+GEMINI_FALLBACK_VISION_MODEL), the call moves to the fallback. Otherwise it
+raises AIUnavailableError, whose retry_after tells the client when to come back.
+"""
+import asyncio
+import base64
+import json
+import os
+import random
+from types import SimpleNamespace
+
+import httpx
+
+from app.services import ai_guard, metrics
+
+GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
+TEXT_MODEL_NAME = os.getenv("GEMINI_TEXT_MODEL", "gemini-pro")
+VISION_MODEL_NAME = os.getenv("GEMINI_VISION_MODEL", "gemini-1.5-flash")
+# Cheaper or faster models that take over while the primary one is rate limited or failing
+FALLBACK_TEXT_MODEL_NAME = os.getenv("GEMINI_FALLBACK_TEXT_MODEL", "")
+FALLBACK_VISION_MODEL_NAME = os.getenv("GEMINI_FALLBACK_VISION_MODEL", "")
+# e.g. https://generativelanguage.googleapis.com, or http://127.0.0.1:8090 for bench/fake_llm.py
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+
+# Per-worker limits. With 4 gunicorn workers the host runs at most
+# 4 * AI_MAX_CONCURRENCY model calls at once.
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+AI_TEXT_TIMEOUT = float(os.getenv("AI_TEXT_TIMEOUT_SECONDS", "60"))
+AI_VISION_TIMEOUT = float(os.getenv("AI_VISION_TIMEOUT_SECONDS", "45"))
+# Attempts per model, counting the first one
+AI_RETRY_ATTEMPTS = int(os.getenv("AI_RETRY_ATTEMPTS", "3"))
+AI_RETRY_BASE_SECONDS = float(os.getenv("AI_RETRY_BASE_SECONDS", "0.5"))
+AI_RETRY_MAX_SECONDS = float(os.getenv("AI_RETRY_MAX_SECONDS", "8"))
+# Retry-After for calls that found every concurrency slot busy until their deadline
+AI_BUSY_RETRY_AFTER = 5.0
+
+# Error statuses that say nothing about the request itself
+TRANSIENT_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class AIClientError(Exception):
+    """Raised when the model backend fails or returns unusable output."""
+
+
+class AITimeoutError(AIClientError):
+    """Raised when a model call exceeds its timeout."""
+
+
+class AIBackendError(AIClientError):
+    """Raised when the REST backend answers with an error status."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AIUnavailableError(AIClientError):
+    """Raised when every model for the call is rate limited or failing; retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AIBusyError(AIUnavailableError):
+    """Raised when every concurrency slot of the worker stayed busy until the call's deadline."""
+
+
+_semaphore = None
+_models = {}
+_http = None
+_genai = None
+
+
+def is_configured() -> bool:
+    return bool(GOOGLE_API_KEY)
+
+
+def uses_sdk() -> bool:
+    return is_configured() and not GEMINI_API_ENDPOINT
+
+
+def _sdk():
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GOOGLE_API_KEY)
+        _genai = genai
+    return _genai
+
+
+async def warm_up():
+    """Imports the SDK in a thread, so the first model call doesn't wait for it."""
+    if uses_sdk():
+        await asyncio.to_thread(_sdk)
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    # Created lazily so it binds to the worker's running loop, not the import-time one.
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def _acquire_slot(model_name: str, seconds_left: float) -> float:
+    """Takes a concurrency slot, waiting at most seconds_left; returns the seconds left once it is held."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        await asyncio.wait_for(_get_semaphore().acquire(), timeout=max(seconds_left, 0.001))
+    except asyncio.TimeoutError:
+        metrics.llm_guard.labels(model_name, "slots_busy").inc()
+        raise AIBusyError(
+            f"All {AI_MAX_CONCURRENCY} model call slots stayed busy for {seconds_left:.0f}s", AI_BUSY_RETRY_AFTER,
+        )
+    return seconds_left - (loop.time() - started)
+
+
+def _get_model(name: str):
+    model = _models.get(name)
+    if model is None:
+        model = _sdk().GenerativeModel(name)
+        _models[name] = model
+    return model
+
+
+def _payload_bytes(contents) -> int:
+    parts = contents if isinstance(contents, list) else [contents]
+    return sum(len(p["data"]) if isinstance(p, dict) else len(str(p).encode("utf-8")) for p in parts)
+
+
+# Each transport returns (text, usage_metadata); text is None when the answer was blocked or empty.
+
+def _sdk_text(response):
+    try:
+        return response.text
+    except ValueError:
+        # .text raises when the candidate was blocked or is empty
+        return None
+
+
+async def _sdk_generate(model_name: str, contents):
+    response = await _get_model(model_name).generate_content_async(contents)
+    return _sdk_text(response), getattr(response, "usage_metadata", None)
+
+
+async def _sdk_stream(model_name: str, prompt: str):
+    response = await _get_model(model_name).generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        yield _sdk_text(chunk), getattr(chunk, "usage_metadata", None)
+
+
+def _get_http() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            base_url=GEMINI_API_ENDPOINT.rstrip("/"),
+            headers={"x-goog-api-key": GOOGLE_API_KEY},
+            # Deadlines are enforced by the callers' wait_for
+            timeout=None,
+            limits=httpx.Limits(max_connections=AI_MAX_CONCURRENCY, max_keepalive_connections=AI_MAX_CONCURRENCY),
+        )
+    return _http
+
+
+def _rest_body(contents) -> dict:
+    parts = []
+    for part in contents if isinstance(contents, list) else [contents]:
+        if isinstance(part, dict):
+            data = base64.b64encode(part["data"]).decode("ascii")
+            parts.append({"inlineData": {"mimeType": part["mime_type"], "data": data}})
+        else:
+            parts.append({"text": str(part)})
+    return {"contents": [{"role": "user", "parts": parts}]}
+
+
+def _rest_result(payload: dict):
+    usage = payload.get("usageMetadata")
+    if usage:
+        usage = SimpleNamespace(
+            prompt_token_count=usage.get("promptTokenCount", 0),
+            candidates_token_count=usage.get("candidatesTokenCount", 0),
+        )
+    candidates = payload.get("candidates") or [{}]
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(p.get("text", "") for p in parts) or None, usage
+
+
+def _rest_check(model_name: str, response: httpx.Response):
+    if response.status_code >= 400:
+        raise AIBackendError(
+            f"Model '{model_name}' returned HTTP {response.status_code}: {response.text[:200]}", response.status_code,
+        )
+
+
+async def _rest_generate(model_name: str, contents):
+    response = await _get_http().post(f"/v1beta/models/{model_name}:generateContent", json=_rest_body(contents))
+    _rest_check(model_name, response)
+    return _rest_result(response.json())
+
+
+async def _rest_stream(model_name: str, prompt: str):
+    async with _get_http().stream(
+        "POST", f"/v1beta/models/{model_name}:streamGenerateContent",
+        params={"alt": "sse"}, json=_rest_body(prompt),
+    ) as response:
+        if response.status_code >= 400:
+            await response.aread()
+            _rest_check(model_name, response)
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                yield _rest_result(json.loads(line[5:]))
+
+
+def _failure_kind(error: Exception):
+    """"throttled" for a 429, "transient" for other failures worth retrying, None for the rest."""
+    if isinstance(error, (AITimeoutError, httpx.TransportError)):
+        return "transient"
+    # AIBackendError carries status_code; the SDK's google.api_core exceptions carry the HTTP status as code
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if not isinstance(status, int):
+        return None
+    if status == 429:
+        return "throttled"
+    return "transient" if status in TRANSIENT_STATUSES else None
+
+
+def _model_chain(primary: str, fallback: str) -> list:
+    return [primary, fallback] if fallback and fallback != primary else [primary]
+
+
+async def _guarded(model_name: str, timeout: float, attempt):
+    """Runs attempt(model_name, seconds_left) under the breaker and rate limiter, retrying transient failures.
+
+    Timeouts are not retried: the caller's time is already spent.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    for number in range(1, AI_RETRY_ATTEMPTS + 1):
+        wait = await ai_guard.admit(model_name, probe_seconds=timeout)
+        if wait:
+            metrics.llm_guard.labels(model_name, "breaker_open").inc()
+            raise AIUnavailableError(f"Model '{model_name}' is failing; calls are paused", wait)
+        wait = await ai_guard.reserve(model_name, max_wait=min(ai_guard.AI_RATE_LIMIT_MAX_WAIT, deadline - loop.time()))
+        if wait < 0:
+            metrics.llm_guard.labels(model_name, "rate_limited").inc()
+            raise AIUnavailableError(f"Model '{model_name}' is at its rate limit", -wait)
+        if wait:
+            metrics.llm_guard.labels(model_name, "throttle_wait").inc()
+            await asyncio.sleep(wait)
+
+        try:
+            result = await attempt(model_name, deadline - loop.time())
+        except AIBusyError:
+            # Waiting for a slot of this worker says nothing about the model; the breaker doesn't count it
+            raise
+        except Exception as e:
+            kind = _failure_kind(e)
+            # Any answer other than a transient failure shows the backend is up
+            opened = await ai_guard.record(model_name, ok=kind is None, throttled=kind == "throttled")
+            if opened:
+                metrics.llm_guard.labels(model_name, "breaker_opened").inc()
+                print(f"KYSAI SYSTEM: Circuit breaker opened for model '{model_name}': {e}")
+            if kind is None or isinstance(e, AITimeoutError):
+                raise
+            delay = random.uniform(0, min(AI_RETRY_MAX_SECONDS, AI_RETRY_BASE_SECONDS * 2 ** (number - 1)))
+            if opened or number == AI_RETRY_ATTEMPTS or loop.time() + delay >= deadline:
+                retry_after = ai_guard.AI_BREAKER_COOLDOWN if opened else max(delay, 1.0)
+                raise AIUnavailableError(
+                    f"Model '{model_name}' failed after {number} attempt(s): {e}", retry_after,
+                ) from e
+            metrics.llm_guard.labels(model_name, "retry").inc()
+            await asyncio.sleep(delay)
+        else:
+            await ai_guard.record(model_name, ok=True)
+            return result
+
+
+async def _with_fallback(models: list, timeout: float, attempt):
+    """Tries each model in turn while the previous one is unavailable; each model gets the full timeout."""
+    error = None
+    for model_name in models:
+        if error is not None:
+            metrics.llm_guard.labels(model_name, "fallback").inc()
+        try:
+            return await _guarded(model_name, timeout, attempt)
+        except AIBusyError:
+            # A fallback model would wait for the same slots
+            raise
+        except AIUnavailableError as e:
+            if error is None or e.retry_after < error.retry_after:
+                error = e
+    raise error
+
+
+async def _generate(models: list, contents, timeout: float) -> str:
+    call = _rest_generate if GEMINI_API_ENDPOINT else _sdk_generate
+    sent = _payload_bytes(contents)
+
+    async def attempt(model_name: str, seconds_left: float) -> str:
+        seconds_left = await _acquire_slot(model_name, seconds_left)
+        try:
+            text, usage = await asyncio.wait_for(call(model_name, contents), timeout=max(seconds_left, 0.001))
+        except asyncio.TimeoutError:
+            metrics.record_llm_call(model_name, "timeout", sent)
+            raise AITimeoutError(f"Model '{model_name}' did not respond within {timeout:.0f}s")
+        except Exception:
+            metrics.record_llm_call(model_name, "error", sent)
+            raise
+        finally:
+            _get_semaphore().release()
+        if text is None:
+            metrics.record_llm_call(model_name, "empty", sent, usage=usage)
+            raise AIClientError(f"Model '{model_name}' returned no text (blocked or empty response)")
+        metrics.record_llm_call(model_name, "ok", sent, len(text.encode("utf-8")), usage=usage)
+        return text
+
+    return await _with_fallback(models, timeout, attempt)
+
+
+async def generate_text(prompt: str, timeout: float = None) -> str:
+    return await _generate(_model_chain(TEXT_MODEL_NAME, FALLBACK_TEXT_MODEL_NAME), prompt, timeout or AI_TEXT_TIMEOUT)
+
+
+async def stream_text(prompt: str, timeout: float = None):
+    """Yields text chunks as the model produces them.
+
+    The timeout bounds the whole stream, like a single generate_text call.
+    """
+    stream = _rest_stream if GEMINI_API_ENDPOINT else _sdk_stream
+    timeout = timeout or AI_TEXT_TIMEOUT
+    loop = asyncio.get_running_loop()
+    sent = _payload_bytes(prompt)
+    # The stream start() opened, until the try/finally below owns it
+    opened = []
+
+    async def start(model_name: str, seconds_left: float):
+        # Holds a concurrency slot from here until the stream is closed
+        deadline = loop.time() + seconds_left
+        seconds_left = await _acquire_slot(model_name, seconds_left)
+        chunks = stream(model_name, prompt)
+        try:
+            first = await asyncio.wait_for(chunks.__anext__(), timeout=max(seconds_left, 0.001))
+        except StopAsyncIteration:
+            first = None
+        except BaseException as e:
+            _get_semaphore().release()
+            await chunks.aclose()
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.record_llm_call(model_name, "timeout", sent)
+                raise AITimeoutError(f"Model '{model_name}' did not start streaming within {timeout:.0f}s")
+            if isinstance(e, Exception):
+                metrics.record_llm_call(model_name, "error", sent)
+            raise
+        opened.append((model_name, chunks))
+        return model_name, chunks, first, deadline
+
+    try:
+        model_name, chunks, first, deadline = await _with_fallback(
+            _model_chain(TEXT_MODEL_NAME, FALLBACK_TEXT_MODEL_NAME), timeout, start,
+        )
+    except BaseException as e:
+        # start() succeeded, but the guard's bookkeeping after it failed or was cancelled (a client
+        # disconnect): nothing else would give the slot back or close the stream
+        for model_name, chunks in opened:
+            _get_semaphore().release()
+            outcome = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+            metrics.record_llm_call(model_name, outcome, sent)
+            await chunks.aclose()
+        raise
+    received = 0
+    usage = None
+    outcome = "error"
+    try:
+        pending = first
+        while pending is not None:
+            text, chunk_usage = pending
+            # Every chunk carries the running totals; the last one wins
+            usage = chunk_usage or usage
+            if text:
+                received += len(text.encode("utf-8"))
+                yield text
+            try:
+                pending = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0.001))
+            except StopAsyncIteration:
+                pending = None
+        outcome = "ok"
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise AITimeoutError(f"Model '{model_name}' did not finish streaming within {timeout:.0f}s")
+    except (GeneratorExit, asyncio.CancelledError):
+        # The client went away mid-stream
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        kind = _failure_kind(e)
+        if kind is not None:
+            await ai_guard.record(model_name, ok=False, throttled=kind == "throttled")
+        raise
+    finally:
+        _get_semaphore().release()
+        metrics.record_llm_call(model_name, outcome, sent, received, usage=usage)
+        await chunks.aclose()
+
+
+async def close():
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+    ai_guard.close()
+
+
+async def generate_vision(prompt: str, image_bytes: bytes, mime_type: str, timeout: float = None) -> str:
+    image_part = {"mime_type": mime_type, "data": image_bytes}
+    models = _model_chain(VISION_MODEL_NAME, FALLBACK_VISION_MODEL_NAME)
+    return await _generate(models, [prompt, image_part], timeout or AI_VISION_TIMEOUT)
+
+
+def strip_markdown(content: str) -> str:
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]
+    elif content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return content.strip()
+
+
+def parse_json_response(content: str) -> dict:
+    try:
+        return json.loads(strip_markdown(content))
+    except json.JSONDecodeError as e:
+        raise AIClientError(f"Model returned invalid JSON: {e}")
@@ -0,0 +1,251 @@
+"""Rate limiter and circuit breaker state for model calls.
+
+ai_client asks this module before every model call whether the call may go
+ahead, and reports back how it ended. Two pieces of state are kept per model:
+
+* A token bucket refilled at the model's quota (AI_RATE_LIMIT_RPM, or a
+  per-model override in AI_RATE_LIMITS). A caller that finds the bucket empty
+  reserves the next token and sleeps until it is due, so bursts are spread out
+  instead of hitting the quota. A 429 from the backend halves the refill rate,
+  and every successful call wins back a twentieth of the configured rate. The
+  limiter therefore settles just under whatever the backend actually allows.
+* A circuit breaker. After AI_BREAKER_FAILURES consecutive transient failures
+  (429, 5xx, timeouts, connection errors), the model is considered down for
+  AI_BREAKER_COOLDOWN_SECONDS and calls fail at once. After the cooldown, a
+  single probe call is let through. Its success closes the breaker and its
+  failure opens it for another cooldown.
+
+The state lives in a SQLite database. With AI_GUARD_DB pointing at a file,
+every worker on the host shares one bucket and one breaker per model, and a
+limit is the host's total. Without it, each worker keeps its own state in
+memory, so each worker gets the whole limit. Lookups are a few microseconds
+and run in a thread. If the state database cannot be used, calls go ahead
+unguarded rather than failing.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+AI_GUARD_DB = os.getenv("AI_GUARD_DB", "")
+# Requests per minute per model; 0 disables rate limiting
+AI_RATE_LIMIT_RPM = float(os.getenv("AI_RATE_LIMIT_RPM", "0"))
+# Per-model overrides, e.g. "gemini-pro=60,gemini-1.5-flash=900"
+AI_RATE_LIMITS = os.getenv("AI_RATE_LIMITS", "")
+# Calls allowed back to back before the rate applies
+AI_RATE_LIMIT_BURST = float(os.getenv("AI_RATE_LIMIT_BURST", "5"))
+# Longest a call waits for a token before it is turned away
+AI_RATE_LIMIT_MAX_WAIT = float(os.getenv("AI_RATE_LIMIT_MAX_WAIT_SECONDS", "10"))
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))
+AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# The adaptive rate never drops below this share of the configured one
+MIN_RATE_SHARE = 0.1
+RECOVERY_STEPS = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    model TEXT PRIMARY KEY, tokens REAL NOT NULL, rate REAL NOT NULL, updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS breakers (
+    model TEXT PRIMARY KEY, failures INTEGER NOT NULL DEFAULT 0,
+    open_until REAL NOT NULL DEFAULT 0, probe_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def _parse_limits(value: str) -> dict:
+    limits = {}
+    for item in value.split(","):
+        name, _, rpm = item.partition("=")
+        if name.strip() and rpm.strip():
+            limits[name.strip()] = float(rpm)
+    return limits
+
+
+_limits = _parse_limits(AI_RATE_LIMITS)
+_conn = None
+_lock = threading.Lock()
+
+
+def configured_rate(model: str) -> float:
+    """Tokens per second for the model; 0 when it is not rate limited."""
+    return _limits.get(model, AI_RATE_LIMIT_RPM) / 60
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        if AI_GUARD_DB:
+            os.makedirs(os.path.dirname(os.path.abspath(AI_GUARD_DB)), exist_ok=True)
+        conn = sqlite3.connect(
+            AI_GUARD_DB or ":memory:", timeout=1.0, isolation_level=None, check_same_thread=False,
+        )
+        if AI_GUARD_DB:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # The state only matters while the host is up; losing the last writes in a crash is fine
+            conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(SCHEMA)
+        _conn = conn
+    return _conn
+
+
+def _transaction(fn, *args):
+    """Runs fn(conn, now, *args) in a write transaction shared with the other workers."""
+    with _lock:
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, time.time(), *args)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+async def _run(fn, *args, default=None):
+    try:
+        return await asyncio.to_thread(_transaction, fn, *args)
+    except sqlite3.Error as e:
+        print(f"KYSAI SYSTEM: AI guard state unavailable, call not guarded: {e}")
+        return default
+
+
+def _breaker_row(conn, model: str):
+    row = conn.execute("SELECT failures, open_until, probe_until FROM breakers WHERE model = ?", (model,)).fetchone()
+    return row or (0, 0.0, 0.0)
+
+
+def _admit(conn, now: float, model: str, probe_seconds: float) -> float:
+    failures, open_until, probe_until = _breaker_row(conn, model)
+    if open_until > now:
+        return open_until - now
+    if open_until:
+        # Half-open: exactly one probe at a time
+        if probe_until > now:
+            return probe_until - now
+        conn.execute(
+            "INSERT OR REPLACE INTO breakers (model, failures, open_until, probe_until) VALUES (?, ?, ?, ?)",
+            (model, failures, open_until, now + probe_seconds),
+        )
+    return 0.0
+
+
+async def admit(model: str, probe_seconds: float) -> float:
+    """0 if a call to the model may go ahead, otherwise the seconds until the breaker lets one through.
+
+    probe_seconds is how long a half-open breaker waits for the probe's result before allowing another.
+    """
+    return await _run(_admit, model, probe_seconds, default=0.0)
+
+
+def _reserve(conn, now: float, model: str, configured: float, max_wait: float) -> float:
+    row = conn.execute("SELECT tokens, rate, updated_at FROM buckets WHERE model = ?", (model,)).fetchone()
+    tokens, rate, updated_at = row or (AI_RATE_LIMIT_BURST, configured, now)
+    tokens = min(AI_RATE_LIMIT_BURST, tokens + max(now - updated_at, 0) * rate)
+    wait = max(1 - tokens, 0) / rate
+    if wait > max_wait:
+        # Turned away without taking a token, so the callers that wait are not pushed back
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (model, tokens, rate, updated_at) VALUES (?, ?, ?, ?)",
+            (model, tokens, rate, now),
+        )
+        return -wait
+    # A token that is not there yet is reserved by going below zero; the caller sleeps until it is due
+    conn.execute(
+        "INSERT OR REPLACE INTO buckets (model, tokens, rate, updated_at) VALUES (?, ?, ?, ?)",
+        (model, tokens - 1, rate, now),
+    )
+    return wait
+
+
+async def reserve(model: str, max_wait: float = None) -> float:
+    """Takes a token for one call: the seconds to sleep before calling, or a negative number if the wait
+    would exceed max_wait (default AI_RATE_LIMIT_MAX_WAIT). Its magnitude is the wait that was refused."""
+    configured = configured_rate(model)
+    if configured <= 0:
+        return 0.0
+    max_wait = AI_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+    return await _run(_reserve, model, configured, max_wait, default=0.0)
+
+
+def _record(conn, now: float, model: str, ok: bool, throttled: bool, configured: float) -> bool:
+    failures, open_until, _ = _breaker_row(conn, model)
+    opened = False
+    if ok:
+        failures, open_until = 0, 0.0
+    else:
+        failures += 1
+        # Failures of calls that started before the breaker opened don't extend the cooldown.
+        # A failed probe reopens it at once; otherwise it takes a run of failures.
+        if open_until <= now and (open_until or failures >= AI_BREAKER_FAILURES):
+            opened = True
+            open_until = now + AI_BREAKER_COOLDOWN
+    conn.execute(
+        "INSERT OR REPLACE INTO breakers (model, failures, open_until, probe_until) VALUES (?, ?, ?, 0)",
+        (model, failures, open_until),
+    )
+
+    if configured > 0 and (ok or throttled):
+        row = conn.execute("SELECT tokens, rate, updated_at FROM buckets WHERE model = ?", (model,)).fetchone()
+        if row is not None:
+            tokens, rate, updated_at = row
+            if throttled:
+                rate = max(rate / 2, configured * MIN_RATE_SHARE)
+                # Whatever was saved up is what the backend just refused
+                tokens = min(tokens, 0.0)
+            else:
+                rate = min(rate + configured / RECOVERY_STEPS, configured)
+            conn.execute(
+                "UPDATE buckets SET tokens = ?, rate = ? WHERE model = ?", (tokens, rate, model),
+            )
+    return opened
+
+
+async def record(model: str, ok: bool, throttled: bool = False) -> bool:
+    """Reports how a call ended. ok=False is for transient failures only; throttled marks a 429.
+
+    Returns True when this failure opened the breaker.
+    """
+    return await _run(_record, model, ok, throttled, configured_rate(model), default=False)
+
+
+def _snapshot(conn, now: float) -> dict:
+    models = {}
+    for model, failures, open_until, probe_until in conn.execute(
+        "SELECT model, failures, open_until, probe_until FROM breakers"
+    ):
+        state = "open" if open_until > now else "half_open" if open_until else "closed"
+        models[model] = {
+            "breaker": state,
+            "consecutive_failures": failures,
+            "retry_after": round(max(open_until - now, 0), 1),
+        }
+    for model, tokens, rate, updated_at in conn.execute("SELECT model, tokens, rate, updated_at FROM buckets"):
+        configured = configured_rate(model)
+        models.setdefault(model, {"breaker": "closed", "consecutive_failures": 0, "retry_after": 0})
+        models[model].update({
+            "tokens": round(min(AI_RATE_LIMIT_BURST, tokens + max(now - updated_at, 0) * rate), 2),
+            "rate_per_minute": round(rate * 60, 1),
+            "configured_rate_per_minute": round(configured * 60, 1),
+        })
+    return models
+
+
+async def stats() -> dict:
+    return {
+        "shared": bool(AI_GUARD_DB),
+        "breaker_failures": AI_BREAKER_FAILURES,
+        "breaker_cooldown_seconds": AI_BREAKER_COOLDOWN,
+        "models": await _run(_snapshot, default={}),
+    }
+
+
+def close():
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
@@ -0,0 +1,265 @@
+"""Cross-report root-cause analytics.
+
+Every cause in a report's D4 section (root, occurrence and escape causes plus
+the fishbone entries) is stored as a row in root_cause_entries when the report
+is saved. Each row carries a cluster key. To build the key, the cause is folded
+like search text, filler words are dropped, each word is cut to its first
+STEM_LENGTH characters and the stems are sorted. "Operatör eğitimi yetersiz"
+and "yetersiz operator egitimi" therefore share one key, and Turkish suffixes
+("kalibrasyonu", "kalibrasyonun") fall away. A "Why 1 -> ... -> Root: x" chain
+is clustered on x.
+
+Pareto rankings are then GROUP BY queries over that table. Only the top
+candidates per category reach Python, where keys whose stem sets overlap by at
+least ROOT_CAUSE_MERGE_THRESHOLD (Jaccard) are merged into one cluster. Results
+are cached per filter set. The cache key includes the table's highest id.
+Saving a report inserts fresh rows, so the next request recomputes. Rows that
+disappear with a deleted report age out after ANALYTICS_CACHE_SECONDS.
+"""
+import os
+import re
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import select, delete, func, distinct
+
+from app.models.analytics import RootCauseEntry
+from app.models.models import QualityReport
+from app.services import metrics, report_store
+from app.services.cache import TTLCache
+from app.services.search import fold
+
+ROOT_CAUSE_MERGE_THRESHOLD = float(os.getenv("ROOT_CAUSE_MERGE_THRESHOLD", "0.6"))
+ANALYTICS_CACHE_SECONDS = float(os.getenv("ANALYTICS_CACHE_SECONDS", "600"))
+
+STEM_LENGTH = 5
+# Clusters fetched per category before merging, as a multiple of the requested limit
+CANDIDATE_FACTOR = 4
+LABEL_SAMPLE = 200
+ROOT_CAUSE = "root_cause"
+CAUSE_KEYS = ("d4_root_causes", "d4_occurrence_causes", "d4_escape_causes")
+
+# Folded Turkish and English filler words
+STOPWORDS = frozenset(
+    "ve ile icin bir bu su o da de ki mi gibi daha cok az olan olarak oldu olmasi nedeniyle sonucu "
+    "veya ya yok var the a an of in on at to for and or is are was were be been not no due by with "
+    "from into than that this which".split()
+)
+
+FISHBONE_CATEGORIES = {
+    "man": "Man", "insan": "Man", "personel": "Man",
+    "machine": "Machine", "makine": "Machine", "ekipman": "Machine",
+    "material": "Material", "malzeme": "Material",
+    "method": "Method", "metot": "Method", "metod": "Method", "yontem": "Method",
+    "measurement": "Measurement", "olcum": "Measurement",
+    "environment": "Environment", "cevre": "Environment", "ortam": "Environment",
+}
+
+_WORD = re.compile(r"[^\W_]+")
+_ROOT_MARKER = re.compile(r"(?:root(?: cause)?|kok neden)\s*:")
+
+_results = TTLCache(max_entries=128, ttl_seconds=ANALYTICS_CACHE_SECONDS)
+
+
+def cause_text(value: str) -> str:
+    """The cause itself: the part after the last "Root:" marker of a why-chain, otherwise the whole text."""
+    value = " ".join(str(value).split())
+    # fold() keeps offsets, so positions in the folded text slice the original
+    markers = list(_ROOT_MARKER.finditer(fold(value)))
+    if markers and value[markers[-1].end():].strip():
+        value = value[markers[-1].end():].strip()
+    return value
+
+
+def cluster_key(value: str) -> str:
+    stems = {word[:STEM_LENGTH] for word in _WORD.findall(fold(cause_text(value))) if word not in STOPWORDS}
+    return " ".join(sorted(stems))[:255]
+
+
+def fishbone_category(name: str) -> str:
+    return FISHBONE_CATEGORIES.get(fold(str(name)).strip(), str(name).strip().title())
+
+
+def entries_for(report_id: int, organization_id, created_at: datetime, data: dict) -> list:
+    """root_cause_entries rows for one report; each cluster counts once per report and category."""
+    data = data or {}
+    causes = [(ROOT_CAUSE, c) for key in CAUSE_KEYS for c in data.get(key) or []]
+    for category, entries in (data.get("d4_fishbone") or {}).items():
+        causes.extend((fishbone_category(category), entry) for entry in entries or [])
+
+    rows, seen = [], set()
+    for category, value in causes:
+        key = cluster_key(value)
+        if not key or (category, key) in seen:
+            continue
+        seen.add((category, key))
+        rows.append({
+            "report_id": report_id, "organization_id": organization_id, "created_at": created_at,
+            "category": category, "cluster_key": key, "text": cause_text(value)[:500],
+        })
+    return rows
+
+
+async def index_reports(db, reports: list):
+    """Replaces the entries of [(report_id, organization_id, created_at, data)]; call in the writing transaction."""
+    if not reports:
+        return
+    await db.execute(delete(RootCauseEntry).where(RootCauseEntry.report_id.in_([r[0] for r in reports])))
+    rows = [row for report in reports for row in entries_for(*report)]
+    if rows:
+        await db.execute(RootCauseEntry.__table__.insert(), rows)
+
+
+async def index_report(db, report: QualityReport, data: dict):
+    # created_at comes back from the INSERT (eager_defaults); server_default=func.now() is UTC
+    created_at = report.created_at or datetime.now(timezone.utc).replace(microsecond=0)
+    await index_reports(db, [(report.id, report.organization_id, created_at, data)])
+
+
+async def rebuild(db, batch_size: int = 1000) -> int:
+    """Re-extracts the entries of every report; used to backfill an empty table."""
+    count = 0
+    last_id = 0
+    while True:
+        rows = (await db.execute(
+            select(QualityReport.id, QualityReport.organization_id, QualityReport.created_at)
+            .where(QualityReport.id > last_id)
+            .order_by(QualityReport.id)
+            .limit(batch_size)
+        )).all()
+        if not rows:
+            break
+        sections = await report_store.load_sections(db, [row.id for row in rows], keys=(*CAUSE_KEYS, "d4_fishbone"))
+        await index_reports(db, [
+            (row.id, row.organization_id, row.created_at or datetime.now(timezone.utc), sections[row.id])
+            for row in rows
+        ])
+        await db.commit()
+        count += len(rows)
+        last_id = rows[-1].id
+    return count
+
+
+async def ensure_entries(db):
+    """Backfills the table on first start after upgrading; a no-op once it has rows."""
+    has_entries = (await db.execute(select(RootCauseEntry.id).limit(1))).first()
+    if has_entries is not None:
+        return
+    has_reports = (await db.execute(select(QualityReport.id).limit(1))).first()
+    if has_reports is not None:
+        count = await rebuild(db)
+        print(f"KYSAI SYSTEM: Root cause entries backfilled from {count} reports.")
+
+
+def _filters(organization_id, since: date, until: date) -> list:
+    filters = []
+    if organization_id is not None:
+        filters.append(RootCauseEntry.organization_id == organization_id)
+    if since is not None:
+        filters.append(RootCauseEntry.created_at >= datetime.combine(since, time.min, timezone.utc))
+    if until is not None:
+        filters.append(RootCauseEntry.created_at < datetime.combine(until + timedelta(days=1), time.min, timezone.utc))
+    return filters
+
+
+def _merge(candidates: list) -> list:
+    """Folds candidate clusters [(key, count)], largest first, into the first earlier cluster they overlap."""
+    clusters = []
+    for key, count in candidates:
+        stems = set(key.split())
+        for cluster in clusters:
+            if len(stems & cluster["stems"]) / len(stems | cluster["stems"]) >= ROOT_CAUSE_MERGE_THRESHOLD:
+                cluster["count"] += count
+                cluster["keys"].append(key)
+                break
+        else:
+            clusters.append({"stems": stems, "count": count, "keys": [key]})
+    return sorted(clusters, key=lambda c: -c["count"])
+
+
+async def _compute(db, filters: list, limit: int) -> dict:
+    counts = (
+        select(RootCauseEntry.category, RootCauseEntry.cluster_key, func.count().label("n"))
+        .where(*filters)
+        .group_by(RootCauseEntry.category, RootCauseEntry.cluster_key)
+        .subquery()
+    )
+    ranked = select(
+        counts.c.category, counts.c.cluster_key, counts.c.n,
+        func.row_number().over(
+            partition_by=counts.c.category, order_by=(counts.c.n.desc(), counts.c.cluster_key),
+        ).label("rank"),
+    ).subquery()
+    candidates = (await db.execute(
+        select(ranked.c.category, ranked.c.cluster_key, ranked.c.n)
+        .where(ranked.c.rank <= limit * CANDIDATE_FACTOR)
+        .order_by(ranked.c.category, ranked.c.rank)
+    )).all()
+    totals = dict((await db.execute(
+        select(RootCauseEntry.category, func.count()).where(*filters).group_by(RootCauseEntry.category)
+    )).all())
+    reports = (await db.execute(select(func.count(distinct(RootCauseEntry.report_id))).where(*filters))).scalar() or 0
+
+    per_category = {}
+    for category, key, n in candidates:
+        per_category.setdefault(category, []).append((key, n))
+    top = {category: _merge(rows)[:limit] for category, rows in per_category.items()}
+
+    # The label is the most frequent wording among a cluster's latest LABEL_SAMPLE mentions. Counting
+    # every wording of the biggest clusters would read most of the table.
+    wordings = {}
+    for category, clusters in top.items():
+        for key in (key for cluster in clusters for key in cluster["keys"]):
+            latest = (await db.execute(
+                select(RootCauseEntry.text)
+                .where(*filters, RootCauseEntry.category == category, RootCauseEntry.cluster_key == key)
+                .order_by(RootCauseEntry.created_at.desc())
+                .limit(LABEL_SAMPLE)
+            )).scalars().all()
+            wordings[(category, key)] = [(n, value) for value, n in Counter(latest).items()]
+
+    def pareto(category: str) -> dict:
+        total = totals.get(category, 0)
+        items, cumulative = [], 0
+        for cluster in top.get(category, []):
+            variants = sorted(
+                (w for key in cluster["keys"] for w in wordings.get((category, key), [])), key=lambda w: (-w[0], w[1]),
+            )
+            cumulative += cluster["count"]
+            items.append({
+                "cluster": cluster["keys"][0],
+                "label": variants[0][1] if variants else cluster["keys"][0],
+                "count": cluster["count"],
+                "share": round(cluster["count"] / total, 4) if total else 0.0,
+                "cumulative_share": round(cumulative / total, 4) if total else 0.0,
+                "variants": [value for _, value in variants[1:4]],
+            })
+        return {"total": total, "items": items}
+
+    fishbone_order = list(dict.fromkeys(FISHBONE_CATEGORIES.values()))
+    extra = sorted(c for c in totals if c != ROOT_CAUSE and c not in fishbone_order)
+    return {
+        "reports": reports,
+        "root_causes": pareto(ROOT_CAUSE),
+        "fishbone": {c: pareto(c) for c in fishbone_order + extra if c in totals},
+    }
+
+
+async def root_cause_pareto(db, organization_id: int = None, since: date = None, until: date = None,
+                            limit: int = 10) -> dict:
+    """Pareto ranking of recurring D4 root causes and of each fishbone category's causes.
+
+    Counts are reports mentioning the cause; share and cumulative_share are relative to all
+    cause mentions of the category within the filters.
+    """
+    version = (await db.execute(select(func.max(RootCauseEntry.id)))).scalar()
+    cache_key = (organization_id, since, until, limit, version)
+    cached = _results.get(cache_key)
+    if cached is not None:
+        metrics.cache_lookups.labels("analytics", "memory_hit").inc()
+        return cached
+    metrics.cache_lookups.labels("analytics", "miss").inc()
+    with metrics.stage("analytics", "root_cause_pareto"):
+        result = await _compute(db, _filters(organization_id, since, until), limit)
+    _results.set(cache_key, result)
+    return result
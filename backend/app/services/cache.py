@@ -0,0 +1,166 @@
+"""Response caches for expensive AI results.
+
+TTLCache is a small in-process LRU with per-entry expiry. ResponseCache puts an
+optional database tier behind it so cached answers survive restarts and are
+shared by all workers pointing at the same database.
+"""
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select, delete, func
+
+from app.models.base import AsyncSessionLocal
+from app.models.cache import AIResponseCache
+from app.services import metrics
+
+
+class TTLCache:
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl_seconds: float = None):
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ResponseCache:
+    """Two-tier cache: in-process LRU first, then (optionally) the ai_response_cache table."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, namespace: str, max_entries: int, ttl_seconds: float,
+                 persist: bool = False, persist_max_entries: int = 10000):
+        self.namespace = namespace
+        self.memory = TTLCache(max_entries, ttl_seconds)
+        self.persist = persist
+        self.persist_max_entries = persist_max_entries
+        self.db_hits = 0
+        self.stores = 0
+        self.bypasses = 0
+
+    async def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            metrics.cache_lookups.labels(self.namespace, "memory_hit").inc()
+            return value
+        if not self.persist:
+            metrics.cache_lookups.labels(self.namespace, "miss").inc()
+            return None
+
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(AIResponseCache.payload, AIResponseCache.expires_at)
+                    .where(AIResponseCache.key == key, AIResponseCache.namespace == self.namespace)
+                )
+                row = result.first()
+        except Exception as e:
+            print(f"Response cache lookup failed: {e}")
+            metrics.cache_lookups.labels(self.namespace, "error").inc()
+            return None
+
+        if row is None or row.expires_at < time.time():
+            metrics.cache_lookups.labels(self.namespace, "miss").inc()
+            return None
+        self.db_hits += 1
+        metrics.cache_lookups.labels(self.namespace, "db_hit").inc()
+        # Promote so the next lookup stays in memory
+        self.memory.set(key, row.payload, ttl_seconds=row.expires_at - time.time())
+        return row.payload
+
+    async def set(self, key: str, value):
+        self.memory.set(key, value)
+        self.stores += 1
+        if not self.persist:
+            return
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.merge(AIResponseCache(
+                    key=key,
+                    namespace=self.namespace,
+                    payload=value,
+                    expires_at=time.time() + self.memory.ttl_seconds,
+                ))
+                if self.stores % self.PRUNE_EVERY == 0:
+                    await self._prune(db)
+                await db.commit()
+        except Exception as e:
+            # The cache is an optimization; never fail the request over it
+            print(f"Response cache store failed: {e}")
+
+    async def _prune(self, db):
+        await db.execute(delete(AIResponseCache).where(AIResponseCache.expires_at < time.time()))
+        count = (await db.execute(
+            select(func.count()).select_from(AIResponseCache).where(AIResponseCache.namespace == self.namespace)
+        )).scalar() or 0
+        overflow = count - self.persist_max_entries
+        if overflow > 0:
+            oldest = (
+                select(AIResponseCache.key)
+                .where(AIResponseCache.namespace == self.namespace)
+                .order_by(AIResponseCache.expires_at)
+                .limit(overflow)
+            )
+            await db.execute(delete(AIResponseCache).where(AIResponseCache.key.in_(oldest)))
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        hits = memory["hits"] + self.db_hits
+        lookups = memory["hits"] + memory["misses"]
+        return {
+            "namespace": self.namespace,
+            "memory": memory,
+            "persistent": self.persist,
+            "db_hits": self.db_hits,
+            "misses": lookups - hits,
+            "stores": self.stores,
+            "bypasses": self.bypasses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,367 @@
+"""8D report generation shared by the blocking and streaming endpoints."""
+import hashlib
+import json
+import os
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.base import AsyncSessionLocal
+from app.models.models import QualityReport, ReportType, IdempotencyRecord
+from app.schemas.ai import EightDGenerationRequest, EightDGenerationResponse
+from app.services import ai_client, analytics, metrics, report_store, search, similarity, stats
+from app.services.write_batch import writes
+from app.services.cache import ResponseCache
+from app.services.json_stream import SectionStreamParser
+from app.services.singleflight import SingleFlight
+
+# Bump whenever build_prompt changes so cached answers from the old prompt are not reused
+PROMPT_VERSION = "2"
+
+response_cache = ResponseCache(
+    "8d",
+    max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "512")),
+    ttl_seconds=float(os.getenv("AI_CACHE_TTL_SECONDS", "86400")),
+    persist=os.getenv("AI_CACHE_PERSIST", "0") == "1",
+    persist_max_entries=int(os.getenv("AI_CACHE_PERSIST_MAX_ENTRIES", "10000")),
+)
+
+# Identical /generate-8d requests running at the same time in this worker share one generation
+inflight = SingleFlight()
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an Idempotency-Key is reused with a different request body."""
+
+# D1-D8 keys in the order the model is asked to produce them
+SECTION_KEYS = [
+    "d1_team",
+    "d2_problem",
+    "d3_interim_actions",
+    "d4_occurrence_causes",
+    "d4_escape_causes",
+    "d4_root_causes",
+    "d4_fishbone",
+    "d5_chosen_pca",
+    "d6_implemented_pca",
+    "d7_prevention",
+    "d8_recognition",
+]
+
+
+def build_prompt(request: EightDGenerationRequest) -> str:
+    lang_instruction = ""
+    if request.language == 'tr':
+        lang_instruction = """
+        **CRITICAL: OUTPUT LANGUAGE MUST BE TURKISH**
+        CEVAP DİLİ SADECE VE SADECE TÜRKÇE OLMALIDIR.
+        - Provide ALL findings, analysis, root causes, and actions in TURKISH.
+        - Do NOT return any English text for values.
+        - JSON Keys must remain in English (e.g., "d1_team"), but ALL VALUES must be Turkish.
+        - Example: "d3_interim_actions": ["Üretim durduruldu.", "Parçalar ayrıldı."]
+        """
+
+    return f"""
+    Act as a **Senior Quality Engineer and IATF 16949 Lead Auditor** in the {request.industry_context} industry.
+
+    {lang_instruction}
+
+    **Goal**: Generate a technical 8D Problem Solving Report (D1-D8).
+
+    **Problem Description**:
+    "{request.problem_description}"
+
+    **ENGINEERING CONTEXT RULES (STRICT)**:
+    1. **Material Specificity**: If **10.9 Bolts** or **Plating** is mentioned, you MUST check for **Hydrogen Embrittlement**.
+    2. **Actionable D3**: Interim actions must be physical (e.g., "Wedge Test", "Sort", "Quarantine").
+    3. **Dual Root Cause**: Analyze both **Occurrence** (Process) and **Escape** (Detection).
+
+    **OUTPUT FORMAT (JSON ONLY)**:
+    {{
+        "d1_team": ["Role: Name", "Role: Name"],
+        "d2_problem": "Refined problem statement...",
+        "d3_interim_actions": ["Action 1", "Action 2"],
+        "d4_occurrence_causes": ["Why 1...", "Root Cause: ..."],
+        "d4_escape_causes": ["Why 1...", "Root Cause: ..."],
+        "d4_root_causes": ["Summary of Root Cause"],
+        "d4_fishbone": {{ "Man": [], "Machine": [], "Material": [], "Method": [], "Measurement": [], "Environment": [] }},
+        "d5_chosen_pca": ["Permanent Corrective Action 1", "PCA 2"],
+        "d6_implemented_pca": ["Implemented Action 1", "Implemented Action 2"],
+        "d7_prevention": ["Systemic prevention action 1", "Prevention 2"],
+        "d8_recognition": ["Team recognition statement"]
+    }}
+    """
+
+
+def cache_key(request: EightDGenerationRequest) -> str:
+    """Content address of a request: identical problems map to the same key
+    regardless of casing or whitespace."""
+    normalized = [
+        PROMPT_VERSION,
+        " ".join(request.problem_description.split()).casefold(),
+        " ".join((request.industry_context or "").split()).casefold(),
+        (request.language or "en").strip().lower(),
+    ]
+    return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def _cached_sections(request: EightDGenerationRequest):
+    if not request.use_cache:
+        response_cache.bypasses += 1
+        metrics.cache_lookups.labels(response_cache.namespace, "bypass").inc()
+        return None
+    return await response_cache.get(cache_key(request))
+
+
+async def _reused_sections(request: EightDGenerationRequest, organization_id: int = None):
+    """Sections of the organization's nearest finalized report, if the caller opted in and it is close enough."""
+    if not request.reuse_similar:
+        return None
+    async with AsyncSessionLocal() as db:
+        report_id, score = await similarity.find_reusable(db, request.problem_description, organization_id)
+        if report_id is None:
+            return None
+        data = await report_store.load(db, report_id, keys=SECTION_KEYS)
+    if data is None:
+        return None
+    data.pop(report_store.SUMMARY_KEY, None)
+    # D2 describes this problem, not the precedent's
+    data["d2_problem"] = request.problem_description
+    data["reused_from_report_id"] = report_id
+    data["reuse_similarity"] = round(score, 4)
+    return data
+
+
+async def _precomputed_sections(request: EightDGenerationRequest, organization_id: int = None):
+    cached = await _cached_sections(request)
+    if cached is not None:
+        return cached
+    return await _reused_sections(request, organization_id)
+
+
+def mock_sections(problem_description: str) -> dict:
+    # Development Mock - Hydrogen Embrittlement Case (EXPERT MODE)
+    return {
+        "d1_team": ["Project Lead: Ahmet Y.", "Quality: Mehmet K.", "Production: Ali R."],
+        "d2_problem": problem_description,
+        "d3_interim_actions": [
+            "Quarantine all bolts plated in batch #2023-WK45 (Suspect Lot).",
+            "Initiate 100% Wedge Tensile Testing per ISO 898-1 / ASTM F606.",
+            "Halt shipments to customer line 4 immediately."
+        ],
+        "d4_occurrence_causes": [
+             "Why 1: Hydrogen diffusion into steel matrix -> Why 2: Baking delay > 4 hours -> Root: Furnace log shows 6h delay; Furnace temperature uniformity poor (+/- 15°C deviation)."
+        ],
+        "d4_escape_causes": [
+            "Why 1: Embrittlement test passed -> Why 2: Sample size too small -> Root: Sampling plan (ASTM F519) not followed; only 3 pcs tested instead of required statistical sample."
+        ],
+        "d4_root_causes": ["Hydrogen Embrittlement due to post-plating process failure"],
+        "d4_fishbone": {
+            "Man": ["Operator loaded furnace late (Shift change)"],
+            "Machine": ["Baking furnace temp controller drift"],
+            "Material": ["10.9 Grade Steel (High Susceptibility to HE)"],
+            "Method": ["Delay between plating and baking > 4h"],
+            "Measurement": ["Tensile test sample size too low"],
+            "Environment": ["High humidity in plating line"]
+        },
+        "d5_chosen_pca": ["Install automated timer lockout on plating line.", "Upgrade furnace controller."],
+        "d6_implemented_pca": ["Timer lockout installed and verified.", "Furnace calibration completed."],
+        "d7_prevention": ["Update FMEA to include baking delay risk.", "Revise Control Plan for sampling."],
+        "d8_recognition": ["Team congratulated for rapid containment.", "Standard work updated."]
+    }
+
+
+def build_report_data(problem_description: str, data: dict) -> dict:
+    """Normalizes model output into the stored QualityReport.data layout."""
+    return {
+        "problem_description": problem_description,
+        "d1_team": data.get("d1_team", []),
+        "d2_problem": data.get("d2_problem", problem_description),
+        "d3_interim_actions": data.get("d3_interim_actions", []),
+        "d4_root_causes": data.get("d4_root_causes", []),
+        "d4_occurrence_causes": data.get("d4_occurrence_causes", []),
+        "d4_escape_causes": data.get("d4_escape_causes", []),
+        "d4_fishbone": data.get("d4_fishbone", {}),
+        "d5_chosen_pca": data.get("d5_chosen_pca", []),
+        "d6_implemented_pca": data.get("d6_implemented_pca", []),
+        "d7_prevention": data.get("d7_prevention", []),
+        "d8_recognition": data.get("d8_recognition", []),
+        **{key: data[key] for key in ("reused_from_report_id", "reuse_similarity") if key in data}
+    }
+
+
+async def generate_sections(request: EightDGenerationRequest, organization_id: int = None) -> dict:
+    """Returns the raw D1-D8 sections for a request (mock data without an API key)."""
+    if not ai_client.is_configured():
+        return mock_sections(request.problem_description)
+
+    precomputed = await _precomputed_sections(request, organization_id)
+    if precomputed is not None:
+        return precomputed
+
+    with metrics.stage("8d", "prompt_build"):
+        prompt = build_prompt(request)
+    with metrics.stage("8d", "llm_call"):
+        content = await ai_client.generate_text(prompt)
+    with metrics.stage("8d", "parse"):
+        data = ai_client.parse_json_response(content)
+    with metrics.stage("8d", "cache_store"):
+        await response_cache.set(cache_key(request), data)
+    return data
+
+
+async def stream_sections(request: EightDGenerationRequest, organization_id: int = None):
+    """Async generator of ("token", text) and ("section", (key, value)) events.
+
+    Finishes with a single ("complete", data) event carrying the full parsed
+    sections, so callers can persist exactly what the blocking endpoint would.
+    """
+    if not ai_client.is_configured():
+        data = mock_sections(request.problem_description)
+        for key in SECTION_KEYS:
+            yield "section", (key, data[key])
+        yield "complete", data
+        return
+
+    precomputed = await _precomputed_sections(request, organization_id)
+    if precomputed is not None:
+        for key in SECTION_KEYS:
+            if key in precomputed:
+                yield "section", (key, precomputed[key])
+        yield "complete", precomputed
+        return
+
+    with metrics.stage("8d_stream", "prompt_build"):
+        prompt = build_prompt(request)
+    parser = SectionStreamParser()
+    chunks = []
+    # Includes time the client takes to read each event, since the generator is paused meanwhile
+    with metrics.stage("8d_stream", "llm_call"):
+        async for text in ai_client.stream_text(prompt):
+            chunks.append(text)
+            yield "token", text
+            for key, value in parser.feed(text):
+                yield "section", (key, value)
+
+    try:
+        with metrics.stage("8d_stream", "parse"):
+            data = ai_client.parse_json_response("".join(chunks))
+    except ai_client.AIClientError:
+        # The stream may end with trailing noise the incremental parser already skipped
+        if not parser.sections:
+            raise
+        data = parser.sections
+    await response_cache.set(cache_key(request), data)
+    yield "complete", data
+
+
+def _stored_key(idempotency_key: str, organization_id: int = None) -> str:
+    # Keys are chosen by clients, so each organization gets its own key space
+    return idempotency_key if organization_id is None else f"{organization_id}:{idempotency_key}"
+
+
+async def _insert_report(db: AsyncSession, request: EightDGenerationRequest, report_data: dict,
+                         idempotency_key: str = None, organization_id: int = None):
+    """Write for save_report: (response, whether this call created the report)."""
+    try:
+        async with db.begin_nested():
+            new_report = QualityReport(
+                title=f"8D: {request.problem_description[:50]}...",
+                report_type=ReportType.EIGHT_D,
+                status="draft",
+                problem_description=report_data.get("problem_description"),
+                organization_id=organization_id,
+            )
+            db.add(new_report)
+            await db.flush()
+            await report_store.insert_sections(db, [(new_report.id, report_data)])
+            await search.index_report(db, new_report.id, new_report.title, report_data)
+            await stats.record_created(db, new_report)
+            await analytics.index_report(db, new_report, report_data)
+            if idempotency_key:
+                db.add(IdempotencyRecord(
+                    key=_stored_key(idempotency_key, organization_id), request_hash=cache_key(request),
+                    report_id=new_report.id,
+                ))
+                await db.flush()
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        existing = await find_idempotent_report(db, idempotency_key, request, organization_id)
+        if existing is None:
+            raise
+        return existing, False
+    return to_response(report_data, new_report.id), True
+
+
+async def save_report(request: EightDGenerationRequest, report_data: dict,
+                      idempotency_key: str = None, organization_id: int = None) -> EightDGenerationResponse:
+    """Inserts the report for the organization through the write batcher; with an idempotency key, records it
+    in the same transaction.
+
+    If another request stored the same key first, its report is returned instead.
+    """
+    def index_for_similarity(result):
+        response, created = result
+        if created:
+            similarity.index.on_report_saved(response.report_id, report_data, organization_id)
+
+    with metrics.stage("8d", "db_commit"):
+        response, _ = await writes.submit(
+            _insert_report, request, report_data, idempotency_key, organization_id,
+            after_commit=index_for_similarity,
+        )
+    return response
+
+
+async def find_idempotent_report(db: AsyncSession, idempotency_key: str, request: EightDGenerationRequest,
+                                 organization_id: int = None):
+    """The response for the report the organization already stored under the key, or None."""
+    result = await db.execute(
+        select(IdempotencyRecord).where(IdempotencyRecord.key == _stored_key(idempotency_key, organization_id))
+    )
+    record = result.scalar_one_or_none()
+    if record is None:
+        return None
+    if record.request_hash != cache_key(request):
+        raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+    data = await report_store.load(db, record.report_id)
+    return to_response(data, record.report_id) if data is not None else None
+
+
+async def generate_and_save(request: EightDGenerationRequest, idempotency_key: str = None,
+                            organization_id: int = None) -> EightDGenerationResponse:
+    # Uses its own session: with single-flight the work can outlive the request that started it
+    data = await generate_sections(request, organization_id)
+    report_data = build_report_data(request.problem_description, data)
+    return await save_report(request, report_data, idempotency_key, organization_id)
+
+
+def flight_key(request: EightDGenerationRequest, idempotency_key: str = None, organization_id: int = None) -> str:
+    """Single-flight key: identical requests of one organization share a generation and its saved report."""
+    key = cache_key(request)
+    if idempotency_key:
+        key = f"idem:{idempotency_key}:{key}"
+    if organization_id is not None:
+        key = f"org:{organization_id}:{key}"
+    return key
+
+
+def to_response(report_data: dict, report_id: int) -> EightDGenerationResponse:
+    # Safe Mapping for Response
+    return EightDGenerationResponse(
+        problem_description=report_data.get("problem_description", ""),
+        d1_team=report_data.get("d1_team", []),
+        d2_problem=report_data.get("d2_problem", ""),
+        d3_interim_actions=report_data.get("d3_interim_actions", []),
+        d4_root_causes=report_data.get("d4_root_causes", []),
+        d4_occurrence_causes=report_data.get("d4_occurrence_causes", []),
+        d4_escape_causes=report_data.get("d4_escape_causes", []),
+        d4_fishbone=report_data.get("d4_fishbone", {}),
+        d5_chosen_pca=report_data.get("d5_chosen_pca", []),
+        d6_implemented_pca=report_data.get("d6_implemented_pca", []),
+        d7_prevention=report_data.get("d7_prevention", []),
+        d8_recognition=report_data.get("d8_recognition", []),
+        report_id=report_id
+    )
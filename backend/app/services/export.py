@@ -0,0 +1,237 @@
+"""Bulk export of quality and HSE reports.
+
+Rows are read through a streaming result (server-side cursor on PostgreSQL)
+EXPORT_BATCH_SIZE at a time. Each batch is encoded and optionally gzipped
+before the next one is fetched, so memory stays flat however many reports
+match. The export runs in its own session, which lives exactly as long as
+the response body.
+
+NDJSON rows carry the stored data as is: each batch's sections come back from
+the database as JSON text (archived ones are decompressed) and are spliced into
+the lines without decoding. CSV and Parquet rows are flat: list sections are
+joined with newlines and nested values (the fishbone) are JSON text. Parquet
+needs pyarrow, which is optional; each batch is written as one row group and
+handed to the client as soon as it is encoded.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.models.base import AsyncSessionLocal
+from app.models.hse import HSEReport
+from app.models.models import QualityReport
+from app.services import metrics, report_store
+from app.services.eight_d import SECTION_KEYS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is unavailable; NDJSON and CSV still work
+    pa = pq = None
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Encoded bytes collected before a chunk is compressed and sent
+CHUNK_BYTES = 256 * 1024
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+QUALITY_COLUMNS = [
+    "id", "title", "report_type", "status", "organization_id", "author_id", "created_at", "updated_at",
+    "problem_description", *SECTION_KEYS, "technical_notes",
+]
+HSE_COLUMNS = [
+    "id", "status", "image_path", "non_conformities", "user_observations", "corrective_actions",
+    "organization_id", "author_id", "created_at", "updated_at",
+]
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def columns_for(dataset: str) -> list:
+    return QUALITY_COLUMNS if dataset == "quality" else HSE_COLUMNS
+
+
+def _quality_query(report_type, status, organization_id, since, until):
+    query = select(*QualityReport.__table__.c)
+    if report_type is not None:
+        query = query.where(QualityReport.report_type == report_type)
+    return _filtered(query, QualityReport, status, organization_id, since, until)
+
+
+def _hse_query(status, organization_id, since, until):
+    return _filtered(select(*HSEReport.__table__.c), HSEReport, status, organization_id, since, until)
+
+
+def _filtered(query, model, status, organization_id, since: date, until: date):
+    if status is not None:
+        query = query.where(model.status == status)
+    if organization_id is not None:
+        query = query.where(model.organization_id == organization_id)
+    if since is not None:
+        query = query.where(model.created_at >= datetime.combine(since, time.min, timezone.utc))
+    if until is not None:
+        query = query.where(model.created_at < datetime.combine(until + timedelta(days=1), time.min, timezone.utc))
+    return query.order_by(model.id)
+
+
+def _timestamp(value):
+    return value.isoformat() if value is not None else None
+
+
+def quality_record(report, data: str) -> dict:
+    return {
+        "id": report.id,
+        "title": report.title,
+        "report_type": getattr(report.report_type, "value", report.report_type),
+        "status": report.status,
+        "organization_id": report.organization_id,
+        "author_id": report.author_id,
+        "created_at": _timestamp(report.created_at),
+        "updated_at": _timestamp(report.updated_at),
+        "data": report_store.merge_json(report.problem_description, data),
+    }
+
+
+def hse_record(report, data=None) -> dict:
+    return {
+        "id": report.id,
+        "status": report.status,
+        "image_path": report.image_path,
+        "non_conformities": report.non_conformities or [],
+        "user_observations": report.user_observations,
+        "corrective_actions": report.corrective_actions or [],
+        "organization_id": report.organization_id,
+        "author_id": report.author_id,
+        "created_at": _timestamp(report.created_at),
+        "updated_at": _timestamp(report.updated_at),
+    }
+
+
+def _flat_value(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return "\n".join(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+def flat_record(record: dict, columns: list) -> dict:
+    """One CSV/Parquet row: report data keys become columns next to the report's own fields."""
+    data = record.get("data") or {}
+    if isinstance(data, str):
+        data = json.loads(data)
+    values = {**data, **{k: v for k, v in record.items() if k != "data"}}
+    return {column: _flat_value(values.get(column)) for column in columns}
+
+
+def _ndjson_line(record: dict) -> str:
+    data = record.get("data")
+    if not isinstance(data, str):
+        return json.dumps(record, ensure_ascii=False) + "\n"
+    fields = json.dumps({k: v for k, v in record.items() if k != "data"}, ensure_ascii=False)
+    return f'{fields[:-1]}, "data": {data}}}\n'
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file object that collects what pyarrow writes until it is drained."""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+class _Encoder:
+    def __init__(self, fmt: str, columns: list):
+        self.fmt = fmt
+        self.columns = columns
+        if fmt == "csv":
+            self._buffer = io.StringIO()
+            self._csv = csv.DictWriter(self._buffer, fieldnames=columns, lineterminator="\r\n")
+            self._csv.writeheader()
+        elif fmt == "parquet":
+            self._sink = _Sink()
+            self._schema = pa.schema([
+                (c, pa.int64() if c in ("id", "organization_id", "author_id") else pa.string()) for c in columns
+            ])
+            self._writer = pq.ParquetWriter(self._sink, self._schema, compression="zstd")
+
+    def encode(self, records: list) -> bytes:
+        if self.fmt == "ndjson":
+            return "".join(_ndjson_line(r) for r in records).encode("utf-8")
+        if self.fmt == "csv":
+            self._csv.writerows(flat_record(r, self.columns) for r in records)
+            text = self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+            return text.encode("utf-8")
+        rows = [flat_record(r, self.columns) for r in records]
+        table = pa.Table.from_pylist(rows, schema=self._schema)
+        self._writer.write_table(table, row_group_size=len(rows))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        if self.fmt == "parquet":
+            self._writer.close()
+            return self._sink.drain()
+        return b""
+
+
+async def stream_export(dataset: str, fmt: str, gzip: bool, report_type=None, status: str = None,
+                        organization_id: int = None, since: date = None, until: date = None):
+    """Yields the export file in chunks. Parquet is compressed internally and never gzipped."""
+    if dataset == "quality":
+        query, to_record = _quality_query(report_type, status, organization_id, since, until), quality_record
+    else:
+        query, to_record = _hse_query(status, organization_id, since, until), hse_record
+    encoder = _Encoder(fmt, columns_for(dataset))
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip and fmt != "parquet" else None
+    pending, pending_size, rows = [], 0, 0
+
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        # Plain rows rather than ORM objects: nothing is tracked by the session while the export runs
+        async for partition in result.partitions():
+            data = {}
+            if dataset == "quality":
+                # JSON text: NDJSON copies it through without a decode/encode round trip
+                data = await report_store.load_sections(db, [row.id for row in partition], as_json=True)
+            records = [to_record(row, data.get(row.id)) for row in partition]
+            rows += len(records)
+            chunk = encoder.encode(records)
+            pending.append(chunk)
+            pending_size += len(chunk)
+            if pending_size >= CHUNK_BYTES:
+                data = emit(b"".join(pending))
+                pending, pending_size = [], 0
+                if data:
+                    yield data
+    tail = emit(b"".join(pending) + encoder.finish())
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+    metrics.export_rows.labels(dataset, fmt).inc(rows)
@@ -0,0 +1,92 @@
+"""Vision analysis of HSE photos.
+
+Results are cached by the SHA-256 of the uploaded bytes, so re-submitting a
+photo that was already analyzed returns without decoding it or calling the
+vision model.
+"""
+import hashlib
+import os
+
+from app.services import ai_client, images, metrics
+from app.services.cache import ResponseCache
+from app.services.images import PreparedImage
+from app.services.uploads import StoredUpload
+
+# Bump when HSE_PROMPT changes so stale analyses are not served
+HSE_PROMPT_VERSION = "1"
+
+analysis_cache = ResponseCache(
+    "hse",
+    max_entries=int(os.getenv("HSE_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("HSE_CACHE_TTL_SECONDS", str(30 * 24 * 3600))),
+    persist=os.getenv("HSE_CACHE_PERSIST", "1") == "1",
+    persist_max_entries=int(os.getenv("HSE_CACHE_PERSIST_MAX_ENTRIES", "50000")),
+)
+
+HSE_PROMPT = """
+You are an expert HSE (Health, Safety, Environment) Auditor for ISO 45001. 
+Analyze this image for safety hazards, non-compliance, and risks.
+
+**OUTPUT LANGUAGE RULE**:
+If the request specifies Turkish or if you are unsure, provide details in **TURKISH** (Türkçe).
+"CEVAP DİLİ TÜRKÇE OLMALIDIR. Tüm bulguları, aksiyonları ve analizleri sadece Türkçe olarak yaz."
+
+RETURN ONLY VALID JSON. Do not use Markdown formatted code blocks.
+Format:
+{
+    "non_conformities": [
+        "Specific hazard seen in image...",
+        "Another issue..."
+    ],
+    "corrective_actions": [
+        "Action to fix hazard 1...",
+        "Action to fix hazard 2..."
+    ]
+}
+"""
+
+MOCK_ANALYSIS = {
+    "non_conformities": [
+        "Worker not wearing safety helmet (hard hat).",
+        "Trip hazard: Cable across the walkway.",
+        "Blocked emergency exit sign."
+    ],
+    "corrective_actions": [
+        "Enforce PPE policy immediately.",
+        "Secure cables with cable covers or tape.",
+        "Clear obstruction from emergency exit."
+    ],
+}
+
+
+async def analyze(image: PreparedImage) -> dict:
+    """Returns {"non_conformities": [...], "corrective_actions": [...]} for a prepared image."""
+    with metrics.stage("hse", "llm_call"):
+        content = await ai_client.generate_vision(HSE_PROMPT, image.data, image.mime_type)
+    with metrics.stage("hse", "parse"):
+        data = ai_client.parse_json_response(content)
+    return {
+        "non_conformities": data.get("non_conformities", ["Analysis completed but no specific text parsed."]),
+        "corrective_actions": data.get("corrective_actions", ["Review image manually."]),
+    }
+
+
+def cache_key(sha256: str) -> str:
+    # The model sees the downscaled image, so the resize setting is part of the key
+    raw = f"{HSE_PROMPT_VERSION}:{images.HSE_MODEL_MAX_DIMENSION}:{sha256}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def analyze_upload(stored: StoredUpload) -> dict:
+    """Cached analysis of a stored upload, including its thumbnail URL (None if unavailable)."""
+    key = cache_key(stored.sha256)
+    cached = await analysis_cache.get(key)
+    if cached is not None:
+        thumbnail = images.thumbnail_path_for(stored.path)
+        return {**cached, "thumbnail_path": images.url_for(thumbnail) if os.path.exists(thumbnail) else None}
+
+    with metrics.stage("hse", "image_prepare"):
+        prepared = await images.prepare_for_model(stored.path)
+    result = await analyze(prepared)
+    await analysis_cache.set(key, result)
+    return {**result, "thumbnail_path": images.url_for(prepared.thumbnail_path)}
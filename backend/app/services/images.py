@@ -0,0 +1,92 @@
+"""Image processing for HSE photos.
+
+Decoding, resizing and re-encoding run in a process pool, so neither the event
+loop nor the worker's memory holds a full-resolution 12 MP photo. The vision
+model only receives the downscaled, EXIF-free JPEG. Storing the upload itself
+is handled by app.services.uploads.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+UPLOAD_DIR = "static/uploads"
+THUMBNAIL_DIR = f"{UPLOAD_DIR}/thumbs"
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+HSE_MODEL_MAX_DIMENSION = int(os.getenv("HSE_MODEL_MAX_DIMENSION", "1600"))
+HSE_MODEL_JPEG_QUALITY = int(os.getenv("HSE_MODEL_JPEG_QUALITY", "85"))
+HSE_THUMBNAIL_DIMENSION = int(os.getenv("HSE_THUMBNAIL_DIMENSION", "320"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    thumbnail_path: str
+
+
+def url_for(path: str) -> str:
+    return "/" + path.replace(os.sep, "/")
+
+
+def _prepare(path: str, thumbnail_path: str, max_dimension: int, quality: int, thumbnail_dimension: int):
+    # Runs in a pool process; PIL is imported here so the API workers never load it for this path
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as img:
+        # Lets the JPEG decoder downscale by a power of two while decoding
+        img.draft("RGB", (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        # Saving without exif= drops all EXIF metadata (GPS, device, owner)
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=quality, optimize=True)
+
+        thumbnail = img.copy()
+        thumbnail.thumbnail((thumbnail_dimension, thumbnail_dimension), Image.LANCZOS)
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        thumbnail.save(thumbnail_path, "JPEG", quality=80, optimize=True)
+
+        return buffer.getvalue(), img.width, img.height
+
+
+_pool = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Created on first use, after gunicorn has forked the worker. Spawned children
+    # avoid inheriting the event loop and the SQLAlchemy engine.
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def thumbnail_path_for(path: str) -> str:
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{THUMBNAIL_DIR}/{name[:2]}/{name}.jpg"
+
+
+async def prepare_for_model(path: str) -> PreparedImage:
+    thumbnail_path = thumbnail_path_for(path)
+    loop = asyncio.get_running_loop()
+    data, width, height = await loop.run_in_executor(
+        _get_pool(), _prepare, path, thumbnail_path,
+        HSE_MODEL_MAX_DIMENSION, HSE_MODEL_JPEG_QUALITY, HSE_THUMBNAIL_DIMENSION,
+    )
+    return PreparedImage(data=data, mime_type="image/jpeg", width=width, height=height, thumbnail_path=thumbnail_path)
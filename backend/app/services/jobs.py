@@ -0,0 +1,225 @@
+"""Database-backed job queue for 8D generation.
+
+Jobs live in the generation_jobs table, so the queue needs no external broker
+and survives restarts. Each worker process runs JOB_WORKERS consumer tasks.
+A consumer claims a job with a conditional UPDATE (status still 'queued').
+That is atomic on SQLite and PostgreSQL alike, so several gunicorn workers can
+share one table without handing the same job out twice.
+"""
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+
+from sqlalchemy import select, update
+
+from app.models.base import AsyncSessionLocal
+from app.models.jobs import GenerationJob, JobStatus
+from app.schemas.ai import EightDGenerationRequest
+from app.services import ai_client, eight_d
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# A running job whose worker has not finished it in this long is assumed lost: requeued, or failed
+# once it has used up its attempts (a job that kills or hangs its worker would otherwise loop forever)
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "300"))
+
+
+class JobQueue:
+    def __init__(self):
+        self.worker_id = None
+        self._tasks = []
+        self._wakeup = None
+        self._changed = {}
+
+    async def enqueue(self, request: EightDGenerationRequest, organization_id: int = None) -> GenerationJob:
+        job = GenerationJob(
+            id=uuid.uuid4().hex,
+            kind="8d",
+            status=JobStatus.QUEUED,
+            stage="queued",
+            progress=0,
+            payload=request.model_dump(),
+            organization_id=organization_id,
+            max_attempts=JOB_MAX_ATTEMPTS,
+            run_after=0,
+        )
+        async with AsyncSessionLocal() as db:
+            db.add(job)
+            await db.commit()
+            await db.refresh(job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str, organization_id: int = None):
+        """The job, or None; with organization_id, also None for another organization's job."""
+        async with AsyncSessionLocal() as db:
+            job = await db.get(GenerationJob, job_id)
+        if job is not None and organization_id is not None and job.organization_id != organization_id:
+            return None
+        return job
+
+    async def wait_for_change(self, job_id: str, timeout: float):
+        """Waits until this process updates the job, or the timeout passes.
+
+        Jobs handled by another worker process are only seen by re-reading the
+        row, so callers should poll with a short timeout.
+        """
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            event.clear()
+
+    def forget(self, job_id: str):
+        self._changed.pop(job_id, None)
+
+    def start(self):
+        if self._tasks or JOB_WORKERS <= 0:
+            return
+        # Taken at start, not import: with gunicorn --preload the module is imported by the master
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._consume(i)) for i in range(JOB_WORKERS)]
+        print(f"KYSAI SYSTEM: Job queue started with {JOB_WORKERS} consumers ({self.worker_id}).")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _consume(self, n: int):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job queue claim failed: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _claim(self):
+        now = time.time()
+        async with AsyncSessionLocal() as db:
+            stale = (GenerationJob.status == JobStatus.RUNNING, GenerationJob.locked_at < now - JOB_STALE_SECONDS)
+            await db.execute(
+                update(GenerationJob)
+                .where(*stale, GenerationJob.attempts >= GenerationJob.max_attempts)
+                .values(status=JobStatus.FAILED, stage="done", error="worker lost", locked_by=None, locked_at=None)
+            )
+            await db.execute(
+                update(GenerationJob)
+                .where(*stale, GenerationJob.attempts < GenerationJob.max_attempts)
+                .values(status=JobStatus.QUEUED, stage="queued", locked_by=None, locked_at=None)
+            )
+            await db.commit()
+
+            candidates = (await db.execute(
+                select(GenerationJob.id)
+                .where(GenerationJob.status == JobStatus.QUEUED, GenerationJob.run_after <= now)
+                .order_by(GenerationJob.created_at)
+                .limit(JOB_WORKERS)
+            )).scalars().all()
+
+            for job_id in candidates:
+                result = await db.execute(
+                    update(GenerationJob)
+                    .where(GenerationJob.id == job_id, GenerationJob.status == JobStatus.QUEUED)
+                    .values(
+                        status=JobStatus.RUNNING,
+                        stage="generating",
+                        progress=10,
+                        locked_by=self.worker_id,
+                        locked_at=now,
+                        attempts=GenerationJob.attempts + 1,
+                    )
+                )
+                await db.commit()
+                if result.rowcount == 1:
+                    # Someone else may have claimed the other candidates meanwhile; one is enough
+                    return await db.get(GenerationJob, job_id, populate_existing=True)
+        return None
+
+    async def _update(self, job_id: str, **values):
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(GenerationJob).where(GenerationJob.id == job_id).values(**values))
+            await db.commit()
+        self._notify(job_id)
+
+    async def _run(self, job: GenerationJob):
+        self._notify(job.id)
+        # The report is saved under a key of the job's own: a generation that outlives a cancelled or lost
+        # attempt (single-flight shields it) still saves just one report, and the next attempt picks it up
+        idempotency_key = f"job:{job.id}"
+        try:
+            request = EightDGenerationRequest(**job.payload)
+            response = None
+            if job.attempts > 1:
+                async with AsyncSessionLocal() as db:
+                    response = await eight_d.find_idempotent_report(
+                        db, idempotency_key, request, job.organization_id,
+                    )
+            if response is None:
+                response = await eight_d.inflight.do(
+                    eight_d.flight_key(request, idempotency_key, job.organization_id),
+                    lambda: self._generate_and_save(job, request, idempotency_key),
+                )
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back instead of leaving it locked until it goes stale
+            await asyncio.shield(self._update(
+                job.id, status=JobStatus.QUEUED, stage="queued", progress=0, locked_by=None, locked_at=None,
+            ))
+            raise
+        except Exception as e:
+            print(f"Job {job.id} attempt {job.attempts} failed: {e}")
+            if job.attempts < job.max_attempts:
+                # Exponential backoff with jitter so a burst of failures doesn't retry in lockstep
+                delay = JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1)) * random.uniform(0.8, 1.2)
+                if isinstance(e, ai_client.AIUnavailableError):
+                    # No point retrying before the rate limiter or circuit breaker lets calls through again
+                    delay = max(delay, e.retry_after)
+                await self._update(
+                    job.id, status=JobStatus.QUEUED, stage="retrying", progress=0, error=str(e),
+                    run_after=time.time() + delay, locked_by=None, locked_at=None,
+                )
+            else:
+                await self._update(job.id, status=JobStatus.FAILED, stage="done", error=str(e), locked_by=None)
+            return
+
+        await self._update(
+            job.id, status=JobStatus.SUCCEEDED, stage="done", progress=100, error=None,
+            report_id=response.report_id, locked_by=None,
+        )
+
+    async def _generate_and_save(self, job: GenerationJob, request: EightDGenerationRequest, idempotency_key: str):
+        # eight_d.generate_and_save, with the job's stage moved on between the two steps
+        data = await eight_d.generate_sections(request, job.organization_id)
+        await self._update(job.id, stage="saving", progress=90)
+        report_data = eight_d.build_report_data(request.problem_description, data)
+        return await eight_d.save_report(request, report_data, idempotency_key, job.organization_id)
+
+    def _notify(self, job_id: str):
+        event = self._changed.get(job_id)
+        if event is not None:
+            event.set()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,78 @@
+"""Incremental parser for a streamed top-level JSON object.
+
+The model streams its 8D answer as one JSON object. Rather than waiting for the
+closing brace, SectionStreamParser watches the raw text and hands back each
+top-level "key": value member as soon as its value is complete.
+"""
+import json
+
+
+class SectionStreamParser:
+    def __init__(self):
+        self.sections = {}
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+        self._closed = False
+
+    def feed(self, text: str) -> list:
+        """Consumes more text and returns the (key, value) members it completed."""
+        completed = []
+        if self._closed:
+            return completed
+        self._buffer += text
+
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                # Skip markdown fences or chatter until the object opens
+                if ch == "{":
+                    self._depth = 1
+                    self._member_start = i + 1
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buffer[self._member_start:i], completed)
+                    self._closed = True
+                    break
+            elif ch == "," and self._depth == 1:
+                self._emit(buffer[self._member_start:i], completed)
+                self._member_start = i + 1
+            i += 1
+
+        # Keep only the unfinished member so the buffer stays small
+        if self._member_start is not None and not self._closed:
+            self._buffer = buffer[self._member_start:]
+            self._pos = i - self._member_start
+            self._member_start = 0
+        else:
+            self._buffer = ""
+            self._pos = 0
+        return completed
+
+    def _emit(self, fragment: str, completed: list):
+        if not fragment.strip():
+            return
+        try:
+            member = json.loads("{" + fragment + "}")
+        except json.JSONDecodeError:
+            return
+        for key, value in member.items():
+            self.sections[key] = value
+            completed.append((key, value))
@@ -0,0 +1,375 @@
+"""In-process metrics in the Prometheus text format, served at /metrics.
+
+Recording a sample is a dict lookup plus an addition (a bisect for histograms),
+cheap enough to leave on in production. No client library is needed.
+
+Each gunicorn worker keeps its own registry. With METRICS_DIR set, every worker
+periodically writes a snapshot there and /metrics merges all of them. Counters
+and histograms are summed across workers. Gauges get a `pid` label, and
+gauges from workers that stopped writing snapshots are dropped. Without
+METRICS_DIR, a scrape only sees the worker that served it.
+"""
+import asyncio
+import glob
+import json
+import os
+import time
+from bisect import bisect_left
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        registry.register(self)
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self):
+        return [(list(key), child.value()) for key, child in self._children.items()]
+
+    def snapshot(self) -> dict:
+        return {"kind": self.kind, "help": self.help, "labelnames": list(self.labelnames), "samples": self._samples()}
+
+
+class _Value:
+    __slots__ = ("_value",)
+
+    def __init__(self):
+        self._value = 0.0
+
+    def inc(self, amount: float = 1):
+        self._value += amount
+
+    def set(self, value: float):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("_buckets", "_counts", "_sum")
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # One slot per bucket plus +Inf; made cumulative only when rendering
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float):
+        self._counts[bisect_left(self._buckets, value)] += 1
+        self._sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def value(self):
+        return {"counts": list(self._counts), "sum": self._sum}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+
+    def add_collector(self, fn):
+        """fn() is called before every snapshot, to refresh gauges that are read rather than recorded."""
+        self._collectors.append(fn)
+
+    def snapshot(self) -> dict:
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+
+registry = Registry()
+
+
+def _label_str(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _render(snapshot: dict) -> str:
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labelnames"]
+        for values, value in metric["samples"]:
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_label_str(names, values)} {_format(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + [float("inf")], value["counts"]):
+                cumulative += count
+                le = 'le="' + _format(bound) + '"'
+                lines.append(f"{name}_bucket{_label_str(names, values, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_str(names, values)} {_format(value['sum'])}")
+            lines.append(f"{name}_count{_label_str(names, values)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _merge(snapshots: list) -> dict:
+    """Sums counters and histograms across workers; gauges are kept apart under a pid label."""
+    merged = {}
+    for pid, snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                labelnames = metric["labelnames"] + (["pid"] if metric["kind"] == "gauge" else [])
+                target = merged[name] = {**metric, "labelnames": labelnames, "samples": {}}
+            for values, value in metric["samples"]:
+                if metric["kind"] == "gauge":
+                    target["samples"][tuple(values) + (str(pid),)] = value
+                    continue
+                key = tuple(values)
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = value
+                elif metric["kind"] == "counter":
+                    target["samples"][key] = current + value
+                else:
+                    target["samples"][key] = {
+                        "counts": [a + b for a, b in zip(current["counts"], value["counts"])],
+                        "sum": current["sum"] + value["sum"],
+                    }
+    for metric in merged.values():
+        metric["samples"] = [(list(k), v) for k, v in metric["samples"].items()]
+    return merged
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def write_snapshot(snapshot: dict = None):
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot if snapshot is not None else registry.snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _read_snapshots() -> list:
+    snapshots = []
+    now = time.time()
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        pid = os.path.basename(path)[:-5]
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+            stale = now - os.path.getmtime(path) > 3 * METRICS_FLUSH_SECONDS
+        except (OSError, ValueError):
+            # Being replaced or removed right now
+            continue
+        if stale:
+            # A stopped worker's counters still count; its gauges no longer describe anything
+            snapshot = {name: m for name, m in snapshot.items() if m["kind"] != "gauge"}
+        snapshots.append((pid, snapshot))
+    return snapshots
+
+
+def render() -> str:
+    if not METRICS_DIR:
+        return _render(registry.snapshot())
+    write_snapshot()
+    return _render(_merge(_read_snapshots()))
+
+
+# --- Metrics recorded across the app ---
+
+http_requests = Histogram(
+    "kysai_http_request_duration_seconds", "HTTP request latency by route template, until the body is sent.",
+    ("method", "route", "status"),
+)
+stage_seconds = Histogram(
+    "kysai_stage_duration_seconds", "Time spent in each stage of an operation.",
+    ("operation", "stage"),
+)
+llm_requests = Counter("kysai_llm_requests_total", "Model calls by outcome.", ("model", "outcome"))
+llm_tokens = Counter("kysai_llm_tokens_total", "Tokens reported by the model API.", ("model", "direction"))
+llm_bytes = Counter("kysai_llm_bytes_total", "Payload bytes sent to and received from the model.", ("model", "direction"))
+llm_guard = Counter(
+    "kysai_llm_guard_total", "Model calls delayed, retried, refused or moved to a fallback model.", ("model", "event"),
+)
+cache_lookups = Counter("kysai_cache_lookups_total", "Response cache lookups by result.", ("namespace", "result"))
+export_rows = Counter("kysai_export_rows_total", "Reports written by bulk exports.", ("dataset", "format"))
+db_pool_wait = Histogram(
+    "kysai_db_pool_checkout_seconds", "Time to check a connection out of the pool, including connect.",
+    buckets=FAST_BUCKETS,
+)
+db_write_lock_wait = Histogram(
+    "kysai_db_write_lock_wait_seconds", "Time waiting for the SQLite write lock shared by all workers.",
+    buckets=FAST_BUCKETS + (2.5, 5, 10, 30),
+)
+write_batch_size = Histogram(
+    "kysai_write_batch_size", "Writes committed together by the write batcher.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+db_pool_connections = Gauge("kysai_db_pool_connections", "Pool connections by state.", ("state",))
+event_loop_lag = Histogram(
+    "kysai_event_loop_lag_seconds", "How late the event loop woke up a sleeping task.", buckets=FAST_BUCKETS,
+)
+event_loop_lag_last = Gauge("kysai_event_loop_lag_last_seconds", "Most recent event loop lag measurement.")
+
+
+def stage(operation: str, name: str):
+    """`with metrics.stage("8d", "llm_call"):` records the block's duration."""
+    return stage_seconds.labels(operation, name).time()
+
+
+def record_llm_call(model: str, outcome: str, sent_bytes: int = 0, received_bytes: int = 0, usage=None):
+    llm_requests.labels(model, outcome).inc()
+    if sent_bytes:
+        llm_bytes.labels(model, "sent").inc(sent_bytes)
+    if received_bytes:
+        llm_bytes.labels(model, "received").inc(received_bytes)
+    if usage is not None:
+        llm_tokens.labels(model, "prompt").inc(getattr(usage, "prompt_token_count", 0) or 0)
+        llm_tokens.labels(model, "completion").inc(getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def _route_template(scope) -> str:
+    # The router stores the matched route in the scope; templates keep the label set bounded.
+    # Newer FastAPI versions keep included routers nested and record the prefixed path separately.
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    path = getattr(context, "path", None) or getattr(scope.get("route"), "path", None)
+    return path or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses pass through untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests.labels(scope["method"], _route_template(scope), status["code"]).observe(
+                time.perf_counter() - start
+            )
+
+
+async def monitor_event_loop():
+    """Background task: measures event loop lag and flushes the snapshot for METRICS_DIR."""
+    loop = asyncio.get_running_loop()
+    last_flush = loop.time()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        lag = max(loop.time() - started - EVENT_LOOP_LAG_INTERVAL, 0.0)
+        event_loop_lag.observe(lag)
+        event_loop_lag_last.set(lag)
+        if METRICS_DIR and loop.time() - last_flush >= METRICS_FLUSH_SECONDS:
+            last_flush = loop.time()
+            try:
+                # Taken on the loop so no metric changes mid-copy; only the file write is threaded
+                await asyncio.to_thread(write_snapshot, registry.snapshot())
+            except Exception as e:
+                print(f"Metrics snapshot failed: {e}")
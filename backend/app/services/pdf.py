@@ -0,0 +1,439 @@
+"""Server-side PDF rendering of 8D and HSE reports.
+
+Layout follows the browser export (frontend/src/services/PdfService.ts). It
+uses the same Roboto font, stored as a TTF under app/assets/fonts and written
+by scripts/generate_font.js, so Turkish characters (ş, ğ, İ, ı, ...) render
+correctly. The fishbone is drawn as a table of categories, not as a picture of
+the diagram.
+
+Rendering is CPU-bound and runs in a process pool of PDF_WORKERS processes,
+so the API worker only reads rows and writes files. Rendered files are cached
+on disk under PDF_CACHE_DIR, keyed by report id, updated_at (created_at for
+reports that were never updated) and language. Editing a report therefore
+produces a new file; older versions of that report in the same language are
+deleted when the new one is stored. The other language's file and newer
+versions, which a concurrent request may be about to send, are left alone. Concurrent requests for the same file share one render.
+"""
+import asyncio
+import glob
+import io
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+from sqlalchemy import select
+
+from app.models.hse import HSEReport
+from app.models.models import QualityReport
+from app.services import metrics, report_store, uploads
+from app.services.singleflight import SingleFlight
+from app.services.tenancy import scoped
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "pdf_cache")
+PDF_BATCH_MAX_REPORTS = int(os.getenv("PDF_BATCH_MAX_REPORTS", "500"))
+# Largest side of HSE photos embedded in the PDF
+PDF_IMAGE_MAX_DIMENSION = 1200
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "fonts", "Roboto-Regular.ttf")
+
+LABELS = {
+    "en": {
+        "8d_title": "8D Problem Solving Report",
+        "hse_title": "HSE Audit Report",
+        "date": "Date",
+        "status": "Status",
+        "team": "D1 - Team Formation",
+        "team_members": "Team Members",
+        "problem": "D2 - Problem Description",
+        "interim": "D3 - Interim Containment Actions (ICA)",
+        "action": "Action Item",
+        "root_cause": "D4 - Root Cause Analysis (5-Why)",
+        "root_causes": "Root Cause",
+        "occurrence": "Occurrence Root Cause",
+        "escape": "Escape Root Cause (Why it was not detected)",
+        "fishbone": "Fishbone Diagram",
+        "chosen_pca": "D5 - Chosen Permanent Corrective Actions (PCA)",
+        "implemented_pca": "D6 - Implemented Permanent Corrective Actions",
+        "prevention": "D7 - Prevention of Recurrence",
+        "recognition": "D8 - Team Recognition",
+        "technical_notes": "Technical Notes",
+        "non_conformities": "Identified Non-Conformities",
+        "observations": "User Observations",
+        "corrective_actions": "Suggested Corrective Actions",
+    },
+    "tr": {
+        "8d_title": "8D Problem Çözme Raporu",
+        "hse_title": "İSG Denetim Raporu",
+        "date": "Tarih",
+        "status": "Durum",
+        "team": "D1 - Ekip Kurulumu",
+        "team_members": "Ekip Üyeleri",
+        "problem": "D2 - Problem Tanımı",
+        "interim": "D3 - Geçici Önlemler (ICA)",
+        "action": "Aksiyon",
+        "root_cause": "D4 - Kök Neden Analizi (5-Neden)",
+        "root_causes": "Kök Neden",
+        "occurrence": "Oluşum Kök Nedeni",
+        "escape": "Kaçış Kök Nedeni (Neden Yakalanmadı)",
+        "fishbone": "Balık Kılçığı Diyagramı",
+        "chosen_pca": "D5 - Seçilen Kalıcı Düzeltici Faaliyetler (KDF)",
+        "implemented_pca": "D6 - Uygulanan Kalıcı Düzeltici Faaliyetler",
+        "prevention": "D7 - Tekrarı Önleme (Sistemsel)",
+        "recognition": "D8 - Ekip Takdiri",
+        "technical_notes": "Teknik Notlar",
+        "non_conformities": "Tespit Edilen Uygunsuzluklar",
+        "observations": "Kullanıcı Gözlemleri",
+        "corrective_actions": "Önerilen Düzeltici Faaliyetler",
+    },
+}
+
+
+class ReportNotFound(Exception):
+    pass
+
+
+# --- Rendering (runs in the pool processes) ---
+
+_styles = None
+
+
+def _get_styles():
+    global _styles
+    if _styles is None:
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        pdfmetrics.registerFont(TTFont("Roboto", FONT_PATH))
+        _styles = {
+            "body": ParagraphStyle("body", fontName="Roboto", fontSize=10, leading=13),
+            "cell": ParagraphStyle("cell", fontName="Roboto", fontSize=9, leading=11.5),
+            "head": ParagraphStyle("head", fontName="Roboto", fontSize=9, leading=11.5, textColor="#ffffff"),
+            "heading": ParagraphStyle("heading", fontName="Roboto", fontSize=12, leading=15, spaceBefore=10, spaceAfter=4),
+            "title": ParagraphStyle("title", fontName="Roboto", fontSize=14, leading=18, textColor="#ffffff"),
+        }
+    return _styles
+
+
+def _text(value) -> str:
+    return escape(str(value)).replace("\n", "<br/>")
+
+
+def _items(value) -> list:
+    if not value:
+        return []
+    return [str(v) for v in value] if isinstance(value, list) else [str(value)]
+
+
+def _header(styles, product: str, title: str, meta: list, color: str):
+    from reportlab.platypus import Paragraph, Table, TableStyle
+
+    table = Table(
+        [[Paragraph(_text(product), styles["title"]), Paragraph(_text(title), styles["title"])],
+         [Paragraph(_text(m), styles["cell"]) for m in meta]],
+        colWidths=["60%", "40%"],
+    )
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), color),
+        ("GRID", (0, 0), (-1, -1), 0.25, "#c8c8c8"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("TOPPADDING", (0, 0), (-1, 0), 8),
+        ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
+    ]))
+    return table
+
+
+def _table(styles, head: list, rows: list, color: str, widths=None):
+    from reportlab.platypus import Paragraph, Table, TableStyle
+
+    data = [[Paragraph(_text(h), styles["head"]) for h in head]]
+    data += [[Paragraph(_text(cell), styles["cell"]) for cell in row] for row in rows]
+    table = Table(data, colWidths=widths, repeatRows=1)
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), color),
+        ("GRID", (0, 0), (-1, -1), 0.25, "#c8c8c8"),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), ["#ffffff", "#f5f5f5"]),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ]))
+    return table
+
+
+def _bullets(styles, items: list, mark: str = "•") -> list:
+    from reportlab.platypus import Paragraph
+
+    return [Paragraph(f"{mark} {_text(item)}", styles["body"]) for item in items]
+
+
+def _photo(image_path: str):
+    from PIL import Image as PILImage, ImageOps
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Image
+
+    with PILImage.open(image_path) as img:
+        img.draft("RGB", (PDF_IMAGE_MAX_DIMENSION, PDF_IMAGE_MAX_DIMENSION))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((PDF_IMAGE_MAX_DIMENSION, PDF_IMAGE_MAX_DIMENSION))
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=80)
+        width, height = img.size
+    buffer.seek(0)
+    scale = min(170 * mm / width, 110 * mm / height)
+    return Image(buffer, width=width * scale, height=height * scale)
+
+
+def _build(story: list, title: str) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate
+
+    def footer(canvas, doc):
+        canvas.saveState()
+        canvas.setFont("Roboto", 8)
+        canvas.setFillColor("#777777")
+        canvas.drawRightString(A4[0] - 14 * mm, 8 * mm, f"KYSAI · {doc.page}")
+        canvas.restoreState()
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, pagesize=A4, title=title, author="KYSAI",
+        leftMargin=14 * mm, rightMargin=14 * mm, topMargin=14 * mm, bottomMargin=14 * mm,
+    )
+    doc.build(story, onFirstPage=footer, onLaterPages=footer)
+    return buffer.getvalue()
+
+
+def render_8d(report: dict, lang: str) -> bytes:
+    from reportlab.platypus import Paragraph, Spacer
+
+    styles, t = _get_styles(), LABELS[lang]
+    data = report["data"] or {}
+    story = [
+        _header(styles, "KYSAI - Quality Management System", t["8d_title"],
+                [f"ID: #{report['id']}", f"{t['date']}: {report['date']} · {t['status']}: {report['status']}"],
+                "#1e293b"),
+        Spacer(1, 8),
+        Paragraph(_text(report["title"]), styles["heading"]),
+    ]
+    if _items(data.get("d1_team")):
+        story += [Paragraph(t["team"], styles["heading"]),
+                  _table(styles, [t["team_members"]], [[m] for m in _items(data["d1_team"])], "#64748b")]
+    story += [Paragraph(t["problem"], styles["heading"]),
+              Paragraph(_text(data.get("d2_problem") or data.get("problem_description") or ""), styles["body"])]
+    if _items(data.get("d3_interim_actions")):
+        story += [Paragraph(t["interim"], styles["heading"]),
+                  _table(styles, ["#", t["action"]],
+                         [[str(i), a] for i, a in enumerate(_items(data["d3_interim_actions"]), 1)],
+                         "#b7950b", widths=["8%", "92%"])]
+
+    causes = [(t["root_causes"], c, "ROOT") for c in _items(data.get("d4_root_causes"))]
+    causes += [(t["occurrence"], c, "OCC") for c in _items(data.get("d4_occurrence_causes"))]
+    causes += [(t["escape"], c, "ESC") for c in _items(data.get("d4_escape_causes"))]
+    if causes:
+        story += [Paragraph(t["root_cause"], styles["heading"]),
+                  _table(styles, ["", t["root_cause"]], [[kind, cause] for _, cause, kind in causes],
+                         "#c0392b", widths=["10%", "90%"])]
+    fishbone = {k: _items(v) for k, v in (data.get("d4_fishbone") or {}).items() if _items(v)}
+    if fishbone:
+        story += [Paragraph(t["fishbone"], styles["heading"]),
+                  _table(styles, ["6M", t["root_causes"]], [[k, "\n".join(v)] for k, v in fishbone.items()],
+                         "#8e44ad", widths=["20%", "80%"])]
+
+    for key, label, mark in (("d5_chosen_pca", "chosen_pca", "•"), ("d6_implemented_pca", "implemented_pca", "✓"),
+                             ("d7_prevention", "prevention", "•"), ("d8_recognition", "recognition", "•")):
+        if _items(data.get(key)):
+            story += [Paragraph(t[label], styles["heading"])] + _bullets(styles, _items(data[key]), mark)
+    if data.get("technical_notes"):
+        story += [Paragraph(t["technical_notes"], styles["heading"]),
+                  Paragraph(_text(data["technical_notes"]), styles["body"])]
+    return _build(story, report["title"])
+
+
+def render_hse(report: dict, lang: str) -> bytes:
+    from reportlab.platypus import Paragraph, Spacer, Table
+
+    styles, t = _get_styles(), LABELS[lang]
+    story = [
+        _header(styles, "KYSAI - HSE Audit Module", t["hse_title"],
+                [f"ID: #{report['id']}", f"{t['date']}: {report['date']} · {t['status']}: {report['status']}"],
+                "#dc3545"),
+        Spacer(1, 8),
+    ]
+    if report["image_file"] and os.path.exists(report["image_file"]):
+        story += [_photo(report["image_file"]), Spacer(1, 6)]
+    if _items(report["non_conformities"]):
+        story += [Paragraph(t["non_conformities"], styles["heading"]),
+                  _table(styles, ["#", t["non_conformities"]],
+                         [[str(i), n] for i, n in enumerate(_items(report["non_conformities"]), 1)],
+                         "#c0392b", widths=["8%", "92%"])]
+    if report["user_observations"]:
+        story += [Paragraph(t["observations"], styles["heading"]),
+                  Paragraph(_text(report["user_observations"]), styles["body"])]
+    if _items(report["corrective_actions"]):
+        story += [Paragraph(t["corrective_actions"], styles["heading"])]
+        story += _bullets(styles, _items(report["corrective_actions"]))
+    signatures = Table([["", ""], ["Auditor / Denetçi", "Responsible / Sorumlu"]], colWidths=["50%", "50%"],
+                       rowHeights=[40, None])
+    signatures.setStyle([("FONTNAME", (0, 0), (-1, -1), "Roboto"), ("FONTSIZE", (0, 0), (-1, -1), 9),
+                         ("LINEABOVE", (0, 1), (0, 1), 0.5, "#000000"), ("LINEABOVE", (1, 1), (1, 1), 0.5, "#000000"),
+                         ("LEFTPADDING", (0, 0), (-1, -1), 12), ("RIGHTPADDING", (0, 0), (-1, -1), 12)])
+    story += [Spacer(1, 24), signatures]
+    return _build(story, f"HSE #{report['id']}")
+
+
+def _render(kind: str, report: dict, lang: str) -> bytes:
+    return render_8d(report, lang) if kind == "8d" else render_hse(report, lang)
+
+
+# --- Pool, cache and queries (API workers) ---
+
+_pool = None
+_inflight = SingleFlight()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Same setup as the image pool: created after gunicorn forks, spawned children
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _version(row) -> str:
+    stamp = row.updated_at or row.created_at
+    version = stamp.strftime("%Y%m%d%H%M%S") if stamp else "0"
+    # 8D reports count their edits; two within the same second must not share a file
+    if "version" in row._fields:
+        version += f"v{row.version}"
+    return version
+
+
+def _version_order(version: str) -> tuple:
+    # "20261017120000v12" -> ("20261017120000", 12); the edit count must not compare as text
+    stamp, _, edits = version.partition("v")
+    return stamp, int(edits or 0)
+
+
+def cache_path(kind: str, report_id: int, version: str, lang: str) -> str:
+    return os.path.join(PDF_CACHE_DIR, kind, f"{report_id}-{version}-{lang}.pdf")
+
+
+def _store(path: str, pdf: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    report_id, version, lang = os.path.basename(path)[:-len(".pdf")].split("-")
+    for other in glob.glob(os.path.join(os.path.dirname(path), f"{report_id}-*-{lang}.pdf")):
+        other_version = os.path.basename(other).split("-")[1]
+        if _version_order(other_version) < _version_order(version):
+            try:
+                os.remove(other)
+            except FileNotFoundError:
+                pass
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as out:
+        out.write(pdf)
+    os.replace(tmp, path)
+
+
+def _payload(kind: str, row, data: dict) -> dict:
+    created = row.created_at.strftime("%Y-%m-%d") if row.created_at else ""
+    if kind == "8d":
+        return {"id": row.id, "title": row.title, "status": row.status, "date": created, "data": data}
+    return {
+        "id": row.id, "status": row.status, "date": created, "image_file": uploads.local_path(row.image_path),
+        "non_conformities": row.non_conformities, "user_observations": row.user_observations,
+        "corrective_actions": row.corrective_actions,
+    }
+
+
+async def _pdf_for_row(kind: str, row, lang: str, data: dict = None) -> str:
+    """Path of the cached PDF for a report row, rendering it first on a miss."""
+    path = cache_path(kind, row.id, _version(row), lang)
+    if os.path.exists(path):
+        metrics.cache_lookups.labels("pdf", "disk_hit").inc()
+        return path
+
+    async def render():
+        metrics.cache_lookups.labels("pdf", "miss").inc()
+        loop = asyncio.get_running_loop()
+        with metrics.stage(f"pdf_{kind}", "render"):
+            pdf = await loop.run_in_executor(_get_pool(), _render, kind, _payload(kind, row, data), lang)
+        await asyncio.to_thread(_store, path, pdf)
+        return path
+
+    return await _inflight.do(path, render)
+
+
+def _query(kind: str, ids: list, organization_id: int = None):
+    if kind == "8d":
+        columns = (QualityReport.id, QualityReport.title, QualityReport.status, QualityReport.problem_description,
+                   QualityReport.created_at, QualityReport.updated_at, QualityReport.version)
+        return scoped(select(*columns).where(QualityReport.id.in_(ids)), QualityReport, organization_id)
+    columns = (HSEReport.id, HSEReport.status, HSEReport.image_path, HSEReport.non_conformities,
+               HSEReport.user_observations, HSEReport.corrective_actions, HSEReport.created_at, HSEReport.updated_at)
+    return scoped(select(*columns).where(HSEReport.id.in_(ids)), HSEReport, organization_id)
+
+
+async def _report_data(db, kind: str, rows: list) -> dict:
+    """{report_id: data} for 8D rows; HSE rows carry everything they need."""
+    if kind != "8d":
+        return {}
+    sections = await report_store.load_sections(db, [row.id for row in rows])
+    return {row.id: report_store.merge(row.problem_description, sections[row.id]) for row in rows}
+
+
+async def report_pdf(db, kind: str, report_id: int, lang: str, organization_id: int = None) -> str:
+    """Path of the PDF for one report; raises ReportNotFound, also for another organization's report."""
+    row = (await db.execute(_query(kind, [report_id], organization_id))).first()
+    if row is None:
+        raise ReportNotFound(report_id)
+    data = await _report_data(db, kind, [row])
+    return await _pdf_for_row(kind, row, lang, data.get(row.id))
+
+
+def _write_zip(zip_path: str, kind: str, files: list, missing: list):
+    # PDFs are already compressed; storing them keeps zipping cheap
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as archive:
+        for report_id, path in files:
+            archive.write(path, f"{kind.upper()}-{report_id}.pdf")
+        if missing:
+            archive.writestr("missing.txt", "\n".join(str(i) for i in missing) + "\n")
+
+
+async def batch_zip(db, kind: str, report_ids: list, lang: str, organization_id: int = None) -> str:
+    """Renders the reports on all pool processes and zips them into a temporary file; the caller deletes it.
+
+    Reports of other organizations than organization_id are listed as missing.
+    """
+    report_ids = list(dict.fromkeys(report_ids))
+    rows = []
+    for start in range(0, len(report_ids), 500):
+        rows += (await db.execute(_query(kind, report_ids[start:start + 500], organization_id))).all()
+    if not rows:
+        raise ReportNotFound(report_ids)
+    # Read up front: the renders below run concurrently and can't share the session
+    data = await _report_data(db, kind, rows)
+
+    # Keeps every pool process busy without queueing the whole batch at once
+    limit = asyncio.Semaphore(PDF_WORKERS * 2)
+
+    async def one(row):
+        async with limit:
+            return row.id, await _pdf_for_row(kind, row, lang, data.get(row.id))
+
+    rendered = dict(await asyncio.gather(*(one(row) for row in rows)))
+    files = [(i, rendered[i]) for i in report_ids if i in rendered]
+    missing = [i for i in report_ids if i not in rendered]
+    fd, zip_path = tempfile.mkstemp(prefix="kysai-pdf-", suffix=".zip")
+    os.close(fd)
+    await asyncio.to_thread(_write_zip, zip_path, kind, files, missing)
+    return zip_path
@@ -0,0 +1,142 @@
+"""Read-through cache for the report detail response (GET /reports/{id}).
+
+Entries hold the response already serialized to JSON bytes, plus an ETag
+computed from those bytes. A repeat view is therefore one dictionary lookup
+with no query and no JSON encoding. A client that sends the ETag back in
+If-None-Match gets 304 and no body at all.
+
+Each worker keeps an in-process LRU (REPORT_CACHE_ENTRIES, REPORT_CACHE_SECONDS).
+With REPORT_CACHE_DIR set to a directory shared by the workers, serialized
+entries are also written there as files, one per report, and that tier is
+what makes invalidation exact across workers. invalidate() deletes the file.
+Every memory hit checks with one stat() that the file it was loaded from is
+still there and unchanged, so no worker serves a report another worker has
+just changed. Without the directory, invalidation only reaches the worker
+that made the write, and other workers can serve the old version until their
+entry expires. The same expiry bounds the one remaining race: a read that
+overlaps a write can store the version it read just after the write
+invalidated it.
+
+Entries also record the report's organization, so a hit can be checked
+against the request's organization (app.services.tenancy) without a query.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+
+from app.services import metrics
+from app.services.cache import TTLCache
+
+REPORT_CACHE_ENTRIES = int(os.getenv("REPORT_CACHE_ENTRIES", "2048"))
+REPORT_CACHE_SECONDS = float(os.getenv("REPORT_CACHE_SECONDS", "300"))
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "")
+
+
+@dataclass
+class CachedReport:
+    body: bytes
+    etag: str
+    organization_id: int = None
+    # (inode, mtime) of the shared-tier file this entry matches; None without a shared tier
+    version: tuple = None
+
+
+_memory = TTLCache(max_entries=REPORT_CACHE_ENTRIES, ttl_seconds=REPORT_CACHE_SECONDS)
+
+
+def serialize(payload: dict, organization_id: int = None) -> CachedReport:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    return CachedReport(body=body, etag=etag, organization_id=organization_id)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _path(report_id: int) -> str:
+    return os.path.join(REPORT_CACHE_DIR, f"{report_id % 256:02x}", f"{report_id}.json")
+
+
+def _version(stat) -> tuple:
+    # Every write is a new file (written aside, then renamed), so a replaced file has a new inode
+    # even when the filesystem's coarse mtime did not move
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _read_shared(report_id: int):
+    try:
+        with open(_path(report_id), "rb") as f:
+            version = _version(os.fstat(f.fileno()))
+            header, body = f.read().split(b"\n", 1)
+        # "<etag> <organization id, 0 for none>"; files written before organizations were recorded count as misses
+        etag, organization_id = header.decode().split(" ")
+    except (FileNotFoundError, ValueError):
+        return None
+    return CachedReport(body=body, etag=etag, organization_id=int(organization_id) or None, version=version)
+
+
+def _write_shared(report_id: int, entry: CachedReport):
+    path = _path(report_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as out:
+        out.write(f"{entry.etag} {entry.organization_id or 0}\n".encode() + entry.body)
+        entry.version = _version(os.fstat(out.fileno()))
+    os.replace(tmp, path)
+
+
+def get(report_id: int):
+    entry = _memory.get(report_id)
+    if entry is not None and REPORT_CACHE_DIR:
+        try:
+            current = _version(os.stat(_path(report_id)))
+        except FileNotFoundError:
+            current = None
+        if current != entry.version:
+            # Invalidated or replaced by another worker
+            _memory.delete(report_id)
+            entry = None
+    if entry is not None:
+        metrics.cache_lookups.labels("report", "memory_hit").inc()
+        return entry
+    if REPORT_CACHE_DIR:
+        entry = _read_shared(report_id)
+        if entry is not None:
+            metrics.cache_lookups.labels("report", "shared_hit").inc()
+            _memory.set(report_id, entry)
+            return entry
+    metrics.cache_lookups.labels("report", "miss").inc()
+    return None
+
+
+def store(report_id: int, payload: dict, organization_id: int = None) -> CachedReport:
+    entry = serialize(payload, organization_id)
+    if REPORT_CACHE_DIR:
+        try:
+            _write_shared(report_id, entry)
+        except OSError as e:
+            # Serve without caching rather than risk an entry other workers can't invalidate
+            print(f"KYSAI SYSTEM: Report cache write failed: {e}")
+            return entry
+    _memory.set(report_id, entry)
+    return entry
+
+
+def invalidate(report_id: int):
+    """Drops the cached response; call after committing any change to the report."""
+    _memory.delete(report_id)
+    if REPORT_CACHE_DIR:
+        try:
+            os.remove(_path(report_id))
+        except FileNotFoundError:
+            pass
+
+
+def stats() -> dict:
+    return {**_memory.stats(), "shared_dir": REPORT_CACHE_DIR or None}
@@ -0,0 +1,160 @@
+"""Partial updates of quality reports with optimistic concurrency.
+
+An edit names the report version it was based on and only the sections it
+changes (or single d4_fishbone categories). apply_changes() then:
+
+* reads the old values of just those sections, before the row is updated;
+* updates the quality_reports row through the ORM. QualityReport.version is
+  the mapper's version_id_col, so the UPDATE only matches while the row is
+  still at the expected version, and it increments the version. A lost race
+  matches no row and raises VersionConflict instead of overwriting the other
+  edit;
+* rewrites only the changed section rows (report_store.update_data) and
+  appends one report_changes row per changed section or category;
+* refreshes the search, analytics and stats entries the edit affects.
+
+Edits are committed through the write batcher, together with the other
+writes that arrive at the same time. An edit of one section writes one
+section row instead of the whole report.
+"""
+from sqlalchemy import select, func
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models.models import QualityReport
+from app.models.sections import ReportChange
+from app.services import analytics, report_cache, report_store, search, similarity, stats
+from app.services.tenancy import scoped
+from app.services.write_batch import writes
+
+FISHBONE_KEY = "d4_fishbone"
+
+
+class ReportNotFound(Exception):
+    pass
+
+
+class VersionConflict(Exception):
+    """The report changed since the version the edit was based on."""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Report is at version {current_version}")
+        self.current_version = current_version
+
+
+async def _current_version(db, report_id: int):
+    return (await db.execute(select(QualityReport.version).where(QualityReport.id == report_id))).scalar_one_or_none()
+
+
+async def apply_changes(report_id: int, version: int = None, sections: dict = None,
+                        fishbone_categories: dict = None, status: str = None, organization_id: int = None) -> int:
+    """Applies an edit and commits it; returns the report's new version.
+
+    sections maps section keys (or problem_description) to their new values;
+    fishbone_categories replaces the entries of single d4_fishbone categories.
+    version is the version the edit is based on; None means whatever is
+    current, which still guards against an edit committed while this one runs.
+    With organization_id, a report of another organization raises ReportNotFound.
+    Unchanged values are dropped, and an edit that changes nothing returns
+    the current version without writing.
+    """
+    def refresh_caches(result):
+        changed, text_data, report_organization_id = result[1:]
+        if changed:
+            report_cache.invalidate(report_id)
+        if text_data is not None:
+            similarity.index.on_report_saved(report_id, text_data, report_organization_id)
+
+    new_version, *_ = await writes.submit(
+        _apply, report_id, version, sections, fishbone_categories, status, organization_id,
+        after_commit=refresh_caches,
+    )
+    return new_version
+
+
+async def _apply(db, report_id: int, version, sections, fishbone_categories, status, organization_id):
+    """Write for apply_changes: (new version, whether anything changed, text for the similarity index,
+    the report's organization)."""
+    sections = dict(sections or {})
+    fishbone_categories = fishbone_categories or {}
+    query = scoped(select(QualityReport).where(QualityReport.id == report_id), QualityReport, organization_id)
+    report = (await db.execute(query)).scalar_one_or_none()
+    if report is None:
+        raise ReportNotFound(report_id)
+    if version is not None and version != report.version:
+        raise VersionConflict(report.version)
+
+    touched = set(sections) - {report_store.SUMMARY_KEY}
+    if fishbone_categories:
+        touched.add(FISHBONE_KEY)
+    old = (await report_store.load_sections(db, [report_id], keys=touched))[report_id] if touched else {}
+    old[report_store.SUMMARY_KEY] = report.problem_description
+
+    changes = {}
+    # (section, category, old value, new value) for the audit log
+    log = []
+    for key, value in sections.items():
+        if old.get(key) != value:
+            changes[key] = value
+            log.append((key, None, old.get(key), value))
+    if fishbone_categories:
+        fishbone = dict(changes.get(FISHBONE_KEY, old.get(FISHBONE_KEY)) or {})
+        for category, entries in fishbone_categories.items():
+            if fishbone.get(category) != entries:
+                log.append((FISHBONE_KEY, category, fishbone.get(category), entries))
+                fishbone[category] = entries
+        if fishbone != (old.get(FISHBONE_KEY) or {}):
+            changes[FISHBONE_KEY] = fishbone
+
+    previous_status = report.status
+    if status is not None and status != previous_status:
+        log.append(("status", None, previous_status, status))
+    if not log:
+        return report.version, False, None, report.organization_id
+
+    changed = set(changes)
+    # The versioned UPDATE: takes the row lock, or fails if another edit got there first
+    if report_store.SUMMARY_KEY in changes:
+        report.problem_description = changes.pop(report_store.SUMMARY_KEY)
+    if status is not None:
+        report.status = status
+    report.updated_at = func.now()
+    try:
+        async with db.begin_nested():
+            await db.flush()
+    except StaleDataError:
+        current = await _current_version(db, report_id)
+        if current is None:
+            raise ReportNotFound(report_id)
+        raise VersionConflict(current)
+    new_version = report.version
+
+    await report_store.update_data(db, report_id, changes)
+    await db.execute(ReportChange.__table__.insert(), [
+        {"report_id": report_id, "version": new_version, "section": section, "category": category,
+         "old_value": old_value, "new_value": new_value}
+        for section, category, old_value, new_value in log
+    ])
+
+    if changed & (set(search.INDEXED_SECTIONS) | {report_store.SUMMARY_KEY}):
+        indexed = await report_store.load_sections(db, [report_id], keys=search.INDEXED_SECTIONS)
+        data = report_store.merge(report.problem_description, indexed[report_id])
+        await search.index_report(db, report_id, report.title, data)
+        if changed & set(search.INDEXED_SECTIONS):
+            await analytics.index_reports(db, [(report_id, report.organization_id, report.created_at, data)])
+    await stats.record_status_change(db, report, previous_status)
+    text_data = None
+    if changed & (set(similarity.TEXT_SECTIONS) | {report_store.SUMMARY_KEY}):
+        text = await report_store.load_sections(db, [report_id], keys=similarity.TEXT_SECTIONS)
+        text_data = report_store.merge(report.problem_description, text[report_id])
+    return new_version, True, text_data, report.organization_id
+
+
+async def list_changes(db, report_id: int, after_version: int = 0, limit: int = 100) -> list:
+    """The report's audit log, oldest first, from the version after after_version."""
+    result = await db.execute(
+        select(ReportChange)
+        .where(ReportChange.report_id == report_id, ReportChange.version > after_version)
+        .order_by(ReportChange.version, ReportChange.id)
+        .limit(limit)
+    )
+    return result.scalars().all()
@@ -0,0 +1,262 @@
+"""Where report content lives: summary row, section rows and the compressed archive.
+
+A quality report is split across three tables:
+
+* quality_reports keeps the summary columns (title, type, status, organization,
+  problem_description, timestamps). Listings, dashboard stats and keyset pages
+  read only these short rows.
+* report_sections keeps one row per section (d1_team ... d8_recognition,
+  technical_notes, ...), so an edit rewrites only the sections it changes.
+* report_archive keeps all sections of a finalized report that has not changed
+  for REPORT_ARCHIVE_AFTER_DAYS, compressed into one value: zstd when the
+  optional zstandard package is installed, zlib otherwise. Archiving replaces
+  the report's section rows.
+
+The rest of the app works with the same data dict QualityReport.data used to
+hold: problem_description plus the sections. load() and load_many() assemble it
+from whichever tier holds the report, and update_data() moves an archived report
+back to section rows before changing it, so callers never see the tiers.
+"""
+import asyncio
+import json
+import os
+import random
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update, delete, exists, func, or_, and_, type_coerce, text, Text
+
+from app.models.base import AsyncSessionLocal, IS_SQLITE
+from app.models.models import QualityReport
+from app.models.sections import ReportSection, ReportArchive
+
+try:
+    import zstandard
+except ImportError:  # Archives are written with zlib; reading zstd archives written elsewhere needs the package
+    zstandard = None
+
+# Finalized reports unchanged for this many days are compressed into report_archive; 0 disables archiving
+REPORT_ARCHIVE_AFTER_DAYS = float(os.getenv("REPORT_ARCHIVE_AFTER_DAYS", "90"))
+REPORT_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("REPORT_ARCHIVE_INTERVAL_SECONDS", str(6 * 3600)))
+REPORT_ARCHIVE_BATCH_SIZE = int(os.getenv("REPORT_ARCHIVE_BATCH_SIZE", "500"))
+ZSTD_LEVEL = 9
+
+SUMMARY_KEY = "problem_description"
+# Report ids per IN (...) list
+_CHUNK = 500
+
+
+def split(data: dict) -> tuple:
+    """(problem_description, sections) of a report data dict."""
+    data = data or {}
+    return data.get(SUMMARY_KEY), {key: value for key, value in data.items() if key != SUMMARY_KEY}
+
+
+def merge(problem_description, sections: dict) -> dict:
+    data = {SUMMARY_KEY: problem_description} if problem_description is not None else {}
+    data.update(sections)
+    return data
+
+
+def compress(sections: dict) -> tuple:
+    """(codec, payload) for report_archive."""
+    raw = json.dumps(sections, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, 9)
+
+
+def decompress(codec: str, payload: bytes) -> str:
+    """The archived sections as JSON text."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Report is archived with zstd; install the zstandard package to read it")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        raw = zlib.decompress(payload)
+    return raw.decode("utf-8")
+
+
+def _chunks(ids: list):
+    for start in range(0, len(ids), _CHUNK):
+        yield ids[start:start + _CHUNK]
+
+
+async def insert_sections(db, reports: list):
+    """Section rows of new reports [(report_id, data)]; call in the transaction that inserts them."""
+    rows = [
+        {"report_id": report_id, "key": key, "value": value}
+        for report_id, data in reports for key, value in split(data)[1].items()
+    ]
+    if rows:
+        await db.execute(ReportSection.__table__.insert(), rows)
+
+
+async def restore(db, report_ids: list) -> int:
+    """Moves archived reports back to section rows; call in the writing transaction."""
+    restored = 0
+    for chunk in _chunks(list(report_ids)):
+        rows = (await db.execute(
+            select(ReportArchive.report_id, ReportArchive.codec, ReportArchive.payload)
+            .where(ReportArchive.report_id.in_(chunk))
+        )).all()
+        if not rows:
+            continue
+        await db.execute(delete(ReportArchive).where(ReportArchive.report_id.in_([r.report_id for r in rows])))
+        await insert_sections(db, [(r.report_id, json.loads(decompress(r.codec, r.payload))) for r in rows])
+        restored += len(rows)
+    return restored
+
+
+async def update_data(db, report_id: int, changes: dict):
+    """Sets some keys of an existing report's data; call in the writing transaction.
+
+    Only the given sections are rewritten. An archived report is restored first.
+    """
+    problem_description, sections = split(changes)
+    if SUMMARY_KEY in changes:
+        await db.execute(
+            update(QualityReport).where(QualityReport.id == report_id).values(problem_description=problem_description)
+        )
+    if not sections:
+        return
+    await restore(db, [report_id])
+    await db.execute(
+        delete(ReportSection).where(ReportSection.report_id == report_id, ReportSection.key.in_(list(sections)))
+    )
+    await insert_sections(db, [(report_id, sections)])
+
+
+def _grouped(db):
+    """One row per report: its section rows folded into a JSON object, as text."""
+    if db.get_bind().dialect.name == "postgresql":
+        sections = func.json_object_agg(ReportSection.key, ReportSection.value)
+    else:
+        sections = func.json_group_object(ReportSection.key, func.json(ReportSection.value))
+    return select(ReportSection.report_id, type_coerce(sections, Text).label("sections")).group_by(
+        ReportSection.report_id
+    )
+
+
+async def load_sections(db, report_ids, keys=None, as_json: bool = False) -> dict:
+    """{report_id: sections} from whichever tier holds each report.
+
+    keys limits the sections that are returned. With as_json, each report's
+    sections come back as JSON text, built by the database without decoding.
+    """
+    ids = list(report_ids)
+    found = {}
+    for chunk in _chunks(ids):
+        query = _grouped(db).where(ReportSection.report_id.in_(chunk))
+        if keys is not None:
+            query = query.where(ReportSection.key.in_(list(keys)))
+        found.update((row.report_id, row.sections) for row in await db.execute(query))
+        # Only reports without section rows can be in the archive
+        missing = [report_id for report_id in chunk if report_id not in found]
+        if not missing:
+            continue
+        archived = await db.execute(
+            select(ReportArchive.report_id, ReportArchive.codec, ReportArchive.payload)
+            .where(ReportArchive.report_id.in_(missing))
+        )
+        for row in archived:
+            text = decompress(row.codec, row.payload)
+            if keys is None:
+                found[row.report_id] = text
+            else:
+                values = json.loads(text)
+                found[row.report_id] = {key: values[key] for key in keys if key in values}
+
+    sections = {}
+    for report_id in ids:
+        value = found.get(report_id, "{}")
+        if as_json:
+            sections[report_id] = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        else:
+            sections[report_id] = json.loads(value) if isinstance(value, str) else value
+    return sections
+
+
+def merge_json(problem_description, sections_json: str) -> str:
+    """JSON text of a report's data from its problem_description and load_sections(as_json=True) text."""
+    if problem_description is None:
+        return sections_json
+    head = f'{{"{SUMMARY_KEY}":{json.dumps(problem_description, ensure_ascii=False)}'
+    return head + ("}" if sections_json == "{}" else "," + sections_json[1:])
+
+
+async def load_many(db, report_ids, keys=None) -> dict:
+    """{report_id: data} of the reports that exist; keys limits the sections, as in load_sections."""
+    summaries = {}
+    for chunk in _chunks(list(dict.fromkeys(report_ids))):
+        rows = await db.execute(
+            select(QualityReport.id, QualityReport.problem_description).where(QualityReport.id.in_(chunk))
+        )
+        summaries.update((row.id, row.problem_description) for row in rows)
+    sections = await load_sections(db, list(summaries), keys=keys)
+    return {report_id: merge(summaries[report_id], sections[report_id]) for report_id in summaries}
+
+
+async def load(db, report_id: int, keys=None):
+    """The report's data dict, or None if there is no such report."""
+    return (await load_many(db, [report_id], keys=keys)).get(report_id)
+
+
+async def archive_due(db, older_than_days: float = REPORT_ARCHIVE_AFTER_DAYS,
+                      batch_size: int = REPORT_ARCHIVE_BATCH_SIZE) -> int:
+    """Compresses finalized reports unchanged for older_than_days into report_archive; returns how many.
+
+    Each batch is one transaction that holds the reports' rows from the select to the commit, so an
+    edit committed meanwhile can't be archived over: it either commits first, and its report no longer
+    qualifies, or it waits and then moves the report back out of the archive.
+    """
+    if older_than_days <= 0:
+        return 0
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    archived = 0
+    while True:
+        if IS_SQLITE:
+            # pysqlite would only begin at the INSERT below, after the sections were read
+            await db.execute(text("BEGIN IMMEDIATE"))
+        ids = (await db.execute(
+            select(QualityReport.id)
+            .where(
+                QualityReport.status == "finalized",
+                or_(
+                    QualityReport.updated_at < cutoff,
+                    and_(QualityReport.updated_at.is_(None), QualityReport.created_at < cutoff),
+                ),
+                # Still in the hot tier
+                exists().where(ReportSection.report_id == QualityReport.id),
+            )
+            .order_by(QualityReport.id)
+            .limit(batch_size)
+            # PostgreSQL: edits update the quality_reports row first, so they wait for this batch
+            .with_for_update(of=QualityReport)
+        )).scalars().all()
+        if not ids:
+            await db.commit()
+            return archived
+        sections = await load_sections(db, ids)
+        rows = []
+        for report_id in ids:
+            codec, payload = compress(sections[report_id])
+            rows.append({"report_id": report_id, "codec": codec, "payload": payload})
+        # quality_reports is not touched, so updated_at (and the PDF and report caches keyed on it) stay valid
+        await db.execute(ReportArchive.__table__.insert(), rows)
+        await db.execute(delete(ReportSection).where(ReportSection.report_id.in_(ids)))
+        await db.commit()
+        archived += len(ids)
+
+
+async def run_periodic_archive():
+    """Background task started by the app; REPORT_ARCHIVE_INTERVAL_SECONDS=0 disables it."""
+    while True:
+        await asyncio.sleep(REPORT_ARCHIVE_INTERVAL_SECONDS * random.uniform(0.9, 1.1))
+        try:
+            async with AsyncSessionLocal() as db:
+                count = await archive_due(db)
+            if count:
+                print(f"KYSAI SYSTEM: Archived {count} finalized reports.")
+        except Exception as e:
+            print(f"KYSAI SYSTEM: Report archiving failed: {e}")
@@ -0,0 +1,230 @@
+"""Full-text search over 8D reports.
+
+SQLite uses an FTS5 virtual table (report_search) keyed by the report id.
+PostgreSQL uses a report_search table with a weighted tsvector column and a GIN
+index. Both index title, problem description, D4 root causes (summary,
+occurrence and escape) and fishbone entries.
+
+Text is folded in Python before indexing and querying. This is Turkish-aware
+lowercasing (İ/I/ı/i all become i) plus removal of Turkish diacritics (ş->s,
+ğ->g, ç->c, ö->o, ü->u), so "ISIL İŞLEM", "ısıl işlem" and "isil islem" match
+each other. The fold maps every character to exactly one character, so match
+offsets found in folded text point at the same characters in the original.
+Snippets are therefore highlighted on the original text.
+"""
+import html
+import re
+
+from sqlalchemy import text, select
+
+from app.models.models import QualityReport
+from app.services import report_store
+
+_TURKISH_FOLD = str.maketrans({
+    "İ": "i", "I": "i", "ı": "i", "î": "i", "Î": "i",
+    "Ş": "s", "ş": "s",
+    "Ğ": "g", "ğ": "g",
+    "Ç": "c", "ç": "c",
+    "Ö": "o", "ö": "o",
+    "Ü": "u", "ü": "u", "û": "u", "Û": "u",
+    "Â": "a", "â": "a",
+})
+
+_WORD = re.compile(r"\w+")
+
+FIELDS = ("title", "problem", "root_causes", "fishbone")
+SNIPPET_WIDTH = 160
+
+
+def fold(value: str) -> str:
+    value = value.translate(_TURKISH_FOLD)
+    # str.lower() can change length (e.g. U+0130); keep such characters as-is to preserve offsets
+    return "".join(ch if len(ch.lower()) != 1 else ch.lower() for ch in value)
+
+
+def query_terms(query: str) -> list:
+    return _WORD.findall(fold(query))
+
+
+# Sections document_for() reads besides problem_description
+INDEXED_SECTIONS = ("d4_root_causes", "d4_occurrence_causes", "d4_escape_causes", "d4_fishbone")
+
+
+def document_for(title: str, data: dict) -> dict:
+    """The searchable text of a report, per field, in original casing."""
+    data = data or {}
+    causes = []
+    for key in ("d4_root_causes", "d4_occurrence_causes", "d4_escape_causes"):
+        causes.extend(str(c) for c in data.get(key) or [])
+    fishbone = []
+    for category, entries in (data.get("d4_fishbone") or {}).items():
+        fishbone.extend(f"{category}: {entry}" for entry in entries or [])
+    return {
+        "title": title or "",
+        "problem": str(data.get("problem_description") or ""),
+        "root_causes": "\n".join(causes),
+        "fishbone": "\n".join(fishbone),
+    }
+
+
+def _is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+def create_search_schema(conn):
+    """Creates the dialect-specific index. Runs on a sync connection (conn.run_sync)."""
+    if _is_postgres(conn):
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS report_search ("
+            " report_id INTEGER PRIMARY KEY REFERENCES quality_reports(id) ON DELETE CASCADE,"
+            " document tsvector NOT NULL)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_report_search_document ON report_search USING GIN (document)"
+        ))
+    elif conn.dialect.name == "sqlite":
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS report_search USING fts5("
+            "title, problem, root_causes, fishbone, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+
+
+async def index_report(db, report_id: int, title: str, data: dict):
+    """Adds or replaces a report in the index. Call inside the transaction that writes the report."""
+    await index_reports(db, [(report_id, title, data)])
+
+
+async def index_reports(db, reports: list):
+    """Bulk form of index_report for [(report_id, title, data)]; one executemany per statement."""
+    if not reports:
+        return
+    params = [
+        {"id": report_id, **{field: fold(value) for field, value in document_for(title, data).items()}}
+        for report_id, title, data in reports
+    ]
+    bind = db.get_bind()
+    if _is_postgres(bind):
+        await db.execute(text(
+            "INSERT INTO report_search (report_id, document) VALUES (:id,"
+            " setweight(to_tsvector('simple', :title), 'A') ||"
+            " setweight(to_tsvector('simple', :problem), 'B') ||"
+            " setweight(to_tsvector('simple', :root_causes), 'C') ||"
+            " setweight(to_tsvector('simple', :fishbone), 'D'))"
+            " ON CONFLICT (report_id) DO UPDATE SET document = EXCLUDED.document"
+        ), params)
+    elif bind.dialect.name == "sqlite":
+        await db.execute(text("DELETE FROM report_search WHERE rowid = :id"), [{"id": p["id"]} for p in params])
+        await db.execute(text(
+            "INSERT INTO report_search (rowid, title, problem, root_causes, fishbone)"
+            " VALUES (:id, :title, :problem, :root_causes, :fishbone)"
+        ), params)
+
+
+async def search_report_ids(db, query: str, limit: int = 20, organization_id: int = None) -> list:
+    """Returns [(report_id, score)] best match first; higher score is better.
+
+    With organization_id, only that organization's reports: matches are
+    checked against quality_reports before they are ranked and limited.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    params = {"limit": limit, "org": organization_id}
+    bind = db.get_bind()
+    if _is_postgres(bind):
+        params["q"] = " & ".join(f"{term}:*" for term in terms)
+        scope = ""
+        if organization_id is not None:
+            scope = (" AND EXISTS (SELECT 1 FROM quality_reports q"
+                     " WHERE q.id = report_search.report_id AND q.organization_id = :org)")
+        result = await db.execute(text(
+            "SELECT report_id, ts_rank(document, to_tsquery('simple', :q)) AS score"
+            " FROM report_search WHERE document @@ to_tsquery('simple', :q)" + scope +
+            " ORDER BY score DESC, report_id DESC LIMIT :limit"
+        ), params)
+    elif bind.dialect.name == "sqlite":
+        # Quoted prefix terms, implicitly ANDed; column weights mirror the PostgreSQL A-D weights
+        params["q"] = " ".join(f'"{term}"*' for term in terms)
+        scope = ""
+        if organization_id is not None:
+            scope = " AND rowid IN (SELECT id FROM quality_reports WHERE organization_id = :org)"
+        result = await db.execute(text(
+            "SELECT rowid AS report_id, -bm25(report_search, 8.0, 4.0, 2.0, 1.0) AS score"
+            " FROM report_search WHERE report_search MATCH :q" + scope +
+            " ORDER BY bm25(report_search, 8.0, 4.0, 2.0, 1.0), rowid DESC LIMIT :limit"
+        ), params)
+    else:
+        return []
+    return [(row.report_id, float(row.score)) for row in result]
+
+
+def highlight(value: str, terms: list, width: int = SNIPPET_WIDTH):
+    """HTML snippet of `value` around the first match, with matches wrapped in <mark>.
+
+    Returns None when no term occurs in the value.
+    """
+    if not value or not terms:
+        return None
+    folded = fold(value)
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + r")\w*")
+    matches = list(pattern.finditer(folded))
+    if not matches:
+        return None
+
+    start = max(0, matches[0].start() - width // 3)
+    end = min(len(value), start + width)
+    parts = ["…" if start > 0 else ""]
+    cursor = start
+    for m in matches:
+        if m.start() < start or m.end() > end:
+            continue
+        parts.append(html.escape(value[cursor:m.start()]))
+        parts.append(f"<mark>{html.escape(value[m.start():m.end()])}</mark>")
+        cursor = m.end()
+    parts.append(html.escape(value[cursor:end]))
+    parts.append("…" if end < len(value) else "")
+    return "".join(parts)
+
+
+def snippets_for(title: str, data: dict, query: str) -> dict:
+    terms = query_terms(query)
+    doc = document_for(title, data)
+    return {field: snippet for field in FIELDS if (snippet := highlight(doc[field], terms))}
+
+
+async def rebuild_index(db, batch_size: int = 500) -> int:
+    """Reindexes every report; used to backfill an empty index."""
+    count = 0
+    last_id = 0
+    while True:
+        rows = (await db.execute(
+            select(QualityReport.id, QualityReport.title, QualityReport.problem_description)
+            .where(QualityReport.id > last_id)
+            .order_by(QualityReport.id)
+            .limit(batch_size)
+        )).all()
+        if not rows:
+            break
+        sections = await report_store.load_sections(db, [row.id for row in rows], keys=INDEXED_SECTIONS)
+        await index_reports(db, [
+            (row.id, row.title, report_store.merge(row.problem_description, sections[row.id])) for row in rows
+        ])
+        await db.commit()
+        count += len(rows)
+        last_id = rows[-1].id
+    return count
+
+
+async def ensure_index(db):
+    """Backfills the index on first start after upgrading; a no-op once it is populated."""
+    bind = db.get_bind()
+    if bind.dialect.name not in ("sqlite", "postgresql"):
+        return
+    key_column = "report_id" if _is_postgres(bind) else "rowid"
+    indexed = (await db.execute(text(f"SELECT {key_column} FROM report_search LIMIT 1"))).first()
+    if indexed is not None:
+        return
+    has_reports = (await db.execute(select(QualityReport.id).limit(1))).first()
+    if has_reports is not None:
+        count = await rebuild_index(db)
+        print(f"KYSAI SYSTEM: Search index backfilled with {count} reports.")
@@ -0,0 +1,205 @@
+"""Local similarity index over stored 8D reports.
+
+Reports are vectorized as TF-IDF over hashed character n-grams (3-5 chars) of
+their folded problem text. Character n-grams hold up well against Turkish
+suffixes and typos without a stemmer, and hashing keeps the vocabulary fixed
+so the index can grow one report at a time. Everything is computed in-process
+with NumPy; no network or model call is involved.
+
+Every document carries its report's organization, and queries made for an
+organization only rank that organization's reports, so one tenant's reports
+are never suggested to or reused for another.
+
+Each worker keeps its own index. It loads lazily on first use and then catches
+up with reports written by other workers by reading rows above the highest id
+it has seen.
+"""
+import asyncio
+import os
+import zlib
+
+import numpy as np
+from sqlalchemy import select
+
+from app.models.base import AsyncSessionLocal
+from app.models.models import QualityReport
+from app.services import report_store
+from app.services.search import fold
+
+N_FEATURES = 1 << 18
+NGRAM_SIZES = (3, 4, 5)
+SIMILAR_REUSE_THRESHOLD = float(os.getenv("SIMILAR_REUSE_THRESHOLD", "0.85"))
+
+
+# Sections report_text() reads besides problem_description
+TEXT_SECTIONS = ("d2_problem",)
+
+
+def report_text(data: dict) -> str:
+    data = data or {}
+    parts = [str(data.get("problem_description") or "")]
+    refined = str(data.get("d2_problem") or "")
+    if refined and refined != parts[0]:
+        parts.append(refined)
+    return "\n".join(parts)
+
+
+def vectorize(value: str):
+    """Sparse term-frequency vector: (feature indices, sublinear tf weights)."""
+    padded = f" {' '.join(fold(value).split())} "
+    grams = [padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)]
+    if not grams:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+    hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint32, count=len(grams))
+    indices, counts = np.unique((hashes % N_FEATURES).astype(np.int32), return_counts=True)
+    return indices, (1.0 + np.log(counts)).astype(np.float32)
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self._df = np.zeros(N_FEATURES, dtype=np.int32)
+        # All documents' sparse vectors packed back to back; a document is a [start, end) slice
+        self._idx = np.empty(1 << 16, dtype=np.int32)
+        self._tf = np.empty(1 << 16, dtype=np.float32)
+        self._nnz = 0
+        self._ids = []
+        self._starts = []
+        self._alive = []
+        # Organization of each document; 0 for reports without one
+        self._orgs = []
+        self._slot = {}
+        self.last_id = 0
+        self._loaded = False
+        self._lock = None
+
+    def __len__(self):
+        return len(self._slot)
+
+    def _reserve(self, extra: int):
+        needed = self._nnz + extra
+        if needed <= len(self._idx):
+            return
+        capacity = max(needed, 2 * len(self._idx))
+        self._idx = np.resize(self._idx, capacity)
+        self._tf = np.resize(self._tf, capacity)
+
+    def add(self, report_id: int, value: str, organization_id: int = None):
+        indices, tf = vectorize(value)
+        if not len(indices):
+            return
+        self.remove(report_id)
+        self._reserve(len(indices))
+        start = self._nnz
+        self._idx[start:start + len(indices)] = indices
+        self._tf[start:start + len(indices)] = tf
+        self._nnz += len(indices)
+        self._df[indices] += 1
+
+        self._slot[report_id] = len(self._ids)
+        self._ids.append(report_id)
+        self._starts.append(start)
+        self._alive.append(True)
+        self._orgs.append(organization_id or 0)
+
+    def remove(self, report_id: int):
+        slot = self._slot.pop(report_id, None)
+        if slot is None:
+            return
+        # The slice stays in the buffers but is masked out of every query
+        self._alive[slot] = False
+        self._df[self._idx[self._slice(slot)]] -= 1
+
+    def _slice(self, slot: int) -> slice:
+        end = self._starts[slot + 1] if slot + 1 < len(self._starts) else self._nnz
+        return slice(self._starts[slot], end)
+
+    def query(self, value: str, limit: int = 5, exclude_id: int = None, organization_id: int = None) -> list:
+        """Returns [(report_id, cosine similarity)] best first; organization_id limits it to that organization."""
+        q_idx, q_tf = vectorize(value)
+        if not len(q_idx) or not self._slot:
+            return []
+
+        n_docs = len(self._slot)
+        idf = (np.log((1.0 + n_docs) / (1.0 + self._df)) + 1.0).astype(np.float32)
+
+        flat_idx = self._idx[:self._nnz]
+        weights = self._tf[:self._nnz] * idf[flat_idx]
+        offsets = np.asarray(self._starts, dtype=np.int64)
+        norms = np.sqrt(np.add.reduceat(weights * weights, offsets))
+
+        q_dense = np.zeros(N_FEATURES, dtype=np.float32)
+        q_dense[q_idx] = q_tf * idf[q_idx]
+        q_norm = float(np.linalg.norm(q_dense[q_idx]))
+        if q_norm == 0:
+            return []
+
+        dots = np.add.reduceat(weights * q_dense[flat_idx], offsets)
+        scores = dots / np.maximum(norms * q_norm, 1e-12)
+
+        mask = np.asarray(self._alive, dtype=bool)
+        if organization_id is not None:
+            mask &= np.asarray(self._orgs, dtype=np.int64) == organization_id
+        if exclude_id is not None and exclude_id in self._slot:
+            mask[self._slot[exclude_id]] = False
+        scores = np.where(mask, scores, -1.0)
+
+        k = min(limit, int(mask.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    async def sync(self, db=None, batch_size: int = 1000):
+        """Loads reports this worker has not indexed yet (all of them on first use)."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if db is None:
+                async with AsyncSessionLocal() as session:
+                    await self._sync(session, batch_size)
+            else:
+                await self._sync(db, batch_size)
+            self._loaded = True
+
+    async def _sync(self, db, batch_size: int):
+        while True:
+            rows = (await db.execute(
+                select(QualityReport.id, QualityReport.organization_id, QualityReport.problem_description)
+                .where(QualityReport.id > self.last_id)
+                .order_by(QualityReport.id)
+                .limit(batch_size)
+            )).all()
+            if not rows:
+                return
+            sections = await report_store.load_sections(db, [row.id for row in rows], keys=TEXT_SECTIONS)
+            for row in rows:
+                data = report_store.merge(row.problem_description, sections[row.id])
+                self.add(row.id, report_text(data), row.organization_id)
+            self.last_id = max(self.last_id, rows[-1].id)
+
+    def on_report_saved(self, report_id: int, data: dict, organization_id: int = None):
+        # Before the first sync the whole table is loaded anyway
+        if self._loaded:
+            self.add(report_id, report_text(data), organization_id)
+
+
+index = SimilarityIndex()
+
+
+async def find_similar(db, report_id: int, data: dict, limit: int = 5, organization_id: int = None) -> list:
+    await index.sync(db)
+    return index.query(report_text(data), limit=limit, exclude_id=report_id, organization_id=organization_id)
+
+
+async def find_reusable(db, problem_description: str, organization_id: int = None):
+    """(report_id, score) of the nearest finalized report if it clears SIMILAR_REUSE_THRESHOLD."""
+    await index.sync(db)
+    for report_id, score in index.query(problem_description, limit=5, organization_id=organization_id):
+        if score < SIMILAR_REUSE_THRESHOLD:
+            break
+        # Status is read from the database so finalizations in other workers count
+        status = (await db.execute(select(QualityReport.status).where(QualityReport.id == report_id))).scalar()
+        if status == "finalized":
+            return report_id, score
+    return None, 0.0
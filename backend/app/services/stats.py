@@ -0,0 +1,144 @@
+"""Materialized dashboard statistics.
+
+report_stats holds one counter per (creation day, report type, status,
+organization). record_created() and record_status_change() adjust it inside
+the transaction that writes the report, so the counters can't drift from the
+rows they describe. The dashboard sums this table: a year of data is a few
+thousand rows at most, however many reports there are.
+
+Each worker also keeps the computed dashboard for STATS_CACHE_SECONDS to absorb
+frontend polling. Writes made by the worker clear it immediately; writes from
+other workers show up when it expires.
+"""
+import os
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import select, func, delete, literal, update, insert
+
+from app.models.models import QualityReport
+from app.models.stats import ReportStat
+from app.services.cache import TTLCache
+from app.services.tenancy import scoped
+
+STATS_CACHE_SECONDS = float(os.getenv("STATS_CACHE_SECONDS", "5"))
+TREND_DAYS = 30
+
+# One entry per (days, organization) polled, so every organization's dashboard can stay cached
+_dashboard_cache = TTLCache(max_entries=1024, ttl_seconds=STATS_CACHE_SECONDS)
+
+
+def _type_value(report_type) -> str:
+    return getattr(report_type, "value", report_type) or ""
+
+
+def _today() -> date:
+    # created_at comes from server_default=func.now(), which is UTC on both SQLite and PostgreSQL
+    return datetime.now(timezone.utc).date()
+
+
+async def _add(db, day: date, report_type: str, status: str, organization_id, delta: int):
+    key = dict(day=day, report_type=report_type, status=status or "", organization_id=organization_id or 0)
+    result = await db.execute(
+        update(ReportStat)
+        .where(*(getattr(ReportStat, column) == value for column, value in key.items()))
+        .values(count=ReportStat.count + delta)
+    )
+    if result.rowcount == 0:
+        # Writes on SQLite are serialized and PostgreSQL row locks cover the update above, so this
+        # insert only races with another first report of the same key on PostgreSQL; that raises
+        # IntegrityError and the surrounding request fails instead of miscounting.
+        await db.execute(insert(ReportStat).values(**key, count=delta))
+    _dashboard_cache.clear()
+
+
+async def record_created(db, report: QualityReport):
+    """Counts a new report; call in the transaction that inserts it, after the INSERT has been flushed."""
+    # created_at comes back from the INSERT (eager_defaults); a row added without it counts under today
+    day = report.created_at.date() if report.created_at else _today()
+    await _add(db, day, _type_value(report.report_type), report.status, report.organization_id, 1)
+
+
+async def record_status_change(db, report: QualityReport, old_status: str):
+    """Moves a report between status counters; call in the transaction that changes report.status."""
+    if old_status == report.status:
+        return
+    day, report_type = report.created_at.date(), _type_value(report.report_type)
+    await _add(db, day, report_type, old_status, report.organization_id, -1)
+    await _add(db, day, report_type, report.status, report.organization_id, 1)
+
+
+async def rebuild(db) -> int:
+    """Recomputes report_stats from quality_reports with one GROUP BY; returns the number of reports."""
+    day = func.date(QualityReport.created_at)
+    organization = func.coalesce(QualityReport.organization_id, literal(0))
+    rows = (await db.execute(
+        select(day, QualityReport.report_type, QualityReport.status, organization, func.count())
+        .group_by(day, QualityReport.report_type, QualityReport.status, organization)
+    )).all()
+    await db.execute(delete(ReportStat))
+    total = 0
+    for row_day, report_type, status, organization_id, count in rows:
+        if isinstance(row_day, str):
+            row_day = date.fromisoformat(row_day)
+        db.add(ReportStat(
+            day=row_day or _today(), report_type=_type_value(report_type),
+            status=status or "", organization_id=organization_id, count=count,
+        ))
+        total += count
+    await db.commit()
+    _dashboard_cache.clear()
+    return total
+
+
+async def ensure_stats(db):
+    """Backfills the table on first start after upgrading; a no-op once it has rows."""
+    has_stats = (await db.execute(select(ReportStat.day).limit(1))).first()
+    if has_stats is not None:
+        return
+    has_reports = (await db.execute(select(QualityReport.id).limit(1))).first()
+    if has_reports is not None:
+        total = await rebuild(db)
+        print(f"KYSAI SYSTEM: Report stats backfilled from {total} reports.")
+
+
+async def dashboard(db, days: int = TREND_DAYS, organization_id: int = None) -> dict:
+    """Dashboard figures of one organization (its counters only, through the organization_id index) or of all."""
+    cache_key = (days, organization_id)
+    cached = _dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    rows = (await db.execute(scoped(
+        select(ReportStat.day, ReportStat.report_type, ReportStat.status, ReportStat.organization_id, ReportStat.count)
+        .where(ReportStat.count != 0),
+        ReportStat, organization_id,
+    ))).all()
+
+    by_status, by_type, by_organization, created_per_day = {}, {}, {}, {}
+    for day, report_type, status, organization_id, count in rows:
+        by_status[status] = by_status.get(status, 0) + count
+        per_type = by_type.setdefault(report_type, {})
+        per_type[status] = per_type.get(status, 0) + count
+        org_key = str(organization_id) if organization_id else "unassigned"
+        per_org = by_organization.setdefault(org_key, {})
+        per_org[status] = per_org.get(status, 0) + count
+        created_per_day[day] = created_per_day.get(day, 0) + count
+
+    total = sum(by_status.values())
+    open_count = by_status.get("draft", 0)
+    today = _today()
+    trend = [
+        {"day": (today - timedelta(days=offset)).isoformat(), "created": created_per_day.get(today - timedelta(days=offset), 0)}
+        for offset in range(days - 1, -1, -1)
+    ]
+    result = {
+        "total_reports": total,
+        "open_issues": open_count,
+        "pending_approvals": max(0, open_count - 2),  # Mock logic
+        "by_status": by_status,
+        "by_type": by_type,
+        "by_organization": by_organization,
+        "trend": trend,
+    }
+    _dashboard_cache.set(cache_key, result)
+    return result
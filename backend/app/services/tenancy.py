@@ -0,0 +1,84 @@
+"""Organization scoping of report reads and writes.
+
+A request names its organization in the X-Organization-Id header. The
+get_scope() dependency turns it into a Scope, and every report endpoint reads
+through it: listings, search, stats, exports and analytics filter on the
+organization, a report id from another organization answers 404 as if it did
+not exist, and new reports, HSE reports and generation jobs are stamped with
+it. The queries lead with organization_id on the composite indexes
+(organization_id, created_at, id) and (organization_id, status, created_at),
+so a tenant's list and stats cost depends on its own rows, not on how many
+other tenants share the database.
+
+Without the header a request sees every organization, as single-tenant
+deployments always have. REQUIRE_ORGANIZATION=1 rejects such requests
+instead, for deployments where every client is a tenant.
+"""
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+from sqlalchemy import select
+
+from app.models.base import AsyncSessionLocal
+from app.models.models import Organization, QualityReport
+
+ORGANIZATION_HEADER = "X-Organization-Id"
+REQUIRE_ORGANIZATION = os.getenv("REQUIRE_ORGANIZATION", "0") == "1"
+
+# Organizations are never deleted, so an id seen once stays valid for the worker's lifetime
+_known_organizations = set()
+
+
+class OrganizationMismatch(Exception):
+    """An organization_id parameter names another organization than the request's scope."""
+
+
+def scoped(query, model, organization_id):
+    """query limited to the rows of model that belong to organization_id; None leaves it unfiltered."""
+    if organization_id is None:
+        return query
+    return query.where(model.organization_id == organization_id)
+
+
+class Scope:
+    """The organization a request works in; organization_id None means all of them."""
+
+    __slots__ = ("organization_id",)
+
+    def __init__(self, organization_id: int = None):
+        self.organization_id = organization_id
+
+    def where(self, query, model=QualityReport):
+        return scoped(query, model, self.organization_id)
+
+    def owns(self, organization_id) -> bool:
+        return self.organization_id is None or organization_id == self.organization_id
+
+    def restrict(self, organization_id):
+        """The organization filter for endpoints that also take organization_id as a parameter."""
+        if self.organization_id is None:
+            return organization_id
+        if organization_id is not None and organization_id != self.organization_id:
+            raise OrganizationMismatch(organization_id)
+        return self.organization_id
+
+    async def has_report(self, db, report_id: int, model=QualityReport) -> bool:
+        """Whether the report exists and belongs to this scope; one primary key lookup."""
+        query = self.where(select(model.id).where(model.id == report_id), model)
+        return (await db.execute(query)).first() is not None
+
+
+async def get_scope(organization_id: Optional[int] = Header(None, alias=ORGANIZATION_HEADER)) -> Scope:
+    if organization_id is None:
+        if REQUIRE_ORGANIZATION:
+            raise HTTPException(status_code=400, detail=f"{ORGANIZATION_HEADER} header is required")
+        return Scope()
+    if organization_id not in _known_organizations:
+        # Own short session: streaming endpoints would otherwise hold the connection for the whole stream
+        async with AsyncSessionLocal() as db:
+            found = (await db.execute(select(Organization.id).where(Organization.id == organization_id))).first()
+        if found is None:
+            raise HTTPException(status_code=404, detail="Organization not found")
+        _known_organizations.add(organization_id)
+    return Scope(organization_id)
@@ -0,0 +1,174 @@
+"""Content-addressed storage for uploaded images.
+
+Files are stored as static/uploads/<h[0:2]>/<h[2:4]>/<sha256>.<ext>, so two
+uploads of the same photo share one file and two different photos can never
+overwrite each other. The hash is also the key for cached HSE analyses.
+
+Nothing references a file until an HSEReport is saved with its image_path, so
+sweep_orphans() deletes files that no report points to once they are older
+than a grace period.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+
+from sqlalchemy import select
+
+from app.models.base import AsyncSessionLocal
+from app.models.hse import HSEReport
+from app.services import images
+
+TMP_DIR = f"{images.UPLOAD_DIR}/tmp"
+UPLOAD_GC_GRACE_SECONDS = float(os.getenv("UPLOAD_GC_GRACE_SECONDS", str(24 * 3600)))
+UPLOAD_GC_INTERVAL_SECONDS = float(os.getenv("UPLOAD_GC_INTERVAL_SECONDS", str(6 * 3600)))
+
+_EXT = re.compile(r"^[a-z0-9]{1,5}$")
+_ALIASES = {"jpeg": "jpg", "tif": "tiff"}
+
+
+@dataclass
+class StoredUpload:
+    sha256: str
+    path: str
+    size: int
+    deduplicated: bool
+
+    @property
+    def url(self) -> str:
+        return images.url_for(self.path)
+
+
+def normalize_ext(filename: str) -> str:
+    ext = (filename or "").rsplit(".", 1)[-1].lower() if "." in (filename or "") else ""
+    ext = _ALIASES.get(ext, ext)
+    return ext if _EXT.match(ext) else "bin"
+
+
+def path_for(sha256: str, ext: str) -> str:
+    return f"{images.UPLOAD_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+
+
+def _write_chunk(out, hasher, chunk: bytes):
+    out.write(chunk)
+    hasher.update(chunk)
+
+
+def _commit_file(tmp_path: str, final_path: str) -> bool:
+    """Moves the temp file into place; returns True when identical content was already stored."""
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+        # Restart the GC grace period for content that is being used again
+        os.utime(final_path)
+        return True
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(tmp_path, final_path)
+    return False
+
+
+async def store_stream(chunks, ext: str) -> StoredUpload:
+    """Stores an async iterable of byte chunks, hashing while writing."""
+    os.makedirs(TMP_DIR, exist_ok=True)
+    tmp_path = f"{TMP_DIR}/{uuid.uuid4().hex}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    out = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        async for chunk in chunks:
+            await asyncio.to_thread(_write_chunk, out, hasher, chunk)
+            size += len(chunk)
+    except BaseException:
+        await asyncio.to_thread(out.close)
+        await asyncio.to_thread(os.remove, tmp_path)
+        raise
+    await asyncio.to_thread(out.close)
+
+    sha256 = hasher.hexdigest()
+    final_path = path_for(sha256, ext)
+    deduplicated = await asyncio.to_thread(_commit_file, tmp_path, final_path)
+    return StoredUpload(sha256=sha256, path=final_path, size=size, deduplicated=deduplicated)
+
+
+def store_fileobj_sync(source, ext: str) -> StoredUpload:
+    """Blocking variant of store_stream for callers already on a worker thread (e.g. zip extraction)."""
+    os.makedirs(TMP_DIR, exist_ok=True)
+    tmp_path = f"{TMP_DIR}/{uuid.uuid4().hex}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while chunk := source.read(images.UPLOAD_CHUNK_BYTES):
+                _write_chunk(out, hasher, chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    sha256 = hasher.hexdigest()
+    final_path = path_for(sha256, ext)
+    deduplicated = _commit_file(tmp_path, final_path)
+    return StoredUpload(sha256=sha256, path=final_path, size=size, deduplicated=deduplicated)
+
+
+async def _read_upload(file):
+    while True:
+        chunk = await file.read(images.UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def store_upload(file) -> StoredUpload:
+    return await store_stream(_read_upload(file), normalize_ext(file.filename))
+
+
+def local_path(image_path: str) -> str:
+    """Filesystem path (relative to the backend directory) of a stored image_path such as /static/uploads/..."""
+    return os.path.normpath((image_path or "").lstrip("/"))
+
+
+def _sweep(referenced: set, grace_seconds: float) -> dict:
+    now = time.time()
+    thumbs_dir = os.path.normpath(images.THUMBNAIL_DIR)
+    deleted = kept = 0
+    for root, dirs, files in os.walk(images.UPLOAD_DIR):
+        if os.path.normpath(root).startswith(thumbs_dir):
+            continue
+        for name in files:
+            path = os.path.normpath(os.path.join(root, name))
+            try:
+                if path in referenced or now - os.path.getmtime(path) < grace_seconds:
+                    kept += 1
+                    continue
+                os.remove(path)
+                thumbnail = images.thumbnail_path_for(path)
+                if os.path.exists(thumbnail):
+                    os.remove(thumbnail)
+                deleted += 1
+            except FileNotFoundError:
+                # Another worker swept it first
+                continue
+    return {"deleted": deleted, "kept": kept}
+
+
+async def sweep_orphans(db, grace_seconds: float = UPLOAD_GC_GRACE_SECONDS) -> dict:
+    """Deletes uploads (and their thumbnails) that no HSEReport.image_path points to."""
+    result = await db.execute(select(HSEReport.image_path).where(HSEReport.image_path.is_not(None)))
+    referenced = {local_path(p) for p in result.scalars()}
+    return await asyncio.to_thread(_sweep, referenced, grace_seconds)
+
+
+async def run_periodic_sweep():
+    """Background task started by the app; UPLOAD_GC_INTERVAL_SECONDS=0 disables it."""
+    while True:
+        # Jitter so the workers on a host don't all walk the upload tree at once
+        await asyncio.sleep(UPLOAD_GC_INTERVAL_SECONDS * random.uniform(0.9, 1.1))
+        try:
+            async with AsyncSessionLocal() as db:
+                stats = await sweep_orphans(db)
+            print(f"KYSAI SYSTEM: Upload GC removed {stats['deleted']} orphaned files.")
+        except Exception as e:
+            print(f"KYSAI SYSTEM: Upload GC failed: {e}")
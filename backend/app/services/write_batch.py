@@ -0,0 +1,151 @@
+"""Group commit for short report writes.
+
+Creating HSE reports (one, or a batch audit's at once), saving a generated 8D
+report and editing a report are each a handful of statements. When each runs
+in its own transaction, every report also pays for its own session, BEGIN and
+COMMIT (an fsync on PostgreSQL and with SQLITE_SYNCHRONOUS=FULL) and, on
+SQLite, a turn at the write lock shared by all workers. WriteBatcher commits
+concurrent writes together, in one transaction:
+
+* the writes run one after another on one connection, without savepoints,
+  so a write costs only its own statements. If one of them raises (a version
+  conflict, an idempotency key that is already stored, a bad value), the
+  batch is rolled back and run again with every write in its own SAVEPOINT:
+  the failing write is rolled back alone and its caller gets the exception,
+  while the others commit;
+* a write that finds the batcher idle is committed at once, so a lone write
+  waits for nothing. The writes that arrive while a batch commits form the
+  next batch, so a burst of N writes costs a few commits instead of N.
+  WRITE_BATCH_WINDOW_MS additionally holds the first write of a burst back
+  for others to join, for databases where a commit is expensive;
+* if the commit itself fails, every write of the batch is retried in its own
+  transaction, so each caller gets its own result or error.
+
+A write is an async function fn(db, *args). Its return value is handed to the
+caller once the batch has committed. after_commit(result) runs right after the
+commit, for in-memory state that must only change once the write is durable
+(caches, the similarity index). Ids and server-side timestamps come back from
+the INSERT itself (RETURNING, see eager_defaults on the models), so writes
+never refresh() what they just wrote.
+"""
+import asyncio
+import os
+import time
+
+from sqlalchemy import text
+
+from app.models.base import AsyncSessionLocal, IS_SQLITE
+from app.services import metrics
+
+# How long the first write of a burst waits for others to join; 0 commits it at once
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "0"))
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "64"))
+
+
+class _Write:
+    __slots__ = ("fn", "args", "after_commit", "future", "result", "error")
+
+    def __init__(self, fn, args, after_commit, future):
+        self.fn = fn
+        self.args = args
+        self.after_commit = after_commit
+        self.future = future
+        self.result = None
+        self.error = None
+
+
+class WriteBatcher:
+    def __init__(self, window_seconds: float, max_size: int):
+        self.window = window_seconds
+        self.max_size = max(max_size, 1)
+        self._pending = []
+        self._full = None
+        self._runner = None
+
+    async def submit(self, fn, *args, after_commit=None):
+        """Runs fn(db, *args) in the next batch; returns its result once the batch has committed."""
+        write = _Write(fn, args, after_commit, asyncio.get_running_loop().create_future())
+        self._pending.append(write)
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        elif len(self._pending) >= self.max_size and self._full is not None:
+            self._full.set()
+        # A caller that goes away (client disconnect) doesn't take its write out of the batch
+        return await asyncio.shield(write.future)
+
+    async def _run(self):
+        # Only the first batch waits: writes that queued up while a batch committed have waited long enough
+        if self.window > 0 and len(self._pending) < self.max_size:
+            self._full = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.window)
+            except asyncio.TimeoutError:
+                pass
+            self._full = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+            try:
+                await self._commit(batch)
+            except BaseException as e:
+                for write in batch:
+                    _resolve(write, error=e)
+                raise
+
+    async def _commit(self, batch: list):
+        started = time.perf_counter()
+        try:
+            if not await _run_in_transaction(batch, isolated=False):
+                await _run_in_transaction(batch, isolated=True)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].result, batch[0].error = None, e
+            else:
+                print(f"KYSAI SYSTEM: Write batch of {len(batch)} failed to commit ({e}); retrying one by one.")
+                for write in batch:
+                    await self._commit([write])
+                return
+        metrics.write_batch_size.observe(len(batch))
+        metrics.stage_seconds.labels("write_batch", "commit").observe(time.perf_counter() - started)
+        for write in batch:
+            if write.error is None and write.after_commit is not None:
+                try:
+                    write.after_commit(write.result)
+                except Exception as e:
+                    print(f"KYSAI SYSTEM: After-commit hook failed: {e}")
+            _resolve(write)
+
+
+async def _run_in_transaction(batch: list, isolated: bool) -> bool:
+    """Runs and commits the batch; False, with nothing committed, when a write fails and isolated is off."""
+    async with AsyncSessionLocal() as db:
+        if IS_SQLITE:
+            # pysqlite only issues BEGIN before DML; without it the first RELEASE SAVEPOINT would commit
+            await db.execute(text("BEGIN IMMEDIATE"))
+        for write in batch:
+            write.result, write.error = None, None
+            try:
+                if isolated:
+                    async with db.begin_nested():
+                        write.result = await write.fn(db, *write.args)
+                else:
+                    write.result = await write.fn(db, *write.args)
+            except Exception as e:
+                write.error = e
+                if not isolated:
+                    await db.rollback()
+                    return False
+        await db.commit()
+    return True
+
+
+def _resolve(write: _Write, error: BaseException = None):
+    if write.future.done():
+        return
+    error = error or write.error
+    if error is not None:
+        write.future.set_exception(error)
+    else:
+        write.future.set_result(write.result)
+
+
+writes = WriteBatcher(WRITE_BATCH_WINDOW_MS / 1000, WRITE_BATCH_MAX_SIZE)
@@ -0,0 +1,177 @@
+"""Local stand-in for the Gemini REST API, for benchmarks.
+
+Implements models/{model}:generateContent and :streamGenerateContent?alt=sse
+well enough for app.services.ai_client (GEMINI_API_ENDPOINT mode). Requests
+with an image part get an HSE analysis; everything else gets an 8D report.
+
+    python bench/fake_llm.py --port 8090 --latency-ms 800 --error-rate 0.02
+
+Latency, jitter, error rate, response size and streaming pace are flags, so a
+run can model a fast model, a slow one or a flaky one.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Mirrors app.services.eight_d.SECTION_KEYS; not imported so this server stays independent of the app
+LIST_SECTIONS = [
+    "d1_team", "d3_interim_actions", "d4_occurrence_causes", "d4_escape_causes", "d4_root_causes",
+    "d5_chosen_pca", "d6_implemented_pca", "d7_prevention", "d8_recognition",
+]
+FISHBONE_CATEGORIES = ["Man", "Machine", "Method", "Material", "Measurement", "Environment"]
+WORDS = (
+    "operator torque calibration fixture supplier batch inspection gauge tolerance weld "
+    "hidrolik pres kalıp sıcaklık ölçüm vida gevşeme boya kaplama çapak montaj hat "
+    "training checklist poka-yoke audit sampling control plan FMEA revision"
+).split()
+
+settings = argparse.Namespace(
+    latency_ms=800.0, jitter_ms=200.0, error_rate=0.0, error_status=503, invalid_json_rate=0.0,
+    response_scale=1.0, stream_chunks=20, chunk_delay_ms=30.0, seed=None,
+)
+rng = random.Random()
+app = FastAPI(title="Fake Gemini")
+
+
+def _sentence(words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _items(count: float, words: int = 12) -> list:
+    return [_sentence(max(3, int(words * settings.response_scale))) for _ in range(max(1, round(count)))]
+
+
+def eight_d_answer() -> dict:
+    scale = settings.response_scale
+    data = {key: _items(3 * scale) for key in LIST_SECTIONS}
+    data["d2_problem"] = _sentence(int(40 * scale) or 5)
+    data["d4_fishbone"] = {category: _items(2 * scale, 8) for category in FISHBONE_CATEGORIES}
+    return data
+
+
+def hse_answer() -> dict:
+    return {
+        "non_conformities": _items(3 * settings.response_scale),
+        "corrective_actions": _items(3 * settings.response_scale),
+    }
+
+
+def _answer_text(body: dict) -> str:
+    parts = [p for c in body.get("contents", []) for p in c.get("parts", [])]
+    data = hse_answer() if any("inlineData" in p or "inline_data" in p for p in parts) else eight_d_answer()
+    text = json.dumps(data, ensure_ascii=False)
+    if rng.random() < settings.invalid_json_rate:
+        # Truncated output, as from a model that hit its token limit
+        text = text[: len(text) // 2]
+    return text
+
+
+def _prompt_tokens(body: dict) -> int:
+    parts = [p for c in body.get("contents", []) for p in c.get("parts", [])]
+    # Rough 4 characters per token; images count as a flat 258 like Gemini's per-image cost
+    return sum(len(p.get("text", "")) // 4 if "text" in p else 258 for p in parts)
+
+
+def _response(text: str, finished: bool, prompt_tokens: int, completion_tokens: int) -> dict:
+    payload = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}]}
+    if finished:
+        payload["candidates"][0]["finishReason"] = "STOP"
+    payload["usageMetadata"] = {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": completion_tokens,
+        "totalTokenCount": prompt_tokens + completion_tokens,
+    }
+    return payload
+
+
+async def _latency():
+    delay = max(0.0, settings.latency_ms + rng.uniform(-settings.jitter_ms, settings.jitter_ms))
+    await asyncio.sleep(delay / 1000)
+
+
+def _maybe_error():
+    if rng.random() < settings.error_rate:
+        status = settings.error_status
+        return JSONResponse(
+            {"error": {"code": status, "message": "Injected failure", "status": "UNAVAILABLE"}}, status_code=status,
+        )
+    return None
+
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, request: Request):
+    body = await request.json()
+    await _latency()
+    error = _maybe_error()
+    if error is not None:
+        return error
+    text = _answer_text(body)
+    return _response(text, True, _prompt_tokens(body), len(text) // 4)
+
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def stream_generate_content(model: str, request: Request):
+    body = await request.json()
+    # Time to first token
+    await _latency()
+    error = _maybe_error()
+    if error is not None:
+        return error
+    text = _answer_text(body)
+    prompt_tokens = _prompt_tokens(body)
+    n = max(1, settings.stream_chunks)
+    size = -(-len(text) // n)
+
+    async def events():
+        sent = 0
+        for i in range(0, len(text), size):
+            chunk = text[i:i + size]
+            sent += len(chunk)
+            finished = sent >= len(text)
+            yield f"data: {json.dumps(_response(chunk, finished, prompt_tokens, sent // 4), ensure_ascii=False)}\r\n\r\n"
+            if not finished:
+                await asyncio.sleep(settings.chunk_delay_ms / 1000)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "settings": vars(settings)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=settings.latency_ms,
+                        help="response time (non-streaming) or time to first chunk")
+    parser.add_argument("--jitter-ms", type=float, default=settings.jitter_ms, help="uniform +/- jitter on latency")
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate, help="fraction of calls that fail")
+    parser.add_argument("--error-status", type=int, default=settings.error_status)
+    parser.add_argument("--invalid-json-rate", type=float, default=settings.invalid_json_rate,
+                        help="fraction of answers truncated into invalid JSON")
+    parser.add_argument("--response-scale", type=float, default=settings.response_scale,
+                        help="multiplier for items per section and words per item")
+    parser.add_argument("--stream-chunks", type=int, default=settings.stream_chunks)
+    parser.add_argument("--chunk-delay-ms", type=float, default=settings.chunk_delay_ms)
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible answers and failures")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for key, value in vars(args).items():
+        if hasattr(settings, key):
+            setattr(settings, key, value)
+    rng.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Closed-loop load test for the KYSAI API.
+
+Each scenario runs at every requested concurrency level. At each level, that
+many clients send requests back to back for --duration seconds. The test then
+reports throughput and p50/p95/p99 latency of the successful requests, plus
+error counts by status.
+
+Against a running server:
+
+    python bench/loadtest.py --url http://127.0.0.1:8000 --scenarios list,stats --concurrency 1,16,64
+
+Or let it start bench/fake_llm.py and the app (gunicorn, like render.yaml) itself:
+
+    python bench/loadtest.py --spawn --workers 4 --seed-rows 100k --concurrency 8,32
+
+--results appends one JSON line per run (scenario, level, percentiles, git
+revision), so numbers can be compared over time.
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+API = "/api/v1"
+SEARCH_TERMS = ["çatlak", "capak", "vida", "kalibrasyon", "supplier", "korozyon", "pres", "fixture"]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank definition
+    rank = math.ceil(q / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+class Scenario:
+    name = ""
+
+    def __init__(self, args):
+        self.args = args
+        self.counter = 0
+
+    async def prepare(self, client: httpx.AsyncClient):
+        pass
+
+    async def request(self, client: httpx.AsyncClient) -> httpx.Response:
+        raise NotImplementedError
+
+
+class Generate8D(Scenario):
+    name = "generate-8d"
+
+    async def request(self, client):
+        self.counter += 1
+        if random.random() < self.args.repeat_ratio:
+            # Repeats of a few popular problems exercise the response cache and in-flight coalescing
+            description = f"Tekrarlayan hata #{random.randint(1, 5)}: vida gevşemesi montaj hattında"
+        else:
+            description = f"Bench {os.getpid()}-{self.counter}: {random.choice(SEARCH_TERMS)} hatası lot {random.randint(1, 10**6)}"
+        return await client.post(f"{API}/generate-8d", json={"problem_description": description, "language": "tr"})
+
+
+class Generate8DStream(Scenario):
+    name = "generate-8d-stream"
+
+    async def request(self, client):
+        self.counter += 1
+        description = f"Stream bench {os.getpid()}-{self.counter}: {random.choice(SEARCH_TERMS)}"
+        async with client.stream("POST", f"{API}/generate-8d/stream",
+                                 json={"problem_description": description, "language": "tr"}) as response:
+            async for _ in response.aiter_bytes():
+                pass
+        return response
+
+
+class AnalyzeHSE(Scenario):
+    name = "analyze-hse"
+
+    async def prepare(self, client):
+        from PIL import Image
+
+        width, height = (int(v) for v in self.args.image_size.split("x"))
+        self.images = []
+        for i in range(8):
+            img = Image.effect_noise((width, height), 40 + i).convert("RGB")
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG", quality=90)
+            self.images.append(buffer.getvalue())
+
+    async def request(self, client):
+        self.counter += 1
+        data = self.images[self.counter % len(self.images)]
+        if self.args.unique_images:
+            # Bytes after the JPEG end marker change the content hash but not the decoded image
+            data += f"bench-{os.getpid()}-{self.counter}".encode()
+        return await client.post(f"{API}/analyze-hse-image", files={"file": ("bench.jpg", data, "image/jpeg")})
+
+
+class CreateHSE(Scenario):
+    name = "create-hse"
+
+    async def request(self, client):
+        self.counter += 1
+        return await client.post(f"{API}/reports/hse", json={
+            "image_path": f"uploads/bench-{os.getpid()}-{self.counter}.jpg",
+            "non_conformities": ["Baret takılmamış", "Acil çıkış önü kapalı"],
+            "user_observations": f"Bench {self.counter}",
+            "corrective_actions": ["Eğitim verilecek", "Çıkış önü boşaltılacak"],
+        })
+
+
+class ListReports(Scenario):
+    name = "list"
+
+    async def request(self, client):
+        params = {"limit": 50}
+        if random.random() < self.args.search_ratio:
+            params["search"] = random.choice(SEARCH_TERMS)
+        return await client.get(f"{API}/reports", params=params)
+
+
+class SearchReports(Scenario):
+    name = "search"
+
+    async def request(self, client):
+        return await client.get(f"{API}/reports/search", params={"q": random.choice(SEARCH_TERMS)})
+
+
+class Stats(Scenario):
+    name = "stats"
+
+    async def request(self, client):
+        return await client.get(f"{API}/reports/stats")
+
+
+SCENARIOS = {cls.name: cls for cls in (Generate8D, Generate8DStream, AnalyzeHSE, CreateHSE, ListReports, SearchReports, Stats)}
+
+
+async def run_level(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await scenario.request(client)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": len(latencies) + sum(errors.values()),
+        "ok": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round((latencies[-1] if latencies else 0) * 1000, 1),
+    }
+
+
+def print_row(result: dict):
+    errors = ",".join(f"{k}:{v}" for k, v in result["errors"].items()) or "-"
+    print(
+        f"{result['scenario']:<20}{result['concurrency']:>6}{result['requests']:>9}{result['throughput_rps']:>10}"
+        f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}   {errors}",
+        flush=True,
+    )
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def run(args) -> list:
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        print(f"{'scenario':<20}{'conc':>6}{'requests':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}   errors")
+        for name in args.scenarios:
+            scenario = SCENARIOS[name](args)
+            await scenario.prepare(client)
+            if args.warmup > 0:
+                await run_level(client, scenario, min(args.concurrency), args.warmup)
+            for concurrency in args.concurrency:
+                result = await run_level(client, scenario, concurrency, args.duration)
+                print_row(result)
+                results.append(result)
+        if args.metrics_out:
+            response = await client.get("/metrics")
+            with open(args.metrics_out, "w") as f:
+                f.write(response.text)
+    return results
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{url} exited with code {process.returncode} during startup")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise SystemExit(f"{url} did not come up within {timeout:.0f}s")
+
+
+def spawn(args) -> list:
+    """Starts the fake model server and the app; returns the processes to stop afterwards."""
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(BACKEND_DIR, "bench", "fake_llm.py"), "--port", str(args.fake_port),
+        "--latency-ms", str(args.llm_latency_ms), "--jitter-ms", str(args.llm_jitter_ms),
+        "--error-rate", str(args.llm_error_rate), "--response-scale", str(args.llm_response_scale),
+    ])
+    processes = [fake]
+    wait_until_up(f"{fake_url}/health", fake)
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url,
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "bench"),
+        "GEMINI_API_ENDPOINT": fake_url,
+        "METRICS_DIR": os.environ.get("METRICS_DIR") or tempfile.mkdtemp(prefix="kysai-metrics-"),
+    }
+    if args.seed_rows:
+        subprocess.run([sys.executable, os.path.join(BACKEND_DIR, "bench", "seed.py"), "--rows", args.seed_rows,
+                        "--seed", "1"], cwd=BACKEND_DIR, env=env, check=True)
+
+    port = args.url.rsplit(":", 1)[-1].rstrip("/")
+    app = subprocess.Popen([
+        "gunicorn", "app.main:app", "-w", str(args.workers), "-k", "uvicorn.workers.UvicornWorker",
+        "-b", f"127.0.0.1:{port}", "--log-level", "warning",
+    ], cwd=BACKEND_DIR, env=env)
+    processes.append(app)
+    wait_until_up(f"{args.url}/health", app)
+    return processes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the KYSAI API.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenarios", default="generate-8d,analyze-hse,list,stats",
+                        type=lambda v: [s for s in v.split(",") if s], help=f"any of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", type=lambda v: [int(c) for c in v.split(",")])
+    parser.add_argument("--duration", type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of unrecorded load per scenario")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="share of 8D requests repeating a problem")
+    parser.add_argument("--search-ratio", type=float, default=0.2, help="share of list requests with ?search=")
+    parser.add_argument("--image-size", default="1600x1200")
+    parser.add_argument("--unique-images", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--results", help="append JSON lines with the results to this file")
+    parser.add_argument("--metrics-out", help="save the server's /metrics text after the run")
+
+    spawn_group = parser.add_argument_group("spawned server (--spawn)")
+    spawn_group.add_argument("--spawn", action="store_true", help="start bench/fake_llm.py and the app")
+    spawn_group.add_argument("--workers", type=int, default=4)
+    spawn_group.add_argument("--database-url", default="sqlite+aiosqlite:///./bench.db")
+    spawn_group.add_argument("--seed-rows", help="seed this many reports first, e.g. 10k")
+    spawn_group.add_argument("--fake-port", type=int, default=8090)
+    spawn_group.add_argument("--llm-latency-ms", type=float, default=800)
+    spawn_group.add_argument("--llm-jitter-ms", type=float, default=200)
+    spawn_group.add_argument("--llm-error-rate", type=float, default=0.0)
+    spawn_group.add_argument("--llm-response-scale", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    processes = spawn(args) if args.spawn else []
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    if args.results:
+        revision = git_revision()
+        with open(args.results, "a") as f:
+            for result in results:
+                f.write(json.dumps({"timestamp": time.time(), "revision": revision, **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Seeds the database with synthetic 8D reports for scaling benchmarks.
+
+    python bench/seed.py --rows 100k
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python bench/seed.py --rows 1m --batch 10000
+    python bench/seed.py --rows 100k --organizations 200
+
+Rows go into the database DATABASE_URL points at, through the app's own
+models, and are added to the full-text index. Content is built from a small
+Turkish/English manufacturing vocabulary, so search terms and root causes
+repeat the way they do in real data. With --organizations, the reports are
+spread over that many organizations (created as "Bench org N" if missing).
+With --seed, the same rows come out on every run.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import insert, select  # noqa: E402
+
+from app import migrate  # noqa: E402
+from app.models.base import engine, AsyncSessionLocal  # noqa: E402
+from app.models.models import Organization, QualityReport, ReportType  # noqa: E402
+from app.services import analytics, report_store, search, stats  # noqa: E402
+from app.services.eight_d import build_report_data  # noqa: E402
+
+PARTS = ["şaft", "flanş", "rulman yuvası", "bracket", "housing", "gear", "vida", "conta", "hose clamp", "kapak"]
+DEFECTS = [
+    "çatlak", "çapak", "ölçü dışı", "boya kabarması", "korozyon", "porosity", "burr", "scratch",
+    "missing thread", "gevşek montaj", "eksik kaynak", "yanlış etiket",
+]
+STATIONS = ["CNC-3", "pres hattı 2", "kaynak robotu", "paint shop", "assembly line B", "final inspection", "boyahane"]
+CUSTOMERS = ["OEM müşterisi", "tier-1 supplier", "iç müşteri", "export customer"]
+ROOT_CAUSES = [
+    "Operatör eğitimi yetersiz",
+    "Kalıp aşınması takip edilmiyor",
+    "Tork anahtarı kalibrasyonu geçmiş",
+    "Supplier material out of spec",
+    "Fixture wear not in PM plan",
+    "Kontrol planında ölçüm frekansı düşük",
+    "Work instruction outdated",
+    "Hammadde nem oranı yüksek",
+    "Poka-yoke bypassed on night shift",
+    "Fırın sıcaklık profili sapması",
+]
+ACTIONS = [
+    "100% kontrol başlatıldı", "Stoktaki parçalar karantinaya alındı", "Supplier 8D requested",
+    "Kalıp bakımı PM planına eklendi", "Operators retrained", "Poka-yoke sensor added",
+    "Kontrol planı revize edildi", "FMEA updated", "Ölçüm frekansı artırıldı", "Containment at customer site",
+]
+FISHBONE = ["Man", "Machine", "Method", "Material", "Measurement", "Environment"]
+
+
+def parse_count(value: str) -> int:
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+
+def synthetic_report(rng: random.Random, now: datetime, days: int, finalized_ratio: float) -> dict:
+    part, defect, station = rng.choice(PARTS), rng.choice(DEFECTS), rng.choice(STATIONS)
+    problem = (
+        f"{rng.choice(CUSTOMERS)} tarafından {rng.randint(2, 400)} adet {part} parçasında {defect} bildirildi. "
+        f"Hata {station} istasyonunda, lot {rng.randint(1000, 9999)} üretiminde görüldü."
+    )
+    causes = rng.sample(ROOT_CAUSES, 3)
+    sections = {
+        "d1_team": ["Quality Engineer", "Production Supervisor", rng.choice(["Process Engineer", "Bakım Sorumlusu"])],
+        "d2_problem": f"{part.capitalize()} - {defect} ({station})",
+        "d3_interim_actions": rng.sample(ACTIONS, 2),
+        "d4_root_causes": causes[:1],
+        "d4_occurrence_causes": causes[1:2],
+        "d4_escape_causes": causes[2:],
+        "d4_fishbone": {category: [rng.choice(ROOT_CAUSES)] for category in rng.sample(FISHBONE, 4)},
+        "d5_chosen_pca": rng.sample(ACTIONS, 2),
+        "d6_implemented_pca": rng.sample(ACTIONS, 2),
+        "d7_prevention": rng.sample(ACTIONS, 2),
+        "d8_recognition": ["Team recognized by plant manager"],
+    }
+    return {
+        "title": f"8D: {problem[:50]}...",
+        "report_type": ReportType.EIGHT_D,
+        "status": "finalized" if rng.random() < finalized_ratio else "draft",
+        "problem_description": problem,
+        "data": build_report_data(problem, sections),
+        "created_at": now - timedelta(seconds=rng.randint(0, days * 86400)),
+    }
+
+
+async def ensure_organizations(db, count: int) -> list:
+    """Ids of "Bench org 1" .. "Bench org <count>", creating the missing ones."""
+    names = [f"Bench org {n}" for n in range(1, count + 1)]
+    existing = dict((await db.execute(select(Organization.name, Organization.id))).all())
+    missing = [name for name in names if name not in existing]
+    if missing:
+        await db.execute(insert(Organization), [{"name": name} for name in missing])
+        await db.commit()
+        existing = dict((await db.execute(select(Organization.name, Organization.id))).all())
+    return [existing[name] for name in names]
+
+
+async def insert_reports(db, values: list, index: bool = True) -> list:
+    """Inserts synthetic_report() values with their sections, index and analytics entries; returns the ids."""
+    ids = (await db.execute(
+        insert(QualityReport).returning(QualityReport.id, sort_by_parameter_order=True),
+        [{k: v for k, v in value.items() if k != "data"} for value in values],
+    )).scalars().all()
+    await report_store.insert_sections(db, [(i, v["data"]) for i, v in zip(ids, values)])
+    if index:
+        await search.index_reports(db, [(i, v["title"], v["data"]) for i, v in zip(ids, values)])
+    await analytics.index_reports(db, [
+        (i, v.get("organization_id"), v["created_at"], v["data"]) for i, v in zip(ids, values)
+    ])
+    await db.commit()
+    return ids
+
+
+async def seed(rows: int, batch: int, finalized_ratio: float, days: int, index: bool, seed_value,
+               organizations: int = 0):
+    await migrate.upgrade_schema()
+
+    rng = random.Random(seed_value)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    started = time.perf_counter()
+    done = 0
+    async with AsyncSessionLocal() as db:
+        organization_ids = await ensure_organizations(db, organizations) if organizations else [None]
+        while done < rows:
+            values = [synthetic_report(rng, now, days, finalized_ratio) for _ in range(min(batch, rows - done))]
+            for value in values:
+                value["organization_id"] = rng.choice(organization_ids)
+            await insert_reports(db, values, index)
+            done += len(values)
+            elapsed = time.perf_counter() - started
+            print(f"{done:>10,} / {rows:,} rows  ({done / elapsed:,.0f} rows/s)", flush=True)
+        # Bulk inserts bypass the per-report counters; recompute them once at the end
+        await stats.rebuild(db)
+        # Old finalized reports are archived as a long-running deployment would have done
+        archived = await report_store.archive_due(db)
+        print(f"{archived:,} finalized reports archived", flush=True)
+    await engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed synthetic 8D reports.")
+    parser.add_argument("--rows", type=parse_count, default=parse_count("1k"), help="e.g. 1k, 100k, 1m")
+    parser.add_argument("--batch", type=int, default=5000, help="rows per transaction")
+    parser.add_argument("--finalized-ratio", type=float, default=0.3)
+    parser.add_argument("--days", type=int, default=365, help="spread created_at over this many past days")
+    parser.add_argument("--no-index", action="store_true", help="skip the full-text index")
+    parser.add_argument("--organizations", type=int, default=0, help="spread the reports over this many organizations")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    asyncio.run(seed(args.rows, args.batch, args.finalized_ratio, args.days, not args.no_index, args.seed,
+                     args.organizations))
+
+
+if __name__ == "__main__":
+    main()
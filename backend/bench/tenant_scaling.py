@@ -0,0 +1,172 @@
+"""Per-organization list and stats latency as the number of organizations grows.
+
+    python bench/tenant_scaling.py --tenants 1,10,100,500 --rows-per-tenant 200
+    python bench/tenant_scaling.py --tenants 1,10,100,500 --without-indexes
+
+Starts from an empty SQLite file (--db) and adds organizations, each with
+--rows-per-tenant reports, until every step's count is reached. At each step
+it times requests for randomly chosen organizations, sent with
+X-Organization-Id to the app in-process (httpx ASGITransport; no server or
+network in the way):
+
+* list: the first page of GET /reports
+* next-page: the page after it, through X-Next-Cursor
+* stats: GET /reports/stats, with the dashboard cache turned off
+
+The total number of reports grows with the number of organizations; with the
+organization indexes, the per-organization figures should not. With
+--without-indexes the database is downgraded to the schema before them, for
+comparison. --explain prints SQLite's plan for the list and stats queries.
+--results appends one JSON line per step and request, like loadtest.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from loadtest import API, git_revision, percentile  # noqa: E402
+
+# The schema before the organization indexes (migrations/versions/0004_organization_indexes.py)
+REVISION_WITHOUT_INDEXES = "0003"
+QUERIES = ("list", "next-page", "stats")
+
+
+async def grow(db, seed, existing: int, tenants: int, rows_per_tenant: int, rng: random.Random) -> int:
+    """Adds organizations with their reports, from `existing` up to `tenants`; returns the reports added."""
+    from app.services import stats
+
+    organization_ids = await seed.ensure_organizations(db, tenants)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    added = 0
+    for organization_id in organization_ids[existing:]:
+        values = [seed.synthetic_report(rng, now, 365, 0.3) for _ in range(rows_per_tenant)]
+        for value in values:
+            value["organization_id"] = organization_id
+        await seed.insert_reports(db, values, index=False)
+        added += len(values)
+    await stats.rebuild(db)
+    return added
+
+
+async def explain(db, organization_id: int):
+    from sqlalchemy import text
+
+    plans = {
+        "list": "SELECT id, title, status, created_at FROM quality_reports WHERE organization_id = :org"
+                " ORDER BY created_at DESC, id DESC LIMIT 51",
+        "stats": "SELECT day, report_type, status, organization_id, count FROM report_stats"
+                 " WHERE count != 0 AND organization_id = :org",
+    }
+    for name, sql in plans.items():
+        rows = (await db.execute(text("EXPLAIN QUERY PLAN " + sql), {"org": organization_id})).all()
+        print(f"  plan {name}: " + "; ".join(row[-1] for row in rows))
+
+
+async def time_requests(client, organization_ids: list, requests: int, rng: random.Random) -> tuple:
+    timings = {name: [] for name in QUERIES}
+    errors = 0
+
+    async def timed(name, *args, **kwargs):
+        nonlocal errors
+        started = time.perf_counter()
+        response = await client.get(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        if response.status_code == 200:
+            timings[name].append(elapsed)
+        else:
+            errors += 1
+        return response
+
+    for _ in range(requests):
+        headers = {"X-Organization-Id": str(rng.choice(organization_ids))}
+        response = await timed("list", f"{API}/reports", params={"limit": 50}, headers=headers)
+        cursor = response.headers.get("x-next-cursor")
+        if cursor:
+            await timed("next-page", f"{API}/reports", params={"limit": 50, "cursor": cursor}, headers=headers)
+        await timed("stats", f"{API}/reports/stats", headers=headers)
+    return timings, errors
+
+
+async def run(args) -> list:
+    import httpx
+    from alembic import command
+
+    import seed
+    from app import migrate
+    from app.main import app
+    from app.models.base import engine, AsyncSessionLocal
+
+    await migrate.upgrade_schema()
+    if args.without_indexes:
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda c: command.downgrade(migrate.alembic_config(c), REVISION_WITHOUT_INDEXES))
+
+    rng = random.Random(args.seed)
+    results = []
+    print(f"{'tenants':>8} {'reports':>9} {'query':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        total, previous = 0, 0
+        for tenants in args.tenants:
+            async with AsyncSessionLocal() as db:
+                total += await grow(db, seed, previous, tenants, args.rows_per_tenant, rng)
+                previous = tenants
+                organization_ids = await seed.ensure_organizations(db, tenants)
+                if args.explain:
+                    await explain(db, organization_ids[0])
+            # Warm-up, so the first step doesn't pay for imports and cold caches
+            await time_requests(client, organization_ids, 5, rng)
+            timings, errors = await time_requests(client, organization_ids, args.requests, rng)
+            for name in QUERIES:
+                values = sorted(timings[name])
+                result = {
+                    "scenario": f"tenant-{name}", "tenants": tenants, "reports": total, "requests": len(values),
+                    "errors": errors, "without_indexes": args.without_indexes,
+                    **{f"p{q}_ms": round(percentile(values, q) * 1000, 2) for q in (50, 95, 99)},
+                }
+                results.append(result)
+                print(f"{tenants:>8} {total:>9,} {name:>10} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}"
+                      f" {result['p99_ms']:>8.2f}", flush=True)
+    await engine.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-organization latency as the number of organizations grows.")
+    parser.add_argument("--tenants", default="1,10,100,500", help="comma-separated organization counts, ascending")
+    parser.add_argument("--rows-per-tenant", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200, help="timed requests of each kind per step")
+    parser.add_argument("--db", default="bench-tenants.db", help="SQLite file, recreated on every run")
+    parser.add_argument("--without-indexes", action="store_true",
+                        help="downgrade to the schema before the organization indexes")
+    parser.add_argument("--explain", action="store_true", help="print the query plans at every step")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--results", help="append JSON lines with the results to this file")
+    args = parser.parse_args(argv)
+    args.tenants = sorted(int(n) for n in args.tenants.split(","))
+
+    for suffix in ("", "-wal", "-shm", "-writelock"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    # Read by the app's modules when they are imported in run()
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.abspath(args.db)}"
+    os.environ["DB_MIGRATE_ON_STARTUP"] = "0"
+    os.environ["STATS_CACHE_SECONDS"] = "0"
+
+    results = asyncio.run(run(args))
+    if args.results:
+        revision = git_revision()
+        with open(args.results, "a") as f:
+            for result in results:
+                f.write(json.dumps({"timestamp": time.time(), "revision": revision, **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
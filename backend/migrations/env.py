@@ -0,0 +1,62 @@
+"""Alembic environment; runs against the app's own engine (DATABASE_URL)."""
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.models import models  # noqa: F401  registers every table on Base.metadata
+from app.models.base import Base, engine
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # The full-text index (an FTS5 virtual table with its shadow tables on SQLite) is managed with raw DDL
+    return not (type_ == "table" and reflected and compare_to is None and name.startswith("report_search"))
+
+
+def _configure(**kwargs):
+    context.configure(
+        target_metadata=target_metadata,
+        include_object=include_object,
+        # SQLite can't ALTER most things; batch mode rebuilds the table instead
+        render_as_batch=engine.dialect.name == "sqlite",
+        **kwargs,
+    )
+
+
+def run_migrations_offline():
+    _configure(url=engine.url.render_as_string(hide_password=False), literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def _run(connection):
+    _configure(connection=connection)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def _run_async():
+    async with engine.connect() as connection:
+        await connection.run_sync(_run)
+    await engine.dispose()
+
+
+def run_migrations_online():
+    # app.migrate passes the connection it holds the migration lock on
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+    else:
+        asyncio.run(_run_async())
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,85 @@
+"""Initial schema: the four tables create_all built before any of the later services existed.
+
+Databases from before migrations existed are stamped with this revision
+(app.migrate); 0001a adds everything that came after.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 13:12:15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('organizations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_organizations_id', 'organizations', ['id'])
+    op.create_index('ix_organizations_name', 'organizations', ['name'], unique=True)
+
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('hashed_password', sa.String(), nullable=False),
+    sa.Column('role', sa.Enum('ADMIN', 'MANAGER', 'MEMBER', name='userrole'), nullable=True),
+    sa.Column('organization_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['organization_id'], ['organizations.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_id', 'users', ['id'])
+
+    op.create_table('hse_reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('image_path', sa.String(), nullable=False),
+    sa.Column('non_conformities', sa.JSON(), nullable=True),
+    sa.Column('user_observations', sa.String(), nullable=True),
+    sa.Column('corrective_actions', sa.JSON(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('organization_id', sa.Integer(), nullable=True),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['organization_id'], ['organizations.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_hse_reports_id', 'hse_reports', ['id'])
+
+    op.create_table('quality_reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('report_type', sa.Enum('EIGHT_D', 'FIVE_S', 'KAIZEN', 'FISHBONE', name='reporttype'), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('organization_id', sa.Integer(), nullable=True),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['organization_id'], ['organizations.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_quality_reports_id', 'quality_reports', ['id'])
+    op.create_index('ix_quality_reports_title', 'quality_reports', ['title'])
+
+
+def downgrade():
+    op.drop_table('quality_reports')
+    op.drop_table('hse_reports')
+    op.drop_table('users')
+    op.drop_table('organizations')
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        sa.Enum(name="reporttype").drop(bind, checkfirst=True)
+        sa.Enum(name="userrole").drop(bind, checkfirst=True)
@@ -0,0 +1,117 @@
+"""Tables the services added before migrations existed, where create_all has not built them yet.
+
+The response cache, dashboard stats, generation jobs, idempotency keys,
+root-cause entries, the search index and the keyset index on
+quality_reports. Until migrations existed, every worker ran create_all at
+startup, so a database may already have any of these, built by whichever
+version it last ran. Only the missing ones are created.
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-18 10:04:51
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001a'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    report_indexes = {index['name'] for index in inspector.get_indexes('quality_reports')}
+    if 'ix_quality_reports_created_at_id' not in report_indexes:
+        op.create_index('ix_quality_reports_created_at_id', 'quality_reports', ['created_at', 'id'])
+
+    if 'ai_response_cache' not in tables:
+        op.create_table('ai_response_cache',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('namespace', sa.String(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('expires_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+        )
+        op.create_index('ix_ai_response_cache_expires_at', 'ai_response_cache', ['expires_at'])
+        op.create_index('ix_ai_response_cache_namespace', 'ai_response_cache', ['namespace'])
+    if 'report_stats' not in tables:
+        op.create_table('report_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('report_type', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('organization_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'report_type', 'status', 'organization_id')
+        )
+    if 'generation_jobs' not in tables:
+        op.create_table('generation_jobs',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('stage', sa.String(), nullable=False),
+        sa.Column('progress', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.Float(), nullable=False),
+        sa.Column('locked_by', sa.String(), nullable=True),
+        sa.Column('locked_at', sa.Float(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('report_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['report_id'], ['quality_reports.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_generation_jobs_status_run_after', 'generation_jobs', ['status', 'run_after'])
+    if 'idempotency_keys' not in tables:
+        op.create_table('idempotency_keys',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('report_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['report_id'], ['quality_reports.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('key')
+        )
+    if 'root_cause_entries' not in tables:
+        op.create_table('root_cause_entries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('report_id', sa.Integer(), nullable=False),
+        sa.Column('organization_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('category', sa.String(), nullable=False),
+        sa.Column('cluster_key', sa.String(), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['report_id'], ['quality_reports.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_root_cause_entries_category_cluster', 'root_cause_entries', ['category', 'cluster_key', 'created_at', 'organization_id', 'report_id'])
+        op.create_index('ix_root_cause_entries_created_at', 'root_cause_entries', ['created_at'])
+        op.create_index('ix_root_cause_entries_report_id', 'root_cause_entries', ['report_id'])
+
+    # Full-text index over reports (app.services.search); not an ORM table, so it is written out here
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        op.execute(
+            "CREATE TABLE IF NOT EXISTS report_search ("
+            " report_id INTEGER PRIMARY KEY REFERENCES quality_reports(id) ON DELETE CASCADE,"
+            " document tsvector NOT NULL)"
+        )
+        op.execute("CREATE INDEX IF NOT EXISTS ix_report_search_document ON report_search USING GIN (document)")
+    elif bind.dialect.name == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS report_search USING fts5("
+            "title, problem, root_causes, fishbone, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS report_search")
+    op.drop_table('root_cause_entries')
+    op.drop_table('idempotency_keys')
+    op.drop_table('generation_jobs')
+    op.drop_table('report_stats')
+    op.drop_table('ai_response_cache')
+    op.drop_index('ix_quality_reports_created_at_id', table_name='quality_reports')
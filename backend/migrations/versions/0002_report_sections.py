@@ -0,0 +1,105 @@
+"""Split report storage: summary columns on quality_reports, sections in report_sections, report_archive.
+
+Existing reports are backfilled in SQL (json_each on both dialects), and the
+data column is dropped. Archiving old finalized reports is left to
+app.services.report_store, which the migrate command runs right after this.
+
+Revision ID: 0002
+Revises: 0001a
+Create Date: 2026-10-17 18:40:02
+"""
+import json
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('quality_reports', sa.Column('problem_description', sa.Text(), nullable=True))
+    op.create_index('ix_quality_reports_status', 'quality_reports', ['status'])
+    op.create_index('ix_quality_reports_report_type', 'quality_reports', ['report_type'])
+    op.create_index('ix_quality_reports_organization_id', 'quality_reports', ['organization_id'])
+
+    op.create_table('report_sections',
+    sa.Column('report_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('value', sa.JSON(), nullable=True),
+    sa.ForeignKeyConstraint(['report_id'], ['quality_reports.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('report_id', 'key')
+    )
+    op.create_table('report_archive',
+    sa.Column('report_id', sa.Integer(), nullable=False),
+    sa.Column('codec', sa.String(length=8), nullable=False),
+    sa.Column('payload', sa.LargeBinary(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['report_id'], ['quality_reports.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('report_id')
+    )
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("UPDATE quality_reports SET problem_description = data ->> 'problem_description'")
+        op.execute(
+            "INSERT INTO report_sections (report_id, key, value)"
+            " SELECT q.id, j.key, j.value FROM quality_reports q, json_each(q.data) j"
+            " WHERE json_typeof(q.data) = 'object' AND j.key <> 'problem_description'"
+        )
+    else:
+        op.execute("UPDATE quality_reports SET problem_description = data ->> '$.problem_description'")
+        # -> returns the JSON text of the value (json_each's value column unquotes strings)
+        op.execute(
+            "INSERT INTO report_sections (report_id, key, value)"
+            " SELECT q.id, j.key, q.data -> j.fullkey FROM quality_reports q, json_each(q.data) j"
+            " WHERE json_type(q.data) = 'object' AND j.key <> 'problem_description'"
+        )
+
+    with op.batch_alter_table('quality_reports') as batch_op:
+        batch_op.drop_column('data')
+
+
+def _decompress(codec, payload) -> str:
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    return zlib.decompress(payload).decode("utf-8")
+
+
+def downgrade():
+    bind = op.get_bind()
+    # Archived sections can't be unpacked in SQL; move them back to section rows first
+    sections = sa.table('report_sections', sa.column('report_id'), sa.column('key'), sa.column('value', sa.JSON))
+    for report_id, codec, payload in bind.execute(sa.text("SELECT report_id, codec, payload FROM report_archive")):
+        values = json.loads(_decompress(codec, payload))
+        if values:
+            bind.execute(sections.insert(), [{"report_id": report_id, "key": k, "value": v} for k, v in values.items()])
+
+    with op.batch_alter_table('quality_reports') as batch_op:
+        batch_op.add_column(sa.Column('data', sa.JSON(), nullable=True))
+
+    if bind.dialect.name == "postgresql":
+        op.execute(
+            "UPDATE quality_reports q SET data = (jsonb_build_object('problem_description', q.problem_description)"
+            " || COALESCE((SELECT jsonb_object_agg(s.key, s.value) FROM report_sections s"
+            " WHERE s.report_id = q.id), '{}'::jsonb))::json"
+        )
+    else:
+        op.execute(
+            "UPDATE quality_reports SET data = json_insert("
+            " COALESCE((SELECT json_group_object(s.key, json(s.value)) FROM report_sections s"
+            " WHERE s.report_id = quality_reports.id), '{}'),"
+            " '$.problem_description', problem_description)"
+        )
+
+    op.drop_table('report_archive')
+    op.drop_table('report_sections')
+    op.drop_index('ix_quality_reports_organization_id', table_name='quality_reports')
+    op.drop_index('ix_quality_reports_report_type', table_name='quality_reports')
+    op.drop_index('ix_quality_reports_status', table_name='quality_reports')
+    with op.batch_alter_table('quality_reports') as batch_op:
+        batch_op.alter_column('data', existing_type=sa.JSON(), nullable=False)
+        batch_op.drop_column('problem_description')
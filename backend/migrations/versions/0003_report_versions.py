@@ -0,0 +1,39 @@
+"""Optimistic concurrency for reports: quality_reports.version and the report_changes audit log.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 21:05:44
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('quality_reports') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    op.create_table('report_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('report_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('section', sa.String(), nullable=False),
+    sa.Column('category', sa.String(), nullable=True),
+    sa.Column('old_value', sa.JSON(), nullable=True),
+    sa.Column('new_value', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['report_id'], ['quality_reports.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_report_changes_report_id_version', 'report_changes', ['report_id', 'version'])
+
+
+def downgrade():
+    op.drop_index('ix_report_changes_report_id_version', table_name='report_changes')
+    op.drop_table('report_changes')
+    with op.batch_alter_table('quality_reports') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,54 @@
+"""Organization scoping: composite indexes that lead with organization_id, generation_jobs.organization_id.
+
+The single-column quality_reports.organization_id index is replaced by the
+composite ones, which cover the same lookups.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 23:12:37
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_quality_reports_organization_id', table_name='quality_reports')
+    op.create_index('ix_quality_reports_organization_created_at_id', 'quality_reports', ['organization_id', 'created_at', 'id'])
+    op.create_index('ix_quality_reports_organization_status_created_at', 'quality_reports', ['organization_id', 'status', 'created_at'])
+    op.create_index('ix_quality_reports_author_id', 'quality_reports', ['author_id'])
+
+    op.create_index('ix_hse_reports_organization_created_at_id', 'hse_reports', ['organization_id', 'created_at', 'id'])
+    op.create_index('ix_hse_reports_organization_status_created_at', 'hse_reports', ['organization_id', 'status', 'created_at'])
+    op.create_index('ix_hse_reports_author_id', 'hse_reports', ['author_id'])
+
+    op.create_index('ix_users_organization_id', 'users', ['organization_id'])
+    op.create_index('ix_report_stats_organization_id_day', 'report_stats', ['organization_id', 'day'])
+    op.create_index('ix_root_cause_entries_organization_category_cluster', 'root_cause_entries', ['organization_id', 'category', 'cluster_key', 'created_at', 'report_id'])
+
+    with op.batch_alter_table('generation_jobs') as batch_op:
+        batch_op.add_column(sa.Column('organization_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_generation_jobs_organization_id', 'organizations', ['organization_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('generation_jobs') as batch_op:
+        batch_op.drop_constraint('fk_generation_jobs_organization_id', type_='foreignkey')
+        batch_op.drop_column('organization_id')
+
+    op.drop_index('ix_root_cause_entries_organization_category_cluster', table_name='root_cause_entries')
+    op.drop_index('ix_report_stats_organization_id_day', table_name='report_stats')
+    op.drop_index('ix_users_organization_id', table_name='users')
+
+    op.drop_index('ix_hse_reports_author_id', table_name='hse_reports')
+    op.drop_index('ix_hse_reports_organization_status_created_at', table_name='hse_reports')
+    op.drop_index('ix_hse_reports_organization_created_at_id', table_name='hse_reports')
+
+    op.drop_index('ix_quality_reports_author_id', table_name='quality_reports')
+    op.drop_index('ix_quality_reports_organization_status_created_at', table_name='quality_reports')
+    op.drop_index('ix_quality_reports_organization_created_at_id', table_name='quality_reports')
+    op.create_index('ix_quality_reports_organization_id', 'quality_reports', ['organization_id'])
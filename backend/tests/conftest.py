@@ -0,0 +1,58 @@
+"""Tests run the app in-process against a SQLite database in a temporary directory.
+
+The app reads its settings from the environment when its modules are
+imported, so they are set here, before any test module imports app.*. The
+working directory moves to the same temporary directory, where uploads,
+rendered PDFs and the SQLite write lock end up.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DIR = tempfile.mkdtemp(prefix="kysai-tests-")
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(TEST_DIR, 'kysai.db')}",
+    "DB_MIGRATE_ON_STARTUP": "0",
+    # Mock generations and analyses instead of model calls
+    "GEMINI_API_KEY": "",
+    "PDF_CACHE_DIR": os.path.join(TEST_DIR, "pdf_cache"),
+    "PDF_WORKERS": "1",
+    "REPORT_ARCHIVE_AFTER_DAYS": "0",
+})
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(TEST_DIR)
+
+API = "http://test/api/v1"
+
+
+def run(coro):
+    """Runs coro on a fresh event loop and closes the engine's connections with it."""
+    from app.models.base import engine
+
+    async def main():
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(scope="session")
+def database():
+    from app import migrate
+
+    run(migrate.upgrade_schema())
+
+
+def client():
+    """httpx client for the app, without a server; use inside run()."""
+    import httpx
+    from app.main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=API)
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from conftest import run
+
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    """Streams from a stand-in for the REST backend; returns the list of streams it closed."""
+    from app.services import ai_client
+
+    closed = []
+
+    async def stream(model_name, prompt):
+        try:
+            for word in ("Root", "cause", "found"):
+                yield word, None
+                await asyncio.sleep(0)
+        finally:
+            closed.append(model_name)
+
+    monkeypatch.setattr(ai_client, "GEMINI_API_ENDPOINT", "http://fake-model")
+    monkeypatch.setattr(ai_client, "_rest_stream", stream)
+    monkeypatch.setattr(ai_client, "_semaphore", None)
+    return closed
+
+
+def test_stream_releases_its_slot_when_finished(fake_stream):
+    from app.services import ai_client
+
+    async def scenario():
+        return [text async for text in ai_client.stream_text("prompt", timeout=5)]
+
+    assert run(scenario()) == ["Root", "cause", "found"]
+    assert fake_stream == [ai_client.TEXT_MODEL_NAME]
+    assert ai_client._get_semaphore()._value == ai_client.AI_MAX_CONCURRENCY
+
+
+def test_stream_cancelled_before_the_first_chunk_is_handed_out(fake_stream, monkeypatch):
+    from app.services import ai_client, ai_guard
+
+    recording = None
+
+    async def slow_record(model, ok, throttled=False):
+        # The success is recorded after start() has opened the stream and taken a slot
+        if ok:
+            recording.set()
+            await asyncio.sleep(60)
+        return False
+
+    monkeypatch.setattr(ai_guard, "record", slow_record)
+
+    async def scenario():
+        nonlocal recording
+        recording = asyncio.Event()
+        # The client disconnects while the guard is still recording the start
+        first_chunk = asyncio.create_task(ai_client.stream_text("prompt", timeout=5).__anext__())
+        await recording.wait()
+        first_chunk.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first_chunk
+
+    run(scenario())
+    assert fake_stream == [ai_client.TEXT_MODEL_NAME]
+    assert ai_client._get_semaphore()._value == ai_client.AI_MAX_CONCURRENCY
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select, update
+
+from conftest import run
+
+PROBLEM = "Hairline cracks in weld seam 4 of the rear subframe after the cooling tunnel"
+
+
+@pytest.fixture
+def queue(database):
+    from app.models.base import AsyncSessionLocal
+    from app.models.jobs import GenerationJob, JobStatus
+    from app.services.jobs import JobQueue
+
+    # Jobs left over by earlier tests must not be claimed by this one
+    async def clear():
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(GenerationJob).where(GenerationJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]))
+                .values(status=JobStatus.FAILED)
+            )
+            await db.commit()
+
+    run(clear())
+    job_queue = JobQueue()
+    job_queue.worker_id = "test"
+    return job_queue
+
+
+def _request(text: str = PROBLEM):
+    from app.schemas.ai import EightDGenerationRequest
+
+    return EightDGenerationRequest(problem_description=text)
+
+
+def test_job_reports_its_stages(queue, monkeypatch):
+    from app.models.jobs import JobStatus
+
+    stages = []
+    update_job = queue._update
+
+    async def recording_update(job_id, **values):
+        stages.append((values.get("stage"), values.get("progress")))
+        await update_job(job_id, **values)
+
+    monkeypatch.setattr(queue, "_update", recording_update)
+
+    async def scenario():
+        job = await queue.enqueue(_request())
+        claimed = await queue._claim()
+        assert (claimed.id, claimed.stage, claimed.progress) == (job.id, "generating", 10)
+        await queue._run(claimed)
+        return await queue.get(job.id)
+
+    job = run(scenario())
+    assert stages == [("saving", 90), ("done", 100)]
+    assert job.status == JobStatus.SUCCEEDED and job.report_id is not None
+
+
+def test_stale_jobs_are_requeued_until_their_attempts_run_out(queue):
+    from app.models.base import AsyncSessionLocal
+    from app.models.jobs import GenerationJob, JobStatus
+
+    async def scenario():
+        exhausted = await queue.enqueue(_request())
+        retryable = await queue.enqueue(_request())
+        # Both were claimed by a worker that died an hour ago
+        async with AsyncSessionLocal() as db:
+            for job, attempts in ((exhausted, exhausted.max_attempts), (retryable, 1)):
+                await db.execute(
+                    update(GenerationJob).where(GenerationJob.id == job.id)
+                    .values(status=JobStatus.RUNNING, attempts=attempts, locked_by="lost", locked_at=1)
+                )
+            await db.commit()
+        claimed = await queue._claim()
+        return await queue.get(exhausted.id), retryable.id, claimed
+
+    exhausted, retryable_id, claimed = run(scenario())
+    assert (exhausted.status, exhausted.error) == (JobStatus.FAILED, "worker lost")
+    assert claimed.id == retryable_id
+    assert (claimed.status, claimed.attempts, claimed.locked_by) == (JobStatus.RUNNING, 2, "test")
+
+
+@pytest.mark.parametrize("same_worker", [True, False])
+def test_cancelled_attempt_does_not_save_a_second_report(queue, monkeypatch, same_worker):
+    from app.models.base import AsyncSessionLocal
+    from app.models.jobs import JobStatus
+    from app.models.models import QualityReport
+    from app.services import eight_d
+    from app.services.singleflight import SingleFlight
+
+    generate_sections = eight_d.generate_sections
+
+    async def slow_generate_sections(request, organization_id=None):
+        await asyncio.sleep(0.3)
+        return await generate_sections(request, organization_id)
+
+    monkeypatch.setattr(eight_d, "generate_sections", slow_generate_sections)
+    problem = f"{PROBLEM} ({'same' if same_worker else 'other'} worker)"
+
+    async def reports() -> int:
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(func.count()).select_from(QualityReport).where(QualityReport.problem_description == problem)
+            )).scalar()
+
+    async def scenario():
+        job = await queue.enqueue(_request(problem))
+        attempt = asyncio.create_task(queue._run(await queue._claim()))
+        await asyncio.sleep(0.1)
+        # Shutdown: the job is handed back while its shielded generation goes on
+        attempt.cancel()
+        await asyncio.gather(attempt, return_exceptions=True)
+        assert (await queue.get(job.id)).status == JobStatus.QUEUED
+        if not same_worker:
+            # Claimed by another worker process, which doesn't share the in-flight generation
+            monkeypatch.setattr(eight_d, "inflight", SingleFlight())
+        await queue._run(await queue._claim())
+        # Let the first attempt's generation finish too
+        await asyncio.sleep(0.5)
+        return await queue.get(job.id), await reports()
+
+    job, count = run(scenario())
+    assert job.status == JobStatus.SUCCEEDED
+    assert count == 1
+
+
+def test_retry_after_a_saved_report_reuses_it(queue):
+    from app.models.jobs import JobStatus
+
+    async def scenario():
+        job = await queue.enqueue(_request(f"{PROBLEM} (lost after saving)"))
+        claimed = await queue._claim()
+        await queue._run(claimed)
+        first = await queue.get(job.id)
+        # The worker died after the commit, before the job was marked done; the sweep requeues it
+        await queue._update(job.id, status=JobStatus.QUEUED, stage="queued", report_id=None)
+        await queue._run(await queue._claim())
+        return first, await queue.get(job.id)
+
+    first, second = run(scenario())
+    assert second.status == JobStatus.SUCCEEDED
+    assert second.report_id == first.report_id
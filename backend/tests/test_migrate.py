@@ -0,0 +1,116 @@
+"""python -m app.migrate on databases from before migrations existed.
+
+Run from backend/: python -m pytest tests
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The schema create_all built before any of the later services existed (the shipped kysai.db)
+BASELINE_SCHEMA = """
+CREATE TABLE organizations (
+    id INTEGER NOT NULL, name VARCHAR NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_organizations_name ON organizations (name);
+CREATE INDEX ix_organizations_id ON organizations (id);
+CREATE TABLE users (
+    id INTEGER NOT NULL, email VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL, role VARCHAR(7),
+    organization_id INTEGER, created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id), FOREIGN KEY(organization_id) REFERENCES organizations (id)
+);
+CREATE INDEX ix_users_id ON users (id);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE TABLE quality_reports (
+    id INTEGER NOT NULL, title VARCHAR NOT NULL, report_type VARCHAR(8) NOT NULL, status VARCHAR,
+    data JSON NOT NULL, organization_id INTEGER, author_id INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(organization_id) REFERENCES organizations (id),
+    FOREIGN KEY(author_id) REFERENCES users (id)
+);
+CREATE INDEX ix_quality_reports_id ON quality_reports (id);
+CREATE INDEX ix_quality_reports_title ON quality_reports (title);
+CREATE TABLE hse_reports (
+    id INTEGER NOT NULL, image_path VARCHAR NOT NULL, non_conformities JSON, user_observations VARCHAR,
+    corrective_actions JSON, status VARCHAR, organization_id INTEGER, author_id INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(organization_id) REFERENCES organizations (id),
+    FOREIGN KEY(author_id) REFERENCES users (id)
+);
+CREATE INDEX ix_hse_reports_id ON hse_reports (id);
+"""
+
+REPORT_DATA = {
+    "problem_description": "Cracked housing on line 3",
+    "d4_root_causes": ["Mold temperature too low"],
+    "d4_fishbone": {"Machine": ["Heater drift"]},
+}
+
+
+def _baseline_db(path, extra_sql: str = ""):
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA + extra_sql)
+        conn.execute(
+            "INSERT INTO quality_reports (title, report_type, status, data) VALUES (?, 'EIGHT_D', 'Draft', ?)",
+            ("Housing crack", json.dumps(REPORT_DATA)),
+        )
+    conn.close()
+
+
+def _migrate(path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{path}", DB_MIGRATE_ON_STARTUP="0",
+               PYTHONPATH=BACKEND_DIR)
+    result = subprocess.run([sys.executable, "-m", "app.migrate"], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def _head_revision() -> str:
+    return ScriptDirectory.from_config(Config(os.path.join(BACKEND_DIR, "alembic.ini"))).get_current_head()
+
+
+def _assert_migrated(path):
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT version_num FROM alembic_version").fetchall() == [(_head_revision(),)]
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {"report_stats", "generation_jobs", "idempotency_keys", "root_cause_entries", "report_search",
+                "report_sections", "report_changes", "ai_response_cache"} <= tables
+        problem, version = conn.execute("SELECT problem_description, version FROM quality_reports").fetchone()
+        assert problem == REPORT_DATA["problem_description"]
+        assert version == 1
+        assert conn.execute("SELECT count(*) FROM report_search WHERE report_search MATCH 'mold'").fetchone() == (1,)
+    conn.close()
+
+
+def test_baseline_database_migrates_to_head(tmp_path):
+    path = str(tmp_path / "baseline.db")
+    _baseline_db(path)
+    _migrate(path)
+    _assert_migrated(path)
+    # A second run finds nothing to do
+    _migrate(path)
+    _assert_migrated(path)
+
+
+def test_database_with_some_service_tables_migrates_to_head(tmp_path):
+    # A worker of a later version ran create_all on it, which added the tables it knew about
+    path = str(tmp_path / "partial.db")
+    _baseline_db(path, """
+        CREATE TABLE ai_response_cache (
+            key VARCHAR(64) NOT NULL, namespace VARCHAR NOT NULL, payload JSON NOT NULL, expires_at FLOAT NOT NULL,
+            PRIMARY KEY (key)
+        );
+        CREATE INDEX ix_ai_response_cache_expires_at ON ai_response_cache (expires_at);
+        CREATE INDEX ix_ai_response_cache_namespace ON ai_response_cache (namespace);
+        CREATE VIRTUAL TABLE report_search USING fts5(
+            title, problem, root_causes, fishbone, tokenize = 'unicode61 remove_diacritics 2');
+    """)
+    _migrate(path)
+    _assert_migrated(path)
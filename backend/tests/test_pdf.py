@@ -0,0 +1,56 @@
+import os
+
+from conftest import client, run
+
+
+def _cached_files(kind: str) -> set:
+    from app.services import pdf
+
+    directory = os.path.join(pdf.PDF_CACHE_DIR, kind)
+    return set(os.listdir(directory)) if os.path.isdir(directory) else set()
+
+
+def test_both_languages_stay_cached_until_the_report_changes(database):
+    async def scenario():
+        async with client() as http:
+            report = (await http.post("/generate-8d", json={
+                "problem_description": "Paint blisters on the left door panel after the oven stage",
+            })).json()
+            report_id = report["report_id"]
+            for lang in ("en", "tr", "en"):
+                response = await http.get(f"/reports/{report_id}/pdf", params={"lang": lang})
+                assert response.status_code == 200
+                assert response.content.startswith(b"%PDF")
+            first = {name for name in _cached_files("8d") if name.startswith(f"{report_id}-")}
+            assert sorted(name.rsplit("-", 1)[1] for name in first) == ["en.pdf", "tr.pdf"]
+
+            report_version = (await http.get(f"/reports/{report_id}")).json()["version"]
+            response = await http.patch(f"/reports/{report_id}", json={
+                "version": report_version, "d2_problem": "Blisters on every door painted after 06:00",
+            })
+            assert response.status_code == 200
+            assert (await http.get(f"/reports/{report_id}/pdf", params={"lang": "en"})).status_code == 200
+            second = {name for name in _cached_files("8d") if name.startswith(f"{report_id}-")}
+            # The new English file replaced the old one; the Turkish one waits for its own re-render
+            old_en, = (name for name in first if name.endswith("-en.pdf"))
+            old_tr, = (name for name in first if name.endswith("-tr.pdf"))
+            assert old_en not in second and old_tr in second
+            assert len(second) == 2
+
+    from app.services import pdf
+    try:
+        run(scenario())
+    finally:
+        pdf.shutdown()
+
+
+def test_storing_an_older_version_keeps_the_newer_one(tmp_path, monkeypatch):
+    from app.services import pdf
+
+    monkeypatch.setattr(pdf, "PDF_CACHE_DIR", str(tmp_path))
+    newer = pdf.cache_path("8d", 7, "20261017120000v10", "en")
+    older = pdf.cache_path("8d", 7, "20261017120000v9", "en")
+    pdf._store(newer, b"%PDF new")
+    # A render that read the row before the last edit finishes late
+    pdf._store(older, b"%PDF old")
+    assert os.path.exists(newer)
@@ -0,0 +1,26 @@
+from conftest import client, run
+
+
+def test_second_patch_with_the_same_version_conflicts(database):
+    async def scenario():
+        async with client() as http:
+            report_id = (await http.post("/generate-8d", json={
+                "problem_description": "Label printer skips the lot number on every tenth carton",
+            })).json()["report_id"]
+            version = (await http.get(f"/reports/{report_id}")).json()["version"]
+
+            first = await http.patch(f"/reports/{report_id}", json={
+                "version": version, "d3_interim_actions": ["Check every carton label by hand"],
+            })
+            # A second editor still holds the version they loaded
+            second = await http.patch(f"/reports/{report_id}", json={
+                "version": version, "d3_interim_actions": ["Stop the printer"],
+            })
+            return first, second, (await http.get(f"/reports/{report_id}")).json()
+
+    first, second, report = run(scenario())
+    assert first.status_code == 200
+    assert second.status_code == 409
+    assert second.headers["X-Report-Version"] == str(first.json()["version"])
+    assert report["version"] == first.json()["version"]
+    assert report["d3_interim_actions"] == ["Check every carton label by hand"]
@@ -0,0 +1,44 @@
+from sqlalchemy import text
+
+from conftest import client, run
+
+
+def test_archived_report_reads_and_edits_like_a_hot_one(database):
+    from app.models.base import AsyncSessionLocal
+    from app.services import report_store
+
+    async def scenario():
+        async with client() as http:
+            report_id = (await http.post("/generate-8d", json={
+                "problem_description": "Torque wrench readings drift on station 12 during night shift",
+            })).json()["report_id"]
+            response = await http.put(f"/reports/{report_id}/finalize", json={"technical_notes": "Calibrated"})
+            assert response.status_code == 200
+            before = (await http.get(f"/reports/{report_id}")).json()
+
+            async with AsyncSessionLocal() as db:
+                await db.execute(text("UPDATE quality_reports SET updated_at = '2020-01-01 00:00:00' WHERE id = :id"),
+                                 {"id": report_id})
+                await db.commit()
+                assert await report_store.archive_due(db, older_than_days=30) >= 1
+                hot = (await db.execute(text("SELECT count(*) FROM report_sections WHERE report_id = :id"),
+                                        {"id": report_id})).scalar()
+                assert hot == 0
+
+            # The detail cache still holds the report; drop it so the archive is read
+            from app.services import report_cache
+            report_cache.invalidate(report_id)
+            after = (await http.get(f"/reports/{report_id}")).json()
+            assert {k: v for k, v in after.items() if k != "version"} == \
+                   {k: v for k, v in before.items() if k != "version"}
+
+            response = await http.patch(f"/reports/{report_id}", json={
+                "version": after["version"], "d7_prevention": ["Weekly wrench calibration"],
+            })
+            assert response.status_code == 200
+            async with AsyncSessionLocal() as db:
+                data = await report_store.load(db, report_id)
+            assert data["d7_prevention"] == ["Weekly wrench calibration"]
+            assert data["technical_notes"] == "Calibrated"
+
+    run(scenario())
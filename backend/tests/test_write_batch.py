@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from conftest import run
+
+PROBLEM = "Burrs on the bore of housing 3301 after the new drill bits"
+
+
+@pytest.fixture
+def batched(database, monkeypatch):
+    """Batches writes that arrive within 50 ms; returns the (size, isolated) of every transaction run."""
+    from app.services import eight_d, write_batch
+
+    transactions = []
+    run_in_transaction = write_batch._run_in_transaction
+
+    async def recording_run_in_transaction(batch, isolated):
+        transactions.append((len(batch), isolated))
+        return await run_in_transaction(batch, isolated)
+
+    monkeypatch.setattr(write_batch, "_run_in_transaction", recording_run_in_transaction)
+    monkeypatch.setattr(eight_d, "writes", write_batch.WriteBatcher(0.05, 64))
+    return transactions
+
+
+def _save(problem: str, idempotency_key: str = None):
+    from app.schemas.ai import EightDGenerationRequest
+    from app.services import eight_d
+
+    request = EightDGenerationRequest(problem_description=problem)
+    report_data = eight_d.build_report_data(problem, eight_d.mock_sections(problem))
+    return eight_d.save_report(request, report_data, idempotency_key)
+
+
+async def _reports(problem: str) -> int:
+    from app.models.base import AsyncSessionLocal
+    from app.models.models import QualityReport
+
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(func.count()).select_from(QualityReport).where(QualityReport.problem_description == problem)
+        )).scalar()
+
+
+def test_failing_write_is_rolled_back_alone(batched, monkeypatch):
+    from app.services import eight_d, similarity
+
+    indexed = []
+    monkeypatch.setattr(similarity.index, "on_report_saved",
+                        lambda report_id, report_data, organization_id=None: indexed.append(report_id))
+
+    async def scenario():
+        stored = await _save(f"{PROBLEM} (first)", idempotency_key="burrs")
+        batched.clear()
+        indexed.clear()
+        results = await asyncio.gather(
+            _save(f"{PROBLEM} (before)"),
+            # The key is reused with a different request
+            _save(f"{PROBLEM} (conflict)", idempotency_key="burrs"),
+            _save(f"{PROBLEM} (after)"),
+            return_exceptions=True,
+        )
+        counts = [await _reports(f"{PROBLEM} ({name})") for name in ("before", "conflict", "after")]
+        return stored, results, counts
+
+    stored, (before, conflict, after), counts = run(scenario())
+    assert isinstance(conflict, eight_d.IdempotencyConflict)
+    assert before.report_id != after.report_id and stored.report_id not in (before.report_id, after.report_id)
+    assert counts == [1, 0, 1]
+    # One batch, run again with savepoints once the conflict rolled it back
+    assert batched == [(3, False), (3, True)]
+    # Only the writes that committed reach the similarity index
+    assert indexed == [before.report_id, after.report_id]
+
+
+def test_batch_without_failures_commits_once(batched):
+    async def scenario():
+        return await asyncio.gather(*(_save(f"{PROBLEM} (batch {i})") for i in range(4)))
+
+    responses = run(scenario())
+    assert len({response.report_id for response in responses}) == 4
+    assert batched == [(4, False)]
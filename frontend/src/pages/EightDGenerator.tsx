@@ -1,11 +1,26 @@
 import React, { useState, useRef } from 'react';
-import { generate8DSuggestions, finalizeReport, EightDResponse } from '../services/api';
+import { generate8DStream, finalizeReport, EightDResponse } from '../services/api';
 import { Sparkles, AlertCircle, CheckCircle2, Save, FileDown, FileText, ArrowRight } from 'lucide-react';
 import { FishboneDiagram } from '../components/FishboneDiagram';
 import html2canvas from 'html2canvas';
 import { PdfService } from '../services/PdfService';
 import { useLanguage } from '../context/LanguageContext';
 
+const EMPTY_RESULT: EightDResponse = {
+    report_id: 0,
+    d1_team: [],
+    d2_problem: '',
+    d3_interim_actions: [],
+    d4_root_causes: [],
+    d4_occurrence_causes: [],
+    d4_escape_causes: [],
+    d4_fishbone: {},
+    d5_chosen_pca: [],
+    d6_implemented_pca: [],
+    d7_prevention: [],
+    d8_recognition: [],
+};
+
 export const EightDGenerator = () => {
     // State
     const [description, setDescription] = useState('');
@@ -87,8 +102,12 @@ export const EightDGenerator = () => {
         setLoading(true);
         setError('');
         setIsFinalized(false);
+        setResult(null);
         try {
-            const data = await generate8DSuggestions(description, language);
+            // Render sections as they stream in; report_id stays 0 until the report is saved
+            const data = await generate8DStream(description, language, (key, value) => {
+                setResult(prev => ({ ...(prev || EMPTY_RESULT), [key]: value }));
+            });
             setResult(data);
         } catch (err) {
             console.error(err);
@@ -147,7 +166,7 @@ export const EightDGenerator = () => {
                             {pt.exportPdf}
                         </button>
                     )}
-                    {result && !isFinalized && (
+                    {result && !isFinalized && result.report_id > 0 && (
                         <div className="flex items-center gap-2 text-emerald-700 bg-emerald-50 px-4 py-2 rounded-lg border border-emerald-200 animate-in fade-in shadow-sm">
                             <CheckCircle2 className="w-5 h-5" />
                             <span className="font-medium">{pt.draftSaved} <span className="text-sm opacity-75">#{result.report_id}</span></span>
@@ -203,7 +222,7 @@ export const EightDGenerator = () => {
                 </div>
 
                 <div className="lg:col-span-7 space-y-6">
-                    {loading ? (
+                    {loading && !result ? (
                         <div className="bg-white p-8 rounded-xl border border-slate-200 shadow-sm animate-pulse space-y-6">
                             <div className="h-8 bg-slate-100 rounded w-1/3"></div>
                             <div className="space-y-4">
@@ -334,7 +353,7 @@ export const EightDGenerator = () => {
                                         onChange={(e) => setNotes(e.target.value)}
                                     />
                                     <div className="flex justify-end">
-                                        <button onClick={handleFinalize} disabled={finalizing} className="flex items-center gap-2 bg-slate-900 text-white px-8 py-3 rounded-lg hover:bg-slate-800 transition-all disabled:opacity-50 shadow-md font-medium">
+                                        <button onClick={handleFinalize} disabled={finalizing || loading} className="flex items-center gap-2 bg-slate-900 text-white px-8 py-3 rounded-lg hover:bg-slate-800 transition-all disabled:opacity-50 shadow-md font-medium">
                                             <Save className="w-5 h-5" />
                                             {finalizing ? pt.saving : pt.finalize}
                                         </button>
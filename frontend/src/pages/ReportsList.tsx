@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { getReports, getReport, ReportSummary } from '../services/api';
+import { getReportsPage, getReport, ReportSummary } from '../services/api';
 import { PdfService } from '../services/PdfService';
 import { Search, FileText, CheckCircle2, Clock, Download } from 'lucide-react';
 
@@ -7,6 +7,8 @@ export const ReportsList = () => {
     const [reports, setReports] = useState<ReportSummary[]>([]);
     const [search, setSearch] = useState('');
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         loadReports();
@@ -15,8 +17,9 @@ export const ReportsList = () => {
     const loadReports = async (searchTerm?: string) => {
         setLoading(true);
         try {
-            const data = await getReports(searchTerm);
-            setReports(data);
+            const page = await getReportsPage(searchTerm);
+            setReports(page.reports);
+            setNextCursor(page.nextCursor);
         } catch (e) {
             console.error(e);
         } finally {
@@ -24,6 +27,20 @@ export const ReportsList = () => {
         }
     };
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const page = await getReportsPage(search, nextCursor);
+            setReports(prev => [...prev, ...page.reports]);
+            setNextCursor(page.nextCursor);
+        } catch (e) {
+            console.error(e);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleSearch = (e: React.FormEvent) => {
         e.preventDefault();
         loadReports(search);
@@ -114,6 +131,18 @@ export const ReportsList = () => {
                     </tbody>
                 </table>
             </div>
+
+            {nextCursor && !loading && (
+                <div className="flex justify-center">
+                    <button
+                        onClick={loadMore}
+                        disabled={loadingMore}
+                        className="px-6 py-2 rounded-lg border border-slate-200 bg-white text-slate-700 hover:bg-slate-50 font-medium text-sm disabled:opacity-50"
+                    >
+                        {loadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                </div>
+            )}
         </div>
     );
 };
@@ -40,6 +40,63 @@ export const generate8DSuggestions = async (description: string, language: 'en'
     return response.json();
 };
 
+export type EightDSectionKey = Exclude<keyof EightDResponse, 'report_id' | 'problem_description'>;
+
+// Streams /generate-8d/stream (Server-Sent Events over POST, so EventSource can't be used).
+// onSection fires as each D1-D8 section completes; resolves with the saved report.
+export const generate8DStream = async (
+    description: string,
+    language: 'en' | 'tr' = 'en',
+    onSection: (key: EightDSectionKey, value: any) => void,
+): Promise<EightDResponse> => {
+    const response = await fetch(`${API_URL}/generate-8d/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ problem_description: description, language }),
+    });
+
+    if (!response.ok || !response.body) {
+        throw new Error('Failed to generate suggestions');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (!data) continue;
+            const payload = JSON.parse(data);
+
+            if (event === 'section') {
+                onSection(payload.key, payload.value);
+            } else if (event === 'done') {
+                return payload as EightDResponse;
+            } else if (event === 'error') {
+                throw new Error(payload.detail || 'Failed to generate suggestions');
+            }
+        }
+    }
+
+    throw new Error('Stream ended before the report was saved');
+};
+
 export const finalizeReport = async (reportId: number, notes: string) => {
     const response = await fetch(`${API_URL}/reports/${reportId}/finalize`, {
         method: 'PUT',
@@ -67,6 +124,28 @@ export const getReports = async (search?: string): Promise<ReportSummary[]> => {
     return response.json();
 }
 
+export interface ReportsPage {
+    reports: ReportSummary[];
+    nextCursor: string | null;
+}
+
+// Keyset-paginated listing: pass nextCursor back to fetch the following page
+export const getReportsPage = async (search?: string, cursor?: string | null): Promise<ReportsPage> => {
+    const params = new URLSearchParams();
+    if (search) params.set('search', search);
+    if (cursor) params.set('cursor', cursor);
+    const query = params.toString();
+
+    const response = await fetch(`${API_URL}/reports${query ? `?${query}` : ''}`);
+    if (!response.ok) {
+        throw new Error('Failed to fetch reports');
+    }
+    return {
+        reports: await response.json(),
+        nextCursor: response.headers.get('X-Next-Cursor'),
+    };
+};
+
 export const getReport = async (id: number): Promise<EightDResponse> => {
     const response = await fetch(`${API_URL}/reports/${id}`);
     if (!response.ok) {
@@ -90,6 +169,7 @@ export interface HSEAnalysisResponse {
     non_conformities: string[];
     corrective_actions: string[];
     image_path: string;
+    thumbnail_path?: string;
 }
 
 export interface HSEReportData {
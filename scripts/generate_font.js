@@ -4,6 +4,8 @@ const path = require('path');
 
 const fontUrl = 'https://cdnjs.cloudflare.com/ajax/libs/pdfmake/0.1.66/fonts/Roboto/Roboto-Regular.ttf';
 const outputPath = path.join(__dirname, '../frontend/src/services/fonts.ts');
+// Same font for the backend's PDF renderer (app/services/pdf.py)
+const backendFontPath = path.join(__dirname, '../backend/app/assets/fonts/Roboto-Regular.ttf');
 
 console.log(`Downloading font from ${fontUrl}...`);
 
@@ -45,5 +47,14 @@ function processResponse(res) {
                 console.log(`Base64 length: ${base64.length}`);
             }
         });
+
+        fs.mkdirSync(path.dirname(backendFontPath), { recursive: true });
+        fs.writeFile(backendFontPath, buffer, (err) => {
+            if (err) {
+                console.error(`Error writing file: ${err}`);
+            } else {
+                console.log(`Successfully wrote font file to ${backendFontPath}`);
+            }
+        });
     });
 }